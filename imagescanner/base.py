@@ -1,15 +1,18 @@
+import asyncio
 import aiohttp
 from typing import Any
 from expiringdict import ExpiringDict
 from redbot.core import commands
 from redbot.core.bot import Red, Config
 
-from imagescanner.metadata import Metadata
-from imagescanner.constants import HEADERS
+from redbot.core.data_manager import cog_data_path
 
-ImageCacheData = dict[int, bytes]
-ImageCacheMetadata = dict[int, Metadata]
-ImageCache = dict[int, tuple[ImageCacheMetadata, ImageCacheData]]
+from imagescanner.cache import ImageCache
+from imagescanner.index import ImageIndex
+from imagescanner.utils import CachedMessage, EmbedPayload
+from imagescanner.workers import MetadataWorkers
+from imagescanner.scheduler import ScanScheduler
+from imagescanner.constants import HEADERS
 
 
 class ImageScannerBase(commands.Cog):
@@ -29,8 +32,19 @@ class ImageScannerBase(commands.Cog):
         self.model_not_found_cache_civitai: dict[str, bool] = ExpiringDict(max_len=100, max_age_seconds=24*60*60)
         self.model_not_found_cache_arcenciel: dict[str, bool] = ExpiringDict(max_len=100, max_age_seconds=24*60*60)
         self.image_cache: ImageCache | None = None
-        self.image_cache_size = 100
+        self.image_cache_mb = 256
+        self.image_cache_disk_mb = 0
+        self.image_cache_metadata_only = False
+        self.metadata_workers = MetadataWorkers()
+        self.scan_scheduler = ScanScheduler()
+        self.image_index = ImageIndex(cog_data_path(self))
+        self.bulk_scans: dict[int, asyncio.Task] = {}
+        self.message_cache: dict[int, CachedMessage] = ExpiringDict(max_len=1000, max_age_seconds=24*60*60)
+        self.embed_cache: dict[int, list[EmbedPayload]] = ExpiringDict(max_len=200, max_age_seconds=60*60)
+        self.scans_in_flight: dict[int, asyncio.Future] = {}
+        self.embeds_in_flight: dict[int, asyncio.Future] = {}
         self.always_scan_generated_images = False
+        self.index_scanned_images = False
         self.session = aiohttp.ClientSession(headers=HEADERS)
         defaults = {
             "channels": [],
@@ -42,7 +56,21 @@ class ImageScannerBase(commands.Cog):
             "arcenciel_emoji": self.arcenciel_emoji,
             "model_cache_v2": {},
             "model_cache_arcenciel": {},
-            "image_cache_size": self.image_cache_size,
-            "always_scan_generated_images": self.always_scan_generated_images
+            "image_cache_mb": self.image_cache_mb,
+            "image_cache_disk_mb": self.image_cache_disk_mb,
+            "image_cache_metadata_only": self.image_cache_metadata_only,
+            "metadata_workers": self.metadata_workers.workers,
+            "metadata_timeout": self.metadata_workers.timeout,
+            "scan_concurrency": self.scan_scheduler.max_running,
+            "scan_concurrency_guild": self.scan_scheduler.max_running_per_guild,
+            "scan_inflight_mb": self.scan_scheduler.max_bytes // 1024**2,
+            "always_scan_generated_images": self.always_scan_generated_images,
+            "index_scanned_images": self.index_scanned_images,
         }
         self.config.register_global(**defaults)
+
+    def build_image_cache(self) -> ImageCache:
+        return ImageCache(self.image_cache_mb * 1024**2,
+                          spill_path=cog_data_path(self).joinpath("image_cache"),
+                          max_disk_bytes=self.image_cache_disk_mb * 1024**2,
+                          metadata_only=self.image_cache_metadata_only)
@@ -0,0 +1,321 @@
+"""
+Offline benchmark for imagescanner metadata parsing. No Discord connection is needed.
+
+Generates a reproducible corpus of images carrying A1111/Forge, StableSwarm and ComfyUI metadata,
+then reports parse latency percentiles and peak allocations per format for read_metadata and the
+individual parsers. A pathological set grows adversarial parameter strings until they get too slow,
+to expose super-linear behavior in the webui parameter parsing.
+test_metadata.py checks that the webui parameter tokenizer still matches the regexes it replaced.
+
+Usage: python -m imagescanner.benchmark [--iterations 50] [--seed 1] [--json results.json]
+"""
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import PIL.Image
+import PIL.PngImagePlugin
+from io import BytesIO
+from typing import Any, Callable
+from dataclasses import dataclass
+
+from imagescanner.utils import read_metadata
+from imagescanner.comfy import ComfyMetadataReader
+from imagescanner.metadata import WebuiMetadata
+
+TAGS = [
+    "1girl", "solo", "looking at viewer", "smile", "long hair", "blue eyes", "outdoors", "sky", "cloud",
+    "masterpiece", "best quality", "highly detailed", "depth of field", "cinematic lighting", "city",
+    "night", "neon lights", "rain", "reflection", "from above", "portrait", "upper body", "hat", "flower",
+]
+NEGATIVE_TAGS = ["worst quality", "low quality", "bad anatomy", "bad hands", "jpeg artifacts", "watermark", "lowres"]
+SAMPLERS = ["Euler a", "DPM++ 2M Karras", "DPM++ SDE", "UniPC", "DDIM"]
+FILLER_NODES = ["Reroute", "ImageScale", "LatentUpscale", "PreviewImage", "Note", "PrimitiveNode", "ConditioningCombine"]
+COMFY_SIZES = {"small": 20, "large": 300, "huge": 3000}
+
+
+@dataclass
+class BenchCase:
+    name: str
+    group: str
+    image: bytes
+    raw: str | None = None
+    info: dict[str, Any] | None = None
+
+
+def random_hash(rng: random.Random, length: int = 10) -> str:
+    return "".join(rng.choice("0123456789abcdef") for _ in range(length))
+
+def random_prompt(rng: random.Random, tags: list[str], count: int) -> str:
+    parts = []
+    for _ in range(count):
+        tag = rng.choice(tags)
+        if rng.random() < 0.2:
+            tag = f"({tag}:{rng.uniform(0.5, 1.5):.2f})"
+        elif rng.random() < 0.05:
+            tag = f"<lora:style_{random_hash(rng, 4)}:{rng.uniform(0.3, 1.0):.1f}>"
+        parts.append(tag)
+    return ", ".join(parts)
+
+def a1111_parameters(rng: random.Random, prompt_tags: int, quoted_fields: int) -> str:
+    prompt = random_prompt(rng, TAGS, prompt_tags)
+    negative = random_prompt(rng, NEGATIVE_TAGS, max(1, prompt_tags // 4))
+    params = [
+        f"Steps: {rng.randint(20, 50)}",
+        f"Sampler: {rng.choice(SAMPLERS)}",
+        f"CFG scale: {rng.uniform(3, 9):.1f}",
+        f"Seed: {rng.randint(0, 2**32)}",
+        "Size: 832x1216",
+        f"Model hash: {random_hash(rng)}",
+        "Model: someModel_v10",
+        f"Denoising strength: {rng.uniform(0.2, 0.7):.2f}",
+    ]
+    loras = ", ".join(f"style_{i}: {random_hash(rng, 12)}" for i in range(rng.randint(1, 6)))
+    params.append(f'Lora hashes: "{loras}"')
+    for i in range(quoted_fields):
+        quoted = random_prompt(rng, TAGS, rng.randint(2, 12))
+        params.append(f'ADetailer prompt {i}: "{quoted}"')
+        params.append(f"Extra field {i}: {rng.randint(0, 100)}")
+    params.append('Hashes: {"model": "' + random_hash(rng) + '", "vae": "' + random_hash(rng) + '"}')
+    params.append("Version: f2.0.1")
+    return f"{prompt}\nNegative prompt: {negative}\n" + ", ".join(params)
+
+def swarm_parameters(rng: random.Random, prompt_tags: int) -> str:
+    data = {
+        "sui_image_params": {
+            "prompt": random_prompt(rng, TAGS, prompt_tags),
+            "negativeprompt": random_prompt(rng, NEGATIVE_TAGS, 8),
+            "model": "someModel_v10",
+            "seed": rng.randint(0, 2**32),
+            "steps": rng.randint(20, 50),
+            "cfgscale": round(rng.uniform(3, 9), 1),
+            "sampler": "euler_ancestral",
+            "scheduler": "karras",
+            "width": 832,
+            "height": 1216,
+            "loras": [f"style_{i}" for i in range(3)],
+        },
+        "sui_models": [
+            {"name": "someModel_v10.safetensors", "param": "model", "hash": "0x" + random_hash(rng, 64)},
+            {"name": "style_0.safetensors", "param": "loras", "hash": "0x" + random_hash(rng, 64)},
+        ],
+        "sui_extra_data": {"date": "2025-01-01", "swarm_version": "0.9.5"},
+    }
+    return json.dumps(data)
+
+def comfy_api_workflow(rng: random.Random, nodes: int) -> dict[str, Any]:
+    flow: dict[str, Any] = {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "someModel_v10.safetensors"}},
+        "2": {"class_type": "CLIPTextEncode", "inputs": {"text": random_prompt(rng, TAGS, 60), "clip": ["1", 1]}},
+        "3": {"class_type": "CLIPTextEncode", "inputs": {"text": random_prompt(rng, NEGATIVE_TAGS, 12), "clip": ["1", 1]}},
+        "4": {"class_type": "KSampler", "inputs": {
+            "seed": rng.randint(0, 2**32), "steps": 30, "cfg": 6.5, "sampler_name": "euler", "scheduler": "karras",
+            "denoise": 1.0, "model": ["5", 0], "positive": ["2", 0], "negative": ["3", 0], "latent_image": ["6", 0],
+        }},
+        "5": {"class_type": "LoraLoader", "inputs": {
+            "lora_name": "style_0.safetensors", "strength_model": 0.8, "strength_clip": 0.8, "model": ["1", 0],
+        }},
+        "6": {"class_type": "EmptyLatentImage", "inputs": {"width": 832, "height": 1216, "batch_size": 1}},
+    }
+    for i in range(len(flow) + 1, nodes + 1):
+        node_type = rng.choice(FILLER_NODES)
+        flow[str(i)] = {"class_type": node_type, "inputs": {
+            "value": rng.randint(0, 1000), "text": random_prompt(rng, TAGS, 3), "source": [str(rng.randint(1, i - 1)), 0],
+        }}
+    return flow
+
+def comfy_ui_workflow(rng: random.Random, nodes: int) -> dict[str, Any]:
+    api = comfy_api_workflow(rng, nodes)
+    ui_nodes = []
+    for node_id, node in api.items():
+        inputs = node["inputs"]
+        widgets = [value for value in inputs.values() if not isinstance(value, list)]
+        ui_nodes.append({
+            "id": int(node_id),
+            "type": node["class_type"],
+            "pos": [rng.randint(0, 4000), rng.randint(0, 4000)],
+            "size": [315, 98],
+            "inputs": [{"name": key, "link": rng.randint(1, 10**4)} for key, value in inputs.items() if isinstance(value, list)],
+            "widgets_values": widgets,
+        })
+    links = [[i, rng.randint(1, nodes), 0, rng.randint(1, nodes), 0, "MODEL"] for i in range(nodes)]
+    return {"last_node_id": nodes, "nodes": ui_nodes, "links": links, "version": 0.4}
+
+def encode_image(fmt: str, text: dict[str, str] | None = None, exif_comment: str | None = None) -> bytes:
+    img = PIL.Image.new("RGB", (64, 64), (120, 80, 200))
+    out = BytesIO()
+    if fmt == "png":
+        info = PIL.PngImagePlugin.PngInfo()
+        for key, value in (text or {}).items():
+            info.add_text(key, value)
+        img.save(out, "PNG", pnginfo=info)
+    else:
+        exif = PIL.Image.Exif()
+        if exif_comment is not None:
+            exif[0x9286] = exif_comment
+        img.save(out, "JPEG", exif=exif)
+    return out.getvalue()
+
+def build_corpus(seed: int) -> list[BenchCase]:
+    rng = random.Random(seed)
+    cases = []
+    for size, (tags, quoted) in {"short": (20, 1), "long": (300, 10), "huge": (2000, 60)}.items():
+        raw = a1111_parameters(rng, tags, quoted)
+        cases.append(BenchCase(f"a1111-{size}-png", "a1111-png", encode_image("png", {"parameters": raw}), raw=raw))
+        cases.append(BenchCase(f"a1111-{size}-jpeg", "a1111-jpeg", encode_image("jpeg", exif_comment=raw), raw=raw))
+    for size, tags in {"short": 20, "long": 300}.items():
+        raw = swarm_parameters(rng, tags)
+        cases.append(BenchCase(f"swarm-{size}-png", "swarm-png", encode_image("png", {"parameters": raw}), raw=raw))
+        cases.append(BenchCase(f"swarm-{size}-jpeg", "swarm-jpeg", encode_image("jpeg", exif_comment=raw), raw=raw))
+    for size, nodes in COMFY_SIZES.items():
+        api = json.dumps(comfy_api_workflow(rng, nodes))
+        cases.append(BenchCase(f"comfy-api-{size}", f"comfy-api-{size}", encode_image("png", {"prompt": api}), info={"prompt": api}))
+        ui = json.dumps(comfy_ui_workflow(rng, nodes))
+        both = {"prompt": api, "workflow": ui}
+        cases.append(BenchCase(f"comfy-ui-{size}", f"comfy-ui-{size}", encode_image("png", both), info=both))
+    return cases
+
+def pathological_inputs() -> dict[str, Callable[[int], str]]:
+    return {
+        "unbalanced-quote-commas": lambda n: 'Steps: 20, Prompt: "' + "a, " * n,
+        "many-quoted-fields": lambda n: ", ".join(f'k{i}: "v, w"' for i in range(n)),
+        "colons-without-commas": lambda n: "a: " * n,
+        "quote-every-field": lambda n: ", ".join(f'k{i}: "v' for i in range(n)),
+        "prompt-newlines": lambda n: "x,\n" * n + "Negative prompt: " + "y\n" * n + "Steps: 20",
+        "unclosed-group": lambda n: "Steps: 20, Hashes: {" + '"a": "b", ' * n,
+    }
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def timing_stats(timings: list[float]) -> dict[str, float]:
+    return {
+        "p50_ms": percentile(timings, 50),
+        "p90_ms": percentile(timings, 90),
+        "p99_ms": percentile(timings, 99),
+        "max_ms": max(timings),
+    }
+
+def measure(func: Callable[[], Any], iterations: int) -> tuple[dict[str, float], list[float]]:
+    """Latency percentiles and peak allocation of a call, and the timings they came from."""
+    func()  # warmup
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {**timing_stats(timings), "peak_kib": peak / 1024}, timings
+
+def merge_groups(results: dict[str, dict[str, Any]], samples: dict[str, dict[str, list[float]]],
+                 cases: list[BenchCase]) -> dict[str, dict[str, float]]:
+    """Percentiles over the pooled timings of every case of a format, and the largest peak allocation among them."""
+    pooled: dict[str, dict[str, list[float]]] = {}
+    for case in cases:
+        for prefix, timings in samples[case.name].items():
+            pooled.setdefault(case.group, {}).setdefault(prefix, []).extend(timings)
+    groups = {}
+    for group, prefixes in pooled.items():
+        row = {}
+        for prefix, timings in prefixes.items():
+            row.update({f"{prefix}{key}": value for key, value in timing_stats(timings).items()})
+            row[f"{prefix}peak_kib"] = max(results[case.name][f"{prefix}peak_kib"] for case in cases
+                                           if case.group == group and prefix in samples[case.name])
+        groups[group] = row
+    return groups
+
+def run_corpus(cases: list[BenchCase], iterations: int) -> tuple[dict[str, dict[str, Any]], dict[str, dict[str, list[float]]]]:
+    """Measurements of each case, and their timings by the prefix of their keys."""
+    results = {}
+    samples = {}
+    for case in cases:
+        result: dict[str, Any] = {"group": case.group, "bytes": len(case.image)}
+        stats, timings = measure(lambda: read_metadata(case.image), iterations)
+        result.update(stats)
+        samples[case.name] = {"": timings}
+        if case.raw is not None:
+            raw = case.raw
+            stats, timings = measure(lambda: WebuiMetadata(raw).as_dict(), iterations)
+            result.update({f"webui_{key}": value for key, value in stats.items()})
+            samples[case.name]["webui_"] = timings
+        if case.info is not None:
+            info = case.info
+            stats, timings = measure(lambda: ComfyMetadataReader.from_info(info, 64, 64), iterations)
+            result.update({f"comfy_{key}": value for key, value in stats.items()})
+            samples[case.name]["comfy_"] = timings
+        results[case.name] = result
+    return results, samples
+
+def run_pathological(limit_seconds: float, max_size: int) -> dict[str, list[dict[str, float]]]:
+    results = {}
+    for name, build in pathological_inputs().items():
+        rows = []
+        size = 64
+        while size <= max_size:
+            raw = build(size)
+            start = time.perf_counter()
+            WebuiMetadata(raw).as_dict()
+            elapsed = time.perf_counter() - start
+            row = {"size": size, "chars": len(raw), "ms": elapsed * 1000}
+            if rows and rows[-1]["ms"] > 0.05:
+                row["growth_exponent"] = math.log2(max(row["ms"], 1e-6) / rows[-1]["ms"])
+            rows.append(row)
+            if elapsed > limit_seconds:
+                break
+            size *= 2
+        results[name] = rows
+    return results
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"Python {report['python']}, {report['iterations']} iterations, seed {report['seed']}\n")
+    print(f"{'format':<18}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'peak KiB':>11}")
+    for group, row in report["formats"].items():
+        print(f"{group:<18}{row['p50_ms']:>10.3f}{row['p90_ms']:>10.3f}{row['p99_ms']:>10.3f}"
+              f"{row['max_ms']:>10.3f}{row['peak_kib']:>11.1f}")
+    print("\nPathological inputs for WebuiMetadata (growth exponent ~1 is linear, ~2 is quadratic)")
+    for name, rows in report["pathological"].items():
+        cells = ", ".join(f"{row['size']}: {row['ms']:.1f}ms" for row in rows)
+        worst = max((row.get("growth_exponent", 0.0) for row in rows), default=0.0)
+        print(f"  {name:<26} worst growth {worst:.2f} | {cells}")
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline imagescanner metadata parsing benchmark.")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed runs per corpus entry.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the generated corpus.")
+    parser.add_argument("--limit", type=float, default=2.0, help="Stop growing a pathological input after a parse takes this many seconds.")
+    parser.add_argument("--max-size", type=int, default=16384, help="Largest pathological input size.")
+    parser.add_argument("--json", dest="json_path", help="Write machine-readable results to this file.")
+    args = parser.parse_args(argv)
+
+    cases = build_corpus(args.seed)
+    results, samples = run_corpus(cases, args.iterations)
+    report = {
+        "python": platform.python_version(),
+        "iterations": args.iterations,
+        "seed": args.seed,
+        "formats": merge_groups(results, samples, cases),
+        "cases": results,
+        "pathological": run_pathological(args.limit, args.max_size),
+    }
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
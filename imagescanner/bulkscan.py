@@ -0,0 +1,139 @@
+import time
+import asyncio
+import discord
+from typing import TYPE_CHECKING
+from collections import OrderedDict
+
+from imagescanner.index import IndexEntry
+from imagescanner.scheduler import ScanPriority
+from imagescanner.constants import SUPPORTED_FORMATS, log
+
+if TYPE_CHECKING:
+    from imagescanner.imagescanner import ImageScanner
+
+PROGRESS_INTERVAL = 5
+FLUSH_SIZE = 200
+
+
+class ChannelScan:
+    """
+    Walks the history of a channel from the oldest message and writes the metadata of every image into the index.
+    Attachment downloads, metadata parsing and resource resolution run in a pipeline with bounded concurrency.
+    Progress is saved as the newest message id below which everything was processed, so a scan can resume.
+    """
+
+    def __init__(self, cog: "ImageScanner", channel: discord.TextChannel | discord.Thread, concurrency: int, limit: int | None):
+        self.cog = cog
+        self.channel = channel
+        self.concurrency = concurrency
+        self.limit = limit
+        self.messages = 0
+        self.images = 0
+        self.found = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self.finished = False
+        self.last_message_id: int | None = None
+        self._queue: asyncio.Queue[discord.Message | None] = asyncio.Queue(maxsize=concurrency * 4)
+        self._pending: OrderedDict[int, bool] = OrderedDict()
+        self._buffer: list[IndexEntry] = []
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.started, 0.001)
+
+    def progress_text(self) -> str:
+        status = "Finished scanning" if self.finished else "Scanning"
+        return (f"{status} {self.channel.mention}\n"
+                f"Messages: {self.messages} ({self.messages / self.elapsed:.1f}/s)\n"
+                f"Images: {self.images} ({self.images / self.elapsed:.1f}/s), with metadata: {self.found}, errors: {self.errors}\n"
+                f"Elapsed: {int(self.elapsed)}s")
+
+    async def run(self, progress: discord.Message) -> None:
+        self.last_message_id = await self.cog.image_index.get_progress(self.channel.id)
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(self._report(progress))
+        try:
+            await self._produce()
+            for _ in workers:
+                await self._queue.put(None)
+            await asyncio.gather(*workers)
+            self.finished = True
+        finally:
+            for task in workers:
+                task.cancel()
+            reporter.cancel()
+            await self._flush()
+            try:
+                await progress.edit(content=self.progress_text() + ("" if self.finished else "\nStopped."))
+            except discord.HTTPException:
+                pass
+
+    async def _produce(self) -> None:
+        after = discord.Object(self.last_message_id) if self.last_message_id else None
+        async for message in self.channel.history(limit=self.limit, after=after, oldest_first=True):
+            self._pending[message.id] = False
+            await self._queue.put(message)
+
+    async def _worker(self) -> None:
+        while True:
+            message = await self._queue.get()
+            if message is None:
+                return
+            try:
+                await self._process(message)
+            except Exception:  # one broken message shouldn't stop the scan
+                self.errors += 1
+                log.exception(f"Bulk scanning message {message.id}")
+            self.messages += 1
+            self._pending[message.id] = True
+            while self._pending and next(iter(self._pending.values())):
+                self.last_message_id, _ = self._pending.popitem(last=False)
+            if len(self._buffer) >= FLUSH_SIZE:
+                await self._flush()
+
+    async def _process(self, message: discord.Message) -> None:
+        assert self.cog.bot.user and message.guild
+        if message.author.bot and message.author.id != self.cog.bot.user.id:
+            return
+        for i, attachment in enumerate(message.attachments):
+            if not attachment.filename.lower().endswith(SUPPORTED_FORMATS) or attachment.size >= self.cog.scan_limit:
+                continue
+            self.images += 1
+            try:
+                async with self.cog.scan_scheduler.slot(message.guild.id, attachment.size, ScanPriority.BULK):
+                    data = await attachment.read()
+                    metadata = await self.cog.metadata_workers.read_metadata(data)
+            except (discord.HTTPException, asyncio.TimeoutError) as error:
+                self.errors += 1
+                log.debug(f"Bulk scanning attachment {attachment.url}: {type(error).__name__}")
+                continue
+            if metadata is None:
+                continue
+            self.found += 1
+            resources = await self.cog.resolve_resource_links(metadata)
+            self._buffer.append(IndexEntry.from_metadata(
+                metadata,
+                message_id=message.id,
+                attachment=i,
+                guild_id=message.guild.id,
+                channel_id=message.channel.id,
+                author_id=message.author.id,
+                created_at=int(message.created_at.timestamp()),
+                resources=resources,
+            ))
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            entries, self._buffer = self._buffer, []
+            await self.cog.image_index.add(entries, self.channel.id, self.last_message_id)
+
+    async def _report(self, progress: discord.Message) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            await self._flush()
+            try:
+                await progress.edit(content=self.progress_text())
+            except discord.HTTPException:
+                pass
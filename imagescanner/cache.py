@@ -0,0 +1,221 @@
+import os
+import time
+import shutil
+import asyncio
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from imagescanner.metadata import Metadata
+from imagescanner.constants import log
+
+ImageCacheData = dict[int, bytes]
+ImageCacheMetadata = dict[int, Metadata]
+
+ENTRY_OVERHEAD = 512  # rough size of the python objects around each entry
+# spilled images are read, written and deleted here, away from the event loop.
+# a single thread, so that they happen in the order they were asked for
+DISK_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="imagescanner_cache")
+
+
+@dataclass
+class ImageCacheEntry:
+    metadata: ImageCacheMetadata
+    image_bytes: ImageCacheData | None
+    timestamp: float
+    size: int = 0
+    disk_size: int = 0
+    spilled: list[int] = field(default_factory=list)
+
+
+@dataclass
+class ImageCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    spills: int = 0
+    disk_hits: int = 0
+
+
+class ImageCache:
+    """
+    Cache of scanned messages bounded by the total bytes it holds rather than by the number of entries.
+    The least recently used entries are evicted first, and entries that go unused for max_age_seconds expire.
+    If a spill path is given, evicted image payloads are moved to disk instead of being discarded, and the metadata stays in memory.
+    In metadata-only mode image payloads are never stored.
+    Disk operations run in the background, only get waits for them when it needs spilled images back.
+    """
+
+    def __init__(self,
+                 max_bytes: int,
+                 *,
+                 max_age_seconds: float = 24*60*60,
+                 spill_path: Path | None = None,
+                 max_disk_bytes: int = 0,
+                 metadata_only: bool = False):
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.spill_path = spill_path if max_disk_bytes > 0 else None
+        self.max_disk_bytes = max_disk_bytes
+        self.metadata_only = metadata_only
+        self.stats = ImageCacheStats()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._entries: OrderedDict[int, ImageCacheEntry] = OrderedDict()
+        self._clear_disk()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, message_id: int) -> bool:
+        entry = self._entries.get(message_id)
+        return entry is not None and not self._expired(entry)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    async def get(self, message_id: int) -> tuple[ImageCacheMetadata, ImageCacheData] | None:
+        entry = self._entries.get(message_id)
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                self._remove(message_id)
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        entry.timestamp = time.monotonic()  # keeps the entries in order of age, for _enforce_limits
+        self._entries.move_to_end(message_id)
+        image_bytes = dict(entry.image_bytes or {})
+        if entry.spilled:
+            files = {i: self._spill_file(message_id, i) for i in entry.spilled}
+            spilled = await asyncio.wrap_future(DISK_EXECUTOR.submit(_read_files, files))
+            self.stats.disk_hits += len(spilled)
+            image_bytes.update(spilled)
+        return entry.metadata, image_bytes
+
+    def set(self, message_id: int, metadata: ImageCacheMetadata, image_bytes: ImageCacheData) -> None:
+        if not self.enabled:
+            return
+        if message_id in self._entries:
+            self._remove(message_id)
+        if self.metadata_only:
+            image_bytes = {}
+        entry = ImageCacheEntry(metadata, dict(image_bytes), time.monotonic())
+        entry.size = self._entry_size(entry)
+        if entry.size > self.max_bytes:
+            payload = self._payload_size(entry)
+            if not metadata or entry.size - payload > self.max_bytes:
+                return
+            # too big for memory by itself, keep only the metadata here
+            if self.spill_path:
+                self._spill(message_id, entry)
+            else:
+                entry.image_bytes = {}
+                entry.size -= payload
+        self._entries[message_id] = entry
+        self.memory_bytes += entry.size
+        self._enforce_limits()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._clear_disk()
+
+    def _expired(self, entry: ImageCacheEntry) -> bool:
+        return time.monotonic() - entry.timestamp > self.max_age_seconds
+
+    @staticmethod
+    def _payload_size(entry: ImageCacheEntry) -> int:
+        return sum(len(b) for b in (entry.image_bytes or {}).values())
+
+    @classmethod
+    def _entry_size(cls, entry: ImageCacheEntry) -> int:
+        metadata_size = sum(ENTRY_OVERHEAD + len(md.raw or "") for md in entry.metadata.values())
+        return ENTRY_OVERHEAD + metadata_size + cls._payload_size(entry)
+
+    def _enforce_limits(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            message_id, entry = next(iter(self._entries.items()))
+            if now - entry.timestamp <= self.max_age_seconds:
+                break
+            self._remove(message_id)
+
+        for message_id in list(self._entries.keys()):
+            if self.memory_bytes <= self.max_bytes:
+                break
+            entry = self._entries[message_id]
+            if self.spill_path and entry.image_bytes:
+                self._spill(message_id, entry)
+            else:
+                self._remove(message_id)
+            self.stats.evictions += 1
+
+        while self.disk_bytes > self.max_disk_bytes:
+            spilled = next((mid for mid, e in self._entries.items() if e.spilled), None)
+            if spilled is None:
+                break
+            self._drop_spilled(spilled, self._entries[spilled])
+
+    def _spill(self, message_id: int, entry: ImageCacheEntry) -> None:
+        assert self.spill_path and entry.image_bytes is not None
+        payload = self._payload_size(entry)
+        files = [(self._spill_file(message_id, i), data) for i, data in entry.image_bytes.items()]
+        DISK_EXECUTOR.submit(_write_files, self.spill_path, files)
+        entry.spilled = list(entry.image_bytes)
+        entry.disk_size = payload
+        self.disk_bytes += payload
+        self.stats.spills += 1
+        entry.image_bytes = {}
+        if message_id in self._entries:
+            self.memory_bytes -= payload
+        entry.size -= payload
+
+    def _drop_spilled(self, message_id: int, entry: ImageCacheEntry) -> None:
+        DISK_EXECUTOR.submit(_remove_files, [self._spill_file(message_id, i) for i in entry.spilled])
+        entry.spilled = []
+        self.disk_bytes -= entry.disk_size
+        entry.disk_size = 0
+
+    def _remove(self, message_id: int) -> None:
+        entry = self._entries.pop(message_id)
+        self.memory_bytes -= entry.size
+        if entry.spilled:
+            self._drop_spilled(message_id, entry)
+
+    def _spill_file(self, message_id: int, i: int) -> Path:
+        assert self.spill_path
+        return self.spill_path / f"{message_id}_{i}.bin"
+
+    def _clear_disk(self) -> None:
+        if self.spill_path:
+            DISK_EXECUTOR.submit(shutil.rmtree, self.spill_path, ignore_errors=True)
+
+
+def _write_files(folder: Path, files: list[tuple[Path, bytes]]) -> None:
+    try:
+        os.makedirs(folder, exist_ok=True)
+        for path, data in files:
+            path.write_bytes(data)
+    except OSError:
+        log.exception("Spilling image cache to disk")
+
+
+def _read_files(files: dict[int, Path]) -> ImageCacheData:
+    result = {}
+    for i, path in files.items():
+        try:
+            result[i] = path.read_bytes()
+        except OSError:
+            log.warning(f"Spilled image {path.stem} is missing from disk")
+    return result
+
+
+def _remove_files(files: list[Path]) -> None:
+    for path in files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
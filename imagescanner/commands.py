@@ -1,9 +1,12 @@
+import os
 import re
 import discord
 from typing import Optional
 from redbot.core import commands
 
 from imagescanner.base import ImageScannerBase
+from imagescanner.workers import MetadataWorkers
+from imagescanner.scheduler import ScanPriority
 
 
 class ImageScannerCommands(ImageScannerBase):
@@ -58,6 +61,7 @@ class ImageScannerCommands(ImageScannerBase):
     async def scanset_attachimages(self, ctx: commands.Context):
         """Toggles whether images sent in DMs will be attached or linked."""
         self.attach_images = not self.attach_images
+        self.embed_cache.clear()  # cached embeds were built with the old setting
         await self.config.attach_images.set(self.attach_images)
         if self.attach_images:
             await ctx.reply("Images sent in DMs will now be attached as a file and embedded in full size.")
@@ -68,6 +72,7 @@ class ImageScannerCommands(ImageScannerBase):
     async def scanset_civitai(self, ctx: commands.Context):
         """Toggles whether images should look for models on Civitai."""
         self.use_civitai = not self.use_civitai
+        self.embed_cache.clear()  # cached embeds were built with the old setting
         await self.config.use_civitai.set(self.use_civitai)
         if self.use_civitai:
             await ctx.reply("Images sent in DMs will now try to find models on Civitai.")
@@ -78,6 +83,7 @@ class ImageScannerCommands(ImageScannerBase):
     async def scanset_arcenciel(self, ctx: commands.Context):
         """Toggles whether images should look for models on Arc en Ciel."""
         self.use_arcenciel = not self.use_arcenciel
+        self.embed_cache.clear()  # cached embeds were built with the old setting
         await self.config.use_arcenciel.set(self.use_arcenciel)
         if self.use_arcenciel:
             await ctx.reply("Images sent in DMs will now try to find models on Arc en Ciel.")
@@ -89,6 +95,7 @@ class ImageScannerCommands(ImageScannerBase):
         """Add your own Civitai custom emoji with this command."""
         if emoji is None:
             self.civitai_emoji = ""
+            self.embed_cache.clear()  # cached embeds were built with the old setting
             await self.config.civitai_emoji.set("")
             await ctx.reply("No emoji will appear when Civitai links are shown to users, only the word \"Civitai\".")
             return
@@ -98,6 +105,7 @@ class ImageScannerCommands(ImageScannerBase):
             await ctx.reply("I don't have access to that emoji. I must be in the same server to use it.")
         else:
             self.civitai_emoji = str(emoji)
+            self.embed_cache.clear()  # cached embeds were built with the old setting
             await self.config.civitai_emoji.set(str(emoji))
             await ctx.reply(f"{emoji} will now appear when Civitai links are shown to users.")
 
@@ -106,6 +114,7 @@ class ImageScannerCommands(ImageScannerBase):
         """Add your own arcenciel custom emoji with this command."""
         if emoji is None:
             self.arcenciel_emoji = ""
+            self.embed_cache.clear()  # cached embeds were built with the old setting
             await self.config.arcenciel_emoji.set("")
             await ctx.reply("No emoji will appear when arcenciel links are shown to users, only \"Arc en Ciel\".")
             return
@@ -115,24 +124,117 @@ class ImageScannerCommands(ImageScannerBase):
             await ctx.reply("I don't have access to that emoji. I must be in the same server to use it.")
         else:
             self.arcenciel_emoji = str(emoji)
+            self.embed_cache.clear()  # cached embeds were built with the old setting
             await self.config.arcenciel_emoji.set(str(emoji))
             await ctx.reply(f"{emoji} will now appear when arcenciel links are shown to users.")
 
-    @scanset.command(name="cache")
-    async def scanset_cache(self, ctx: commands.Context, size: Optional[int]):
-        """How many images to cache in memory."""
-        if size is None:
-            size = await self.config.image_cache_size()
-            await ctx.reply(f"Up to {size} recent images will be cached in memory to prevent duplicate downloads. "
-                            "Images are removed from cache after 24 hours.")
-        elif size < 0 or size > 1000:
-            await ctx.reply("Please choose a value between 0 and 1000, or none to see the current value.")
+    @scanset.group(name="cache", invoke_without_command=True)
+    async def scanset_cache(self, ctx: commands.Context, megabytes: Optional[int]):
+        """How many megabytes of recent images to cache in memory, and cache statistics."""
+        assert self.image_cache is not None
+        if megabytes is not None:
+            if megabytes < 0 or megabytes > 16*1024:
+                await ctx.reply("Please choose a value between 0 and 16384 MB, or none to see the current value.")
+                return
+            self.image_cache_mb = megabytes
+            await self.config.image_cache_mb.set(megabytes)
+            self.image_cache.clear()
+            self.image_cache = self.build_image_cache()
+        cache = self.image_cache
+        stats = cache.stats
+        mode = "metadata only" if cache.metadata_only else "metadata and images"
+        disk = f"{self.image_cache_disk_mb} MB" if cache.spill_path else "disabled"
+        await ctx.reply(f"Up to {self.image_cache_mb} MB of recent scans ({mode}) are cached in memory "
+                        "to prevent duplicate downloads. Scans are removed from cache after 24 hours.\n"
+                        f"Disk overflow: {disk}\n"
+                        f"Entries: {len(cache)}, memory: {cache.memory_bytes / 1024**2:.1f} MB, "
+                        f"disk: {cache.disk_bytes / 1024**2:.1f} MB\n"
+                        f"Hits: {stats.hits}, misses: {stats.misses}, evictions: {stats.evictions}, "
+                        f"spills: {stats.spills}, disk hits: {stats.disk_hits}")
+
+    @scanset_cache.command(name="disk")
+    async def scanset_cache_disk(self, ctx: commands.Context, megabytes: int):
+        """How many megabytes of images evicted from memory can be kept on disk. 0 to disable."""
+        assert self.image_cache is not None
+        if megabytes < 0 or megabytes > 64*1024:
+            await ctx.reply("Please choose a value between 0 and 65536 MB.")
+            return
+        self.image_cache_disk_mb = megabytes
+        await self.config.image_cache_disk_mb.set(megabytes)
+        self.image_cache.clear()
+        self.image_cache = self.build_image_cache()
+        await ctx.tick(message="Disk cache size set, the cache was cleared")
+
+    @scanset_cache.command(name="metadataonly")
+    async def scanset_cache_metadataonly(self, ctx: commands.Context):
+        """Toggles whether the cache keeps only the scanned metadata and never the images."""
+        assert self.image_cache is not None
+        self.image_cache_metadata_only = not self.image_cache_metadata_only
+        await self.config.image_cache_metadata_only.set(self.image_cache_metadata_only)
+        self.image_cache.clear()
+        self.image_cache = self.build_image_cache()
+        if self.image_cache_metadata_only:
+            await ctx.reply("The cache will now only keep image metadata. Images will be downloaded again when needed.")
         else:
-            await self.config.image_cache_size.set(size)
-            await ctx.reply(f"Up to {size} recent images will be cached in memory to prevent duplicate downloads. "
-                            "Images are removed from cache after 24 hours."
-                            "\nRequires a cog reload to apply the new value, which will clear the cache.")
+            await ctx.reply("The cache will now keep both image metadata and the images themselves.")
             
+    @scanset.command(name="workers")
+    async def scanset_workers(self, ctx: commands.Context, workers: Optional[int]):
+        """How many separate processes read image metadata. 0 reads it in a thread of the bot process."""
+        if workers is None:
+            if self.metadata_workers.uses_processes:
+                await ctx.reply(f"Image metadata is read by {self.metadata_workers.workers} worker processes.")
+            else:
+                await ctx.reply("Image metadata is read in a thread of the bot process.")
+            return
+        if workers < 0 or workers > (os.cpu_count() or 1):
+            await ctx.reply(f"Please choose a value between 0 and {os.cpu_count() or 1}.")
+            return
+        await self.config.metadata_workers.set(workers)
+        self.metadata_workers.shutdown()
+        self.metadata_workers = MetadataWorkers(workers, self.metadata_workers.timeout)
+        await ctx.tick(message="Metadata workers set")
+
+    @scanset.command(name="timeout")
+    async def scanset_timeout(self, ctx: commands.Context, seconds: Optional[float]):
+        """How many seconds a worker process may spend reading the metadata of one image before it's restarted."""
+        if seconds is None or seconds <= 0 or seconds > 600:
+            await ctx.reply(f"Reading the metadata of an image in a worker process times out after {self.metadata_workers.timeout:g} seconds. "
+                            f"{self.metadata_workers.timeouts} images have timed out since the cog was loaded. "
+                            "Without worker processes there is no timeout, as a thread can't be stopped.")
+            return
+        await self.config.metadata_timeout.set(seconds)
+        self.metadata_workers.timeout = seconds
+        await ctx.tick(message="Timeout set")
+
+    @scanset.group(name="queue", invoke_without_command=True)
+    async def scanset_queue(self, ctx: commands.Context):
+        """Shows the image scan queue and its limits."""
+        scheduler = self.scan_scheduler
+        stats = scheduler.stats
+        average_wait = stats.total_wait / stats.started if stats.started else 0.0
+        await ctx.reply(f"Running: {scheduler.running}/{scheduler.max_running} "
+                        f"(max {scheduler.max_running_per_guild} per server), "
+                        f"{scheduler.bytes_in_flight / 1024**2:.1f}/{scheduler.max_bytes // 1024**2} MB in flight\n"
+                        f"Queued: {scheduler.queued(ScanPriority.INTERACTIVE)} interactive, "
+                        f"{scheduler.queued(ScanPriority.BULK)} bulk, {scheduler.queued(ScanPriority.PASSIVE)} passive\n"
+                        f"Completed: {stats.completed}, skipped due to load: {stats.shed}\n"
+                        f"Wait: {average_wait:.2f}s average, {stats.max_wait:.2f}s max")
+
+    @scanset_queue.command(name="limits")
+    async def scanset_queue_limits(self, ctx: commands.Context, running: int, per_server: int, megabytes: int):
+        """Sets how many images can be scanned at once, how many of those from one server, and how many MB they can add up to."""
+        if running < 1 or per_server < 1 or per_server > running or megabytes < 1:
+            await ctx.reply("Please choose positive values, with the per-server limit not above the global limit.")
+            return
+        self.scan_scheduler.max_running = running
+        self.scan_scheduler.max_running_per_guild = per_server
+        self.scan_scheduler.max_bytes = megabytes * 1024**2
+        await self.config.scan_concurrency.set(running)
+        await self.config.scan_concurrency_guild.set(per_server)
+        await self.config.scan_inflight_mb.set(megabytes)
+        await ctx.tick(message="Scan queue limits set")
+
     @scanset.command(name="scangenerated")
     async def scanset_scangenerated(self, ctx: commands.Context):
         """Toggles always scanning images generated by the bot itself, regardless of channel whitelisting in ImageScanner."""
@@ -142,3 +244,13 @@ class ImageScannerCommands(ImageScannerBase):
             await ctx.reply("Scanning of images generated by the bot always enabled.")
         else:
             await ctx.reply("Scanning of images generated by the bot enabled only for ImageScanner whistelisted channels.")
+
+    @scanset.command(name="index")
+    async def scanset_index(self, ctx: commands.Context):
+        """Toggles whether images scanned in scan channels are added to the searchable index."""
+        self.index_scanned_images = not self.index_scanned_images
+        await self.config.index_scanned_images.set(self.index_scanned_images)
+        if self.index_scanned_images:
+            await ctx.reply("Images scanned in scan channels will now be added to the index, searchable with /imagesearch.")
+        else:
+            await ctx.reply("Images scanned in scan channels will no longer be added to the index.")
@@ -3,22 +3,27 @@ import os
 import asyncio
 import aiohttp
 import discord
-from hashlib import md5
-from expiringdict import ExpiringDict
+from typing import Optional
 from redbot.core import commands, app_commands
 from redbot.core.bot import Red
 
 import imagescanner.utils as utils
 from imagescanner.comfy import ComfyMetadata
 from imagescanner.commands import ImageScannerCommands
-from imagescanner.metadata import Metadata, WebuiMetadata, StableSwarmMetadata
+from imagescanner.metadata import Metadata, WebuiMetadata, StableSwarmMetadata, parse_webui_params
 from imagescanner.imageview import ImageView
-from imagescanner.constants import PARAM_REGEX, log, SUPPORTED_FORMATS, RESOURCE_HASH_REGEX, RESOURCE_FILE_REGEX
+from imagescanner.workers import MetadataWorkers
+from imagescanner.bulkscan import ChannelScan
+from imagescanner.index import IndexEntry
+from imagescanner.scheduler import ScanPriority, ScanShed
+from imagescanner.constants import log, SUPPORTED_FORMATS, RESOURCE_HASH_REGEX, RESOURCE_FILE_REGEX
 
 MODEL = "Model"
 MODEL_HASH = "Model hash"
 VAE_HASH = "VAE hash"
 LORA_HASHES = "Lora hashes"
+BULK_SCAN_CONCURRENCY = 4
+SEARCH_RESULTS = 10
 
 
 class ImageScanner(ImageScannerCommands):
@@ -39,45 +44,111 @@ class ImageScanner(ImageScannerCommands):
         self.arcenciel_emoji = await self.config.arcenciel_emoji()
         self.model_cache_civitai = await self.config.model_cache_v2()
         self.model_cache_arcenciel = await self.config.model_cache_arcenciel()
-        self.image_cache_size = await self.config.image_cache_size()
-        self.image_cache = ExpiringDict(max_len=self.image_cache_size, max_age_seconds=24*60*60)
+        self.image_cache_mb = await self.config.image_cache_mb()
+        self.image_cache_disk_mb = await self.config.image_cache_disk_mb()
+        self.image_cache_metadata_only = await self.config.image_cache_metadata_only()
+        self.image_cache = self.build_image_cache()
+        self.metadata_workers = MetadataWorkers(await self.config.metadata_workers(), await self.config.metadata_timeout())
+        self.scan_scheduler.max_running = await self.config.scan_concurrency()
+        self.scan_scheduler.max_running_per_guild = await self.config.scan_concurrency_guild()
+        self.scan_scheduler.max_bytes = await self.config.scan_inflight_mb() * 1024**2
+        await self.image_index.setup()
         self.always_scan_generated_images = await self.config.always_scan_generated_images()
+        self.index_scanned_images = await self.config.index_scanned_images()
 
     async def cog_unload(self):
         self.bot.tree.remove_command(self.context_menu.name, type=self.context_menu.type)
-        if self.image_cache:
+        for task in self.bulk_scans.values():
+            task.cancel()
+        if self.image_cache is not None:
             self.image_cache.clear()
+        self.metadata_workers.shutdown()
         if self.session:
             await self.session.close()
 
-    async def is_valid_red_message(self, message: discord.Message) -> bool:
+    async def red_delete_data_for_user(self, requester: str, user_id: int):
+        await self.image_index.delete_user(user_id)
+
+    async def is_valid_red_message(self, message: discord.Message | utils.CachedMessage) -> bool:
         return await self.bot.allowed_by_whitelist_blacklist(message.author) \
                and await self.bot.ignored_channel_or_guild(message) \
                and not await self.bot.cog_disabled_in_guild(self, message.guild)
 
     async def grab_metadata_dict(self, message: discord.Message) -> dict:  # used by agent cog
         assert self.image_cache is not None
-        
-        if message.id in self.image_cache:
-            metadata, image_bytes = self.image_cache[message.id]
-        elif not message.attachments:
+        if not message.attachments and message.id not in self.image_cache:
             return {}
-        else:
-            metadata: dict[int, Metadata] = {}
-            image_bytes: dict[int, bytes] = {}
-            tasks = [utils.grab_attachment_metadata(i, attachment, metadata, image_bytes)
-                    for i, attachment in enumerate(message.attachments)]
-            await asyncio.gather(*tasks)
-            if metadata and self.image_cache_size > 0:
-                self.image_cache[message.id] = (metadata, image_bytes)
-
+        guild_id = message.guild.id if message.guild else 0
+        metadata, _ = await self.scan_attachments(message.id, message.attachments, guild_id, ScanPriority.INTERACTIVE)
         if metadata:
             return metadata[0].as_dict()
         else:
             return {}
-        
 
-    async def prepare_embed(self, message: discord.Message, metadata: Metadata, i: int, total=1) -> discord.Embed:
+    async def scan_attachments(self, message_id: int, attachments: list[discord.Attachment], guild_id: int,
+                               priority: ScanPriority) -> tuple[dict[int, Metadata], dict[int, bytes]]:
+        """
+        Returns the cached scan of a message, or scans it once no matter how many requests arrive at the same time.
+        Downloads go through the scan scheduler. Raises ScanShed if a passive scan was skipped due to overload.
+        """
+        assert self.image_cache is not None
+        if cached := await self.image_cache.get(message_id):
+            return cached
+
+        async def scan_one(i: int, attachment: discord.Attachment, metadata: dict[int, Metadata], image_bytes: dict[int, bytes]):
+            async with self.scan_scheduler.slot(guild_id, attachment.size, priority):
+                await utils.grab_attachment_metadata(i, attachment, metadata, image_bytes, self.metadata_workers.read_metadata)
+
+        async def scan():
+            metadata: dict[int, Metadata] = {}
+            image_bytes: dict[int, bytes] = {}
+            tasks = [scan_one(i, attachment, metadata, image_bytes) for i, attachment in enumerate(attachments)]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            assert self.image_cache is not None
+            self.image_cache.set(message_id, metadata, image_bytes)
+            return metadata, image_bytes
+
+        try:
+            return await utils.run_once(self.scans_in_flight, message_id, scan)
+        except ScanShed:
+            if priority == ScanPriority.PASSIVE:
+                raise
+            # we joined a passive scan that was skipped, so do our own
+            return await utils.run_once(self.scans_in_flight, message_id, scan)
+
+    async def download_missing_images(self, attachments: list[discord.Attachment], metadata: dict[int, Metadata],
+                                      image_bytes: dict[int, bytes], guild_id: int) -> dict[int, bytes]:
+        """The cache may have kept only the metadata of a message, so its images are downloaded again to be attached."""
+        image_bytes = dict(image_bytes)
+        for i in sorted(metadata.keys() - image_bytes.keys()):
+            async with self.scan_scheduler.slot(guild_id, attachments[i].size, ScanPriority.INTERACTIVE):
+                try:
+                    image_bytes[i] = await attachments[i].read()
+                except discord.HTTPException:
+                    log.warning(f"Couldn't download {attachments[i].url} again")
+        return image_bytes
+
+    async def prepare_embed_payloads(self, message: utils.CachedMessage, metadata: dict[int, Metadata],
+                                     image_bytes: dict[int, bytes], total: int) -> list[utils.EmbedPayload]:
+        """Builds the result embeds of a message once and memoizes them, including resource lookups and image hashes."""
+        if payloads := self.embed_cache.get(message.id):
+            return payloads
+
+        async def prepare():
+            payloads = []
+            for i, md in sorted(metadata.items(), key=lambda m: m[0]):
+                embed = await self.prepare_embed(message, md, i, total)
+                filename = utils.image_filename(image_bytes[i]) if i in image_bytes else None
+                payloads.append(utils.EmbedPayload(i, embed.to_dict(), md.raw or "", filename))
+            self.embed_cache[message.id] = payloads
+            return payloads
+
+        return await utils.run_once(self.embeds_in_flight, message.id, prepare)
+
+    async def prepare_embed(self, message: discord.Message | utils.CachedMessage, metadata: Metadata, i: int, total=1) -> discord.Embed:
         assert isinstance(message.author, discord.Member)
         params = metadata.as_dict()
         embed = utils.build_embed(params, message.author)
@@ -102,7 +173,7 @@ class ImageScanner(ImageScannerCommands):
                     utils.remove_field(embed, MODEL_HASH)
             utils.remove_field(embed, VAE_HASH)  # vae hashes seem to be bugged in automatic1111 webui
             if params.get(LORA_HASHES):
-                hashes = PARAM_REGEX.findall(params[LORA_HASHES].strip('"')+",")  # trailing comma for the regex
+                hashes = parse_webui_params(params[LORA_HASHES].strip('"')+",")  # values end at a comma, including the last one
                 log.debug(hashes)
                 links = {name: await self.grab_civitai_model_link(short_hash)
                             for name, short_hash in hashes}
@@ -120,7 +191,7 @@ class ImageScanner(ImageScannerCommands):
                     utils.remove_field(embed, MODEL_HASH)
             utils.remove_field(embed, VAE_HASH) #  vae hashes seem to be bugged in automatic1111 webui
             if params.get(LORA_HASHES):
-                hashes = PARAM_REGEX.findall(params[LORA_HASHES].strip('"')+",") # trailing comma for the regex
+                hashes = parse_webui_params(params[LORA_HASHES].strip('"')+",")  # values end at a comma, including the last one
                 log.debug(hashes)
                 for _, hash in hashes:
                     models = await self.search_arcenciel_resource(hash, hash_only=True)
@@ -147,18 +218,16 @@ class ImageScanner(ImageScannerCommands):
         if not await self.is_valid_red_message(message):
             return
 
-        metadata: dict[int, Metadata] = {}
-        image_bytes: dict[int, bytes] = {}
-        tasks = [utils.grab_attachment_metadata(i, attachment, metadata, image_bytes)
-                 for i, attachment in enumerate(attachments)]
-        await asyncio.gather(*tasks)
-
+        try:
+            metadata, _ = await self.scan_attachments(message.id, attachments, message.guild.id, ScanPriority.PASSIVE)
+        except ScanShed:
+            log.debug(f"Skipped scanning message {message.id} due to load")
+            return
         if metadata:
-            if self.image_cache_size > 0:
-                self.image_cache[message.id] = (metadata, image_bytes)
+            self.message_cache[message.id] = utils.CachedMessage.from_message(message)
             await message.add_reaction('🔎')
-        else:
-            self.image_cache[message.id] = ({}, {})
+            if self.index_scanned_images:
+                await self.add_to_index(message, metadata)
 
 
     @commands.Cog.listener()
@@ -170,9 +239,12 @@ class ImageScanner(ImageScannerCommands):
         if ctx.channel_id not in self.scan_channels and not self.always_scan_generated_images:
             return
 
-        channel = self.bot.get_channel(ctx.channel_id)
-        assert isinstance(channel, discord.abc.Messageable)
-        message: discord.Message = await channel.fetch_message(ctx.message_id)
+        message = self.message_cache.get(ctx.message_id)
+        if message is None:
+            channel = self.bot.get_channel(ctx.channel_id)
+            assert isinstance(channel, discord.abc.Messageable)
+            message = utils.CachedMessage.from_message(await channel.fetch_message(ctx.message_id))
+            self.message_cache[message.id] = message
         assert isinstance(message.author, discord.Member)
         if not message or message.author.bot and message.author.id != self.bot.user.id:
             return
@@ -186,16 +258,7 @@ class ImageScanner(ImageScannerCommands):
         if not await self.is_valid_red_message(message):
             return
 
-        if message.id in self.image_cache:
-            metadata, image_bytes = self.image_cache[message.id]
-        else:
-            metadata: dict[int, Metadata] = {}
-            image_bytes: dict[int, bytes] = {}
-            tasks = [utils.grab_attachment_metadata(i, attachment, metadata, image_bytes)
-                     for i, attachment in enumerate(attachments)]
-            await asyncio.gather(*tasks)
-            if self.image_cache_size > 0:
-                self.image_cache[message.id] = (metadata, image_bytes)
+        metadata, image_bytes = await self.scan_attachments(message.id, attachments, ctx.guild_id or 0, ScanPriority.INTERACTIVE)
 
         if not metadata:
             embed = utils.build_embed({}, message.author)
@@ -207,13 +270,16 @@ class ImageScanner(ImageScannerCommands):
                 log.debug(f"User {ctx.member.id} does not accept DMs")
             return
         
-        for i, md in sorted(metadata.items(), key=lambda m: m[0]):
-            embed = await self.prepare_embed(message, md, i, len(attachments))
-            view = ImageView([md.raw or ""], [embed], ephemeral=False)
+        payloads = await self.prepare_embed_payloads(message, metadata, image_bytes, len(attachments))
+        if self.attach_images:
+            image_bytes = await self.download_missing_images(attachments, metadata, image_bytes, ctx.guild_id or 0)
+        for payload in payloads:
+            i = payload.index
+            embed = payload.build_embed()
+            view = ImageView([payload.raw], [embed], ephemeral=False)
             if self.attach_images and i in image_bytes:
-                img = io.BytesIO(image_bytes[i])
-                filename = md5(image_bytes[i]).hexdigest() + ".png"
-                file = discord.File(img, filename=filename)
+                filename = payload.filename or utils.image_filename(image_bytes[i])
+                file = discord.File(io.BytesIO(image_bytes[i]), filename=filename)
                 embed.set_image(url=f"attachment://{filename}")
                 try:
                     msg = await ctx.member.send(embed=embed, file=file, view=view)
@@ -233,7 +299,7 @@ class ImageScanner(ImageScannerCommands):
     # context menu set in __init__
     async def scanimage_app(self, interaction: discord.Interaction, message: discord.Message):
         """Get image metadata"""
-        assert self.image_cache
+        assert self.image_cache is not None
         attachments = [a for a in message.attachments if a.filename.lower().endswith(SUPPORTED_FORMATS)]
         if not attachments:
             await interaction.response.send_message("This post contains no images.", ephemeral=True)
@@ -241,13 +307,8 @@ class ImageScanner(ImageScannerCommands):
         
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        if message.id in self.image_cache:
-            metadata, image_bytes = self.image_cache[message.id]
-        else:
-            metadata, image_bytes = {}, {}
-            tasks = [utils.grab_attachment_metadata(i, attachment, metadata, image_bytes)
-                     for i, attachment in enumerate(attachments)]
-            await asyncio.gather(*tasks)
+        guild_id = message.guild.id if message.guild else 0
+        metadata, image_bytes = await self.scan_attachments(message.id, attachments, guild_id, ScanPriority.INTERACTIVE)
 
         if not metadata:
             embed = discord.Embed(title="Image Info", color=message.author.color)
@@ -259,16 +320,110 @@ class ImageScanner(ImageScannerCommands):
         
         embeds = []
         params = []
-        for i, data in sorted(metadata.items(), key=lambda m: m[0]):
-            embed = await self.prepare_embed(message, data, i, len(attachments))
-            embed.set_thumbnail(url=attachments[i].url or attachments[i].proxy_url or None)
+        payloads = await self.prepare_embed_payloads(utils.CachedMessage.from_message(message), metadata, image_bytes, len(attachments))
+        for payload in payloads:
+            embed = payload.build_embed()
+            embed.set_thumbnail(url=attachments[payload.index].url or attachments[payload.index].proxy_url or None)
             embeds.append(embed)
-            params.append(data.raw or "")
+            params.append(payload.raw)
         view = ImageView(params, embeds, ephemeral=True)
 
         await interaction.followup.send(embed=embeds[0], view=view)
 
 
+    @commands.group(name="imageindex", invoke_without_command=True)  # type: ignore
+    @commands.guild_only()
+    @commands.admin_or_permissions(administrator=True)
+    async def imageindex(self, ctx: commands.Context):
+        """Build a local index of the generation parameters of images in past messages."""
+        await ctx.send_help()
+
+    @imageindex.command(name="scan")
+    @commands.bot_has_permissions(read_message_history=True)
+    async def imageindex_scan(self, ctx: commands.Context, channel: discord.TextChannel | discord.Thread, limit: Optional[int] = None):
+        """Scans the history of a channel into the index. Continues where the last scan of that channel stopped."""
+        assert ctx.guild
+        if channel.guild != ctx.guild:
+            return await ctx.reply("That channel is not in this server.")
+        if channel.id in self.bulk_scans and not self.bulk_scans[channel.id].done():
+            return await ctx.reply("That channel is already being scanned.")
+        if not channel.permissions_for(ctx.guild.me).read_message_history:
+            return await ctx.reply("I can't read the message history of that channel.")
+        scan = ChannelScan(self, channel, BULK_SCAN_CONCURRENCY, limit)
+        progress = await ctx.reply(scan.progress_text())
+        task = asyncio.create_task(scan.run(progress))
+        self.bulk_scans[channel.id] = task
+        task.add_done_callback(lambda _: self.bulk_scans.pop(channel.id, None))
+
+    @imageindex.command(name="stop")
+    async def imageindex_stop(self, ctx: commands.Context, channel: discord.TextChannel | discord.Thread):
+        """Stops scanning a channel. The scan can be resumed later."""
+        task = self.bulk_scans.get(channel.id)
+        if not task or task.done():
+            return await ctx.reply("That channel is not being scanned.")
+        task.cancel()
+        await ctx.tick(message="Scan stopped")
+
+    @imageindex.command(name="reset")
+    async def imageindex_reset(self, ctx: commands.Context, channel: discord.TextChannel | discord.Thread):
+        """Forgets where the last scan of a channel stopped, so the next scan starts from the beginning."""
+        await self.image_index.reset_progress(channel.id)
+        await ctx.tick(message="Scan progress reset")
+
+    @imageindex.command(name="status")
+    async def imageindex_status(self, ctx: commands.Context):
+        """Shows the size of the index and any running scans."""
+        assert ctx.guild
+        count = await self.image_index.count(ctx.guild.id)
+        running = [f"<#{channel_id}>" for channel_id, task in self.bulk_scans.items() if not task.done()]
+        await ctx.reply(f"{count} images from this server are indexed.\n"
+                        f"Running scans: {', '.join(running) or '*None*'}")
+
+    async def add_to_index(self, message: discord.Message, metadata: dict[int, Metadata]) -> None:
+        assert message.guild
+        entries = [IndexEntry.from_metadata(md,
+                                            message_id=message.id,
+                                            attachment=i,
+                                            guild_id=message.guild.id,
+                                            channel_id=message.channel.id,
+                                            author_id=message.author.id,
+                                            created_at=int(message.created_at.timestamp()))
+                   for i, md in metadata.items()]
+        try:
+            await self.image_index.add(entries)
+        except Exception:
+            log.exception("Adding scanned images to the index")
+
+    @app_commands.command(name="imagesearch")
+    @app_commands.guild_only()
+    @app_commands.describe(query='Words to find in the prompt or resources. "Quotes" for a phrase, word* for a prefix.',
+                           model="Model or checkpoint name.",
+                           lora="LoRA name or hash.",
+                           seed="Exact seed.")
+    async def imagesearch_app(self, interaction: discord.Interaction, query: Optional[str] = None, model: Optional[str] = None,
+                              lora: Optional[str] = None, seed: Optional[str] = None):
+        """Search the generation parameters of images indexed in this server."""
+        assert interaction.guild and isinstance(interaction.user, discord.Member)
+        guild, user = interaction.guild, interaction.user
+        channel_ids = [channel_id for channel_id in await self.image_index.channels(guild.id)
+                       if (channel := guild.get_channel_or_thread(channel_id)) and channel.permissions_for(user).read_message_history]
+        try:
+            results = await self.image_index.search(guild.id, channel_ids, query or "", model=model or "", lora=lora or "",
+                                                    seed=seed or "", limit=SEARCH_RESULTS)
+        except Exception as error:  # malformed queries are rejected by sqlite
+            log.debug(f"Image search {query!r}: {type(error).__name__}: {error}")
+            results = []
+        lines = []
+        for entry, snippet in results:
+            link = f"https://discord.com/channels/{entry.guild_id}/{entry.channel_id}/{entry.message_id}"
+            details = " · ".join(val for val in (entry.model, f"seed {entry.seed}" if entry.seed else "") if val)
+            text = snippet or entry.prompt[:150]
+            lines.append(f"[<t:{entry.created_at}:d>]({link}) <@{entry.author_id}> {details}\n> {text}")
+        embed = discord.Embed(title="Image search", color=await self.bot.get_embed_color(interaction.channel))  # type: ignore
+        embed.description = "\n".join(lines)[:4000] if lines else "No images found."
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
     async def grab_civitai_model_link(self, short_hash: str) -> str | None:
         if not short_hash:
             return None
@@ -360,6 +515,21 @@ class ImageScanner(ImageScannerCommands):
         return sorted(list(hyperlinks))
     
 
+    async def resolve_resource_links(self, metadata: Metadata) -> list[str]:
+        """Links to the resources used by an image, without building an embed."""
+        if isinstance(metadata, (ComfyMetadata, StableSwarmMetadata)):
+            return await self.resolve_arcenciel_resources(metadata) if self.use_arcenciel else []
+        params = metadata.as_dict()
+        links = []
+        if self.use_civitai:
+            if link := await self.grab_civitai_model_link(params.get(MODEL_HASH, "")):
+                links.append(link)
+            for _, short_hash in parse_webui_params(params.get(LORA_HASHES, "").strip('"') + ","):
+                if link := await self.grab_civitai_model_link(short_hash):
+                    links.append(link)
+        return links
+    
+
     async def arcenciel_cache_set(self, hint: str, hyperlink: str | None) -> None:
         if hyperlink is None:
             self.model_not_found_cache_arcenciel[hint] = True
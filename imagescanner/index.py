@@ -0,0 +1,179 @@
+import re
+import json
+import aiosqlite as sql
+from pathlib import Path
+from dataclasses import dataclass, asdict
+
+from imagescanner.comfy import ComfyMetadata
+from imagescanner.metadata import Metadata, StableSwarmMetadata
+
+DB_FILE = "index.db"
+DB_TABLE_IMAGES = "images"
+DB_TABLE_PROGRESS = "scan_progress"
+DB_TABLE_SEARCH = "images_fts"
+SEARCH_COLUMNS = ["prompt", "negative_prompt", "model", "lora_hashes", "sampler", "seed"]
+SEARCH_TOKEN_REGEX = re.compile(r'"([^"]*)"|(\S+)')
+
+
+@dataclass
+class IndexEntry:
+    message_id: int
+    attachment: int
+    guild_id: int
+    channel_id: int
+    author_id: int
+    created_at: int
+    source: str
+    prompt: str = ""
+    negative_prompt: str = ""
+    model: str = ""
+    sampler: str = ""
+    seed: str = ""
+    lora_hashes: str = ""
+    resources: str = ""
+    params: str = ""
+
+    @classmethod
+    def from_metadata(cls, metadata: Metadata, *, message_id: int, attachment: int, guild_id: int,
+                      channel_id: int, author_id: int, created_at: int, resources: list[str] | None = None) -> "IndexEntry":
+        params = metadata.as_dict()
+        entry = cls(message_id, attachment, guild_id, channel_id, author_id, created_at, metadata.source)
+        entry.prompt = str(params.get("Prompt", ""))
+        entry.negative_prompt = str(params.get("Negative Prompt", ""))
+        entry.model = str(params.get("Model") or params.get("Checkpoint") or "")
+        entry.sampler = str(params.get("Sampler", ""))
+        entry.seed = str(params.get("Seed", ""))
+        hashes = [str(params[key]).strip('"') for key in ("Model hash", "Lora hashes") if params.get(key)]
+        if isinstance(metadata, (ComfyMetadata, StableSwarmMetadata)):
+            hashes += metadata.resource_hint_strings()
+        entry.lora_hashes = ", ".join(hashes)
+        entry.resources = "\n".join(resources or [])
+        entry.params = json.dumps(params, default=str)
+        return entry
+
+
+class ImageIndex:
+    """Local SQLite index of the generation parameters of scanned images."""
+
+    def __init__(self, folder: Path):
+        self.path = folder / DB_FILE
+
+    async def setup(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        async with sql.connect(self.path) as db:
+            await db.execute(f"CREATE TABLE IF NOT EXISTS {DB_TABLE_IMAGES} ("
+                             "message_id INTEGER NOT NULL, attachment INTEGER NOT NULL, guild_id INTEGER, channel_id INTEGER, "
+                             "author_id INTEGER, created_at INTEGER, source TEXT, prompt TEXT, negative_prompt TEXT, model TEXT, "
+                             "sampler TEXT, seed TEXT, lora_hashes TEXT, resources TEXT, params TEXT, "
+                             "PRIMARY KEY (message_id, attachment))")
+            await db.execute(f"CREATE INDEX IF NOT EXISTS idx_{DB_TABLE_IMAGES}_channel ON {DB_TABLE_IMAGES} (channel_id, message_id)")
+            await self._setup_search(db)
+            await db.execute(f"CREATE TABLE IF NOT EXISTS {DB_TABLE_PROGRESS} ("
+                             "channel_id INTEGER PRIMARY KEY, last_message_id INTEGER NOT NULL)")
+            await db.commit()
+
+    @staticmethod
+    async def _setup_search(db: sql.Connection) -> None:
+        """Full text search table kept in sync with the images table by triggers."""
+        async with db.execute("SELECT 1 FROM sqlite_master WHERE name = ?", [DB_TABLE_SEARCH]) as cursor:
+            exists = await cursor.fetchone() is not None
+        columns = ", ".join(SEARCH_COLUMNS)
+        new_values = ", ".join(f"new.{col}" for col in SEARCH_COLUMNS)
+        old_values = ", ".join(f"old.{col}" for col in SEARCH_COLUMNS)
+        await db.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {DB_TABLE_SEARCH} USING fts5({columns}, "
+                         f"content='{DB_TABLE_IMAGES}', content_rowid='rowid', prefix='2 3', tokenize=\"unicode61 tokenchars '_'\")")
+        await db.execute(f"CREATE TRIGGER IF NOT EXISTS {DB_TABLE_IMAGES}_ai AFTER INSERT ON {DB_TABLE_IMAGES} BEGIN "
+                         f"INSERT INTO {DB_TABLE_SEARCH}(rowid, {columns}) VALUES (new.rowid, {new_values}); END")
+        await db.execute(f"CREATE TRIGGER IF NOT EXISTS {DB_TABLE_IMAGES}_ad AFTER DELETE ON {DB_TABLE_IMAGES} BEGIN "
+                         f"INSERT INTO {DB_TABLE_SEARCH}({DB_TABLE_SEARCH}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); END")
+        await db.execute(f"CREATE TRIGGER IF NOT EXISTS {DB_TABLE_IMAGES}_au AFTER UPDATE ON {DB_TABLE_IMAGES} BEGIN "
+                         f"INSERT INTO {DB_TABLE_SEARCH}({DB_TABLE_SEARCH}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); "
+                         f"INSERT INTO {DB_TABLE_SEARCH}(rowid, {columns}) VALUES (new.rowid, {new_values}); END")
+        if not exists:
+            await db.execute(f"INSERT INTO {DB_TABLE_SEARCH}({DB_TABLE_SEARCH}) VALUES ('rebuild')")
+
+    async def add(self, entries: list[IndexEntry], channel_id: int | None = None, last_message_id: int | None = None) -> None:
+        """Inserts entries and optionally records scan progress for a channel in the same transaction."""
+        rows = [tuple(asdict(entry).values()) for entry in entries]
+        async with sql.connect(self.path) as db:
+            if rows:
+                # an upsert instead of a replace so that the update trigger keeps the search table in sync
+                fields = list(asdict(entries[0]).keys())
+                placeholders = ", ".join("?" * len(fields))
+                updates = ", ".join(f"{field} = excluded.{field}" for field in fields[2:])
+                await db.executemany(f"INSERT INTO {DB_TABLE_IMAGES} VALUES ({placeholders}) "
+                                     f"ON CONFLICT (message_id, attachment) DO UPDATE SET {updates}", rows)
+            if channel_id is not None and last_message_id is not None:
+                await db.execute(f"INSERT OR REPLACE INTO {DB_TABLE_PROGRESS} VALUES (?, ?)", [channel_id, last_message_id])
+            await db.commit()
+
+    async def get_progress(self, channel_id: int) -> int | None:
+        async with sql.connect(self.path) as db:
+            async with db.execute(f"SELECT last_message_id FROM {DB_TABLE_PROGRESS} WHERE channel_id = ?", [channel_id]) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def reset_progress(self, channel_id: int) -> None:
+        async with sql.connect(self.path) as db:
+            await db.execute(f"DELETE FROM {DB_TABLE_PROGRESS} WHERE channel_id = ?", [channel_id])
+            await db.commit()
+
+    async def count(self, guild_id: int | None = None) -> int:
+        query = f"SELECT COUNT(*) FROM {DB_TABLE_IMAGES}"
+        args = []
+        if guild_id is not None:
+            query += " WHERE guild_id = ?"
+            args.append(guild_id)
+        async with sql.connect(self.path) as db:
+            async with db.execute(query, args) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    async def delete_user(self, user_id: int) -> None:
+        async with sql.connect(self.path) as db:
+            await db.execute(f"DELETE FROM {DB_TABLE_IMAGES} WHERE author_id = ?", [user_id])
+            await db.commit()
+
+    async def channels(self, guild_id: int) -> list[int]:
+        """The channels of a server that have indexed images."""
+        async with sql.connect(self.path) as db:
+            async with db.execute(f"SELECT DISTINCT channel_id FROM {DB_TABLE_IMAGES} WHERE guild_id = ?", [guild_id]) as cursor:
+                rows = await cursor.fetchall()
+        return [row[0] for row in rows]
+
+    async def search(self, guild_id: int, channel_ids: list[int], query: str = "", *, model: str = "", lora: str = "",
+                     seed: str = "", limit: int = 50) -> list[tuple[IndexEntry, str]]:
+        """
+        Full text search with prefix and phrase support, in the given channels only.
+        Returns the newest entries along with a highlighted prompt snippet.
+        """
+        expression = build_search_expression(query, model=model, lora=lora, seed=seed)
+        if not expression or not channel_ids:
+            return []
+        fields = ", ".join(f"i.{field}" for field in IndexEntry.__dataclass_fields__)
+        placeholders = ", ".join("?" * len(channel_ids))
+        async with sql.connect(self.path) as db:
+            async with db.execute(f"SELECT {fields}, snippet({DB_TABLE_SEARCH}, 0, '**', '**', '…', 24) "
+                                  f"FROM {DB_TABLE_SEARCH} JOIN {DB_TABLE_IMAGES} i ON i.rowid = {DB_TABLE_SEARCH}.rowid "
+                                  f"WHERE {DB_TABLE_SEARCH} MATCH ? AND i.guild_id = ? AND i.channel_id IN ({placeholders}) "
+                                  f"ORDER BY {DB_TABLE_SEARCH}.rowid DESC LIMIT ?",
+                                  [expression, guild_id, *channel_ids, limit]) as cursor:
+                rows = await cursor.fetchall()
+        return [(IndexEntry(*row[:-1]), row[-1]) for row in rows]
+
+
+def build_search_expression(query: str, *, model: str = "", lora: str = "", seed: str = "") -> str:
+    """
+    Turns user input into an FTS5 expression without exposing its syntax: "quoted text" is a phrase,
+    a word ending in * is a prefix, and everything else must appear anywhere in the prompt or resources.
+    """
+    terms = []
+    for text, columns in ((query, None), (model, "model"), (lora, "lora_hashes"), (seed, "seed")):
+        for phrase, word in SEARCH_TOKEN_REGEX.findall(text or ""):
+            prefix = not phrase and word.endswith("*")
+            value = (phrase or word).replace('"', "").rstrip("*")
+            if not value.strip():
+                continue
+            term = '"' + value + '"' + ("*" if prefix else "")
+            terms.append(f"{columns} : {term}" if columns else term)
+    return " AND ".join(terms)
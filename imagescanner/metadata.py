@@ -5,7 +5,7 @@ from typing import Any
 from collections import OrderedDict
 from dataclasses import dataclass, field
 
-from imagescanner.constants import METADATA_REGEX, PARAM_GROUP_REGEX, PARAM_REGEX, RESOURCE_HASH_REGEX
+from imagescanner.constants import METADATA_REGEX, RESOURCE_HASH_REGEX
 from imagescanner.constants import WEBUI_PARAMS_BLACKLIST, STABLE_SWARM_IDENTIFIERS
 
 
@@ -32,6 +32,88 @@ def normalize_hash(value: str) -> str | None:
         return None
     return token
 
+def unquoted_positions(text: str, char: str) -> list[int]:
+    """Positions of a character that is followed by an even number of double quotes, meaning it's not inside quotes."""
+    total_quotes = text.count('"')
+    quotes_before = 0
+    quote = text.find('"')
+    positions = []
+    index = text.find(char)
+    while index >= 0:
+        while 0 <= quote < index:
+            quotes_before += 1
+            quote = text.find('"', quote + 1)
+        if (total_quotes - quotes_before) % 2 == 0:
+            positions.append(index)
+        index = text.find(char, index + 1)
+    return positions
+
+def remove_param_groups(text: str) -> str:
+    """Removes `, key: {...}` groups outside of quotes in a single pass. Same output as the regex it replaced, see test_metadata.py"""
+    braces = unquoted_positions(text, "}")
+    brace_index = 0
+    newline = -1
+    parts = []
+    last = 0
+    pos = text.find(", ")
+    while pos >= 0:
+        colon = text.find(":", pos + 2)
+        if colon < 0:
+            break
+        if colon == pos + 2 or not text.startswith(" {", colon + 1):
+            pos = text.find(", ", colon + 1)
+            continue
+        value_start = colon + 3
+        while brace_index < len(braces) and braces[brace_index] <= value_start:  # at least one character inside
+            brace_index += 1
+        if newline < value_start:
+            newline = text.find("\n", value_start)
+            if newline < 0:
+                newline = len(text)
+        if brace_index == len(braces) or braces[brace_index] > newline:
+            pos = text.find(", ", colon + 1)
+            continue
+        end = braces[brace_index]
+        parts.append(text[last:pos])
+        last = end + 1
+        pos = text.find(", ", last)
+    parts.append(text[last:])
+    return "".join(parts)
+
+def parse_webui_params(text: str) -> list[tuple[str, str]]:
+    """
+    Splits `key: value, key: "quoted, value",` into pairs in a single pass over the text.
+    Same output as the regex it replaced, see test_metadata.py, which went super-linear on long or malformed input.
+    Values end at the first comma outside of quotes, so the text needs a trailing comma.
+    """
+    commas = unquoted_positions(text, ",")
+    comma_index = 0
+    newline = -1
+    pairs = []
+    pos = 0
+    while True:
+        colon = text.find(":", pos)
+        if colon < 0:
+            break
+        if colon == pos or not text.startswith(" ", colon + 1):
+            pos = colon + 1
+            continue
+        key_start = pos + 1 if text.startswith(" ", pos) and colon > pos + 1 else pos
+        value_start = colon + 2
+        while comma_index < len(commas) and commas[comma_index] <= value_start:  # at least one character
+            comma_index += 1
+        if newline < value_start:
+            newline = text.find("\n", value_start)
+            if newline < 0:
+                newline = len(text)
+        if comma_index == len(commas) or commas[comma_index] > newline:
+            pos = colon + 1
+            continue
+        end = commas[comma_index]
+        pairs.append((text[key_start:colon], text[value_start:end]))
+        pos = end + 1
+    return pairs
+
 
 @dataclass
 class Metadata(ABC):
@@ -66,8 +148,8 @@ class WebuiMetadata(Metadata):
             output_dict["Negative Prompt"] = negative_prompt
 
         params = match.group("Params")
-        params = PARAM_GROUP_REGEX.sub("", params)
-        param_list = PARAM_REGEX.findall(params)
+        params = remove_param_groups(params)
+        param_list = parse_webui_params(params)
         for key, value in param_list:
             if len(output_dict) >= 25 or key in output_dict:
                 continue
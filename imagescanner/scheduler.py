@@ -0,0 +1,133 @@
+import time
+import asyncio
+import bisect
+from enum import IntEnum
+from itertools import count
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+
+class ScanPriority(IntEnum):
+    INTERACTIVE = 0  # someone is waiting for the result
+    BULK = 1
+    PASSIVE = 2  # images posted in scan channels, can be skipped
+
+
+class ScanShed(Exception):
+    """A passive scan was skipped because the scanner is overloaded."""
+
+
+@dataclass
+class ScanSchedulerStats:
+    started: int = 0
+    completed: int = 0
+    shed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+@dataclass(order=True)
+class ScanWaiter:
+    priority: int
+    seq: int
+    guild_id: int = field(compare=False)
+    size: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class ScanScheduler:
+    """
+    Limits how many attachments are downloaded and parsed at the same time, globally and per guild,
+    as well as how many bytes they may add up to. Waiting scans are started in order of priority.
+    Passive scans are shed when too many are already waiting or when they wait for too long.
+    """
+
+    def __init__(self, max_running: int = 4, max_running_per_guild: int = 2, max_bytes: int = 64 * 1024**2,
+                 max_passive_queue: int = 20, max_passive_wait: float = 60):
+        self.max_running = max_running
+        self.max_running_per_guild = max_running_per_guild
+        self.max_bytes = max_bytes
+        self.max_passive_queue = max_passive_queue
+        self.max_passive_wait = max_passive_wait
+        self.running = 0
+        self.running_per_guild: Counter[int] = Counter()
+        self.bytes_in_flight = 0
+        self.stats = ScanSchedulerStats()
+        self._waiters: list[ScanWaiter] = []
+        self._seq = count()
+
+    def queued(self, priority: ScanPriority | None = None) -> int:
+        return sum(1 for waiter in self._waiters if priority is None or waiter.priority == priority)
+
+    @asynccontextmanager
+    async def slot(self, guild_id: int, size: int, priority: ScanPriority):
+        waited = 0.0
+        if not self._waiters and self._fits(guild_id, size):
+            self._acquire(guild_id, size)
+        else:
+            waited = await self._wait(guild_id, size, priority)
+        self.stats.started += 1
+        self.stats.total_wait += waited
+        self.stats.max_wait = max(self.stats.max_wait, waited)
+        try:
+            yield
+        finally:
+            self.stats.completed += 1
+            self._release(guild_id, size)
+
+    async def _wait(self, guild_id: int, size: int, priority: ScanPriority) -> float:
+        if priority == ScanPriority.PASSIVE and self.queued(ScanPriority.PASSIVE) >= self.max_passive_queue:
+            self.stats.shed += 1
+            raise ScanShed()
+        start = time.monotonic()
+        waiter = ScanWaiter(priority, next(self._seq), guild_id, size, asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiters, waiter)
+        self._wake()
+        try:
+            if priority == ScanPriority.PASSIVE:
+                await asyncio.wait_for(waiter.future, self.max_passive_wait)
+            else:
+                await waiter.future
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(guild_id, size)  # the slot was granted right as we gave up
+            if isinstance(error, asyncio.TimeoutError):
+                self.stats.shed += 1
+                raise ScanShed() from None
+            raise
+        return time.monotonic() - start
+
+    def _fits(self, guild_id: int, size: int) -> bool:
+        return self._fits_globally(size) and self.running_per_guild[guild_id] < self.max_running_per_guild
+
+    def _fits_globally(self, size: int) -> bool:
+        if self.running >= self.max_running:
+            return False
+        return self.running == 0 or self.bytes_in_flight + size <= self.max_bytes  # a big file can still run alone
+
+    def _acquire(self, guild_id: int, size: int) -> None:
+        self.running += 1
+        self.running_per_guild[guild_id] += 1
+        self.bytes_in_flight += size
+
+    def _release(self, guild_id: int, size: int) -> None:
+        self.running -= 1
+        self.running_per_guild[guild_id] -= 1
+        if self.running_per_guild[guild_id] <= 0:
+            del self.running_per_guild[guild_id]
+        self.bytes_in_flight -= size
+        self._wake()
+
+    def _wake(self) -> None:
+        for waiter in list(self._waiters):
+            if waiter.future.done():
+                self._waiters.remove(waiter)
+            elif not self._fits_globally(waiter.size):
+                break  # don't let smaller or less important scans starve this one
+            elif self._fits(waiter.guild_id, waiter.size):
+                self._waiters.remove(waiter)
+                self._acquire(waiter.guild_id, waiter.size)
+                waiter.future.set_result(None)
@@ -0,0 +1,45 @@
+"""
+Differential check of the webui parameter tokenizer against the regexes it replaced, which are kept here as the reference.
+Runs on the benchmark corpus, on short pathological inputs and on random strings.
+
+Usage: python -m pytest imagescanner/test_metadata.py
+"""
+import re
+import random
+import pytest
+
+from imagescanner.benchmark import build_corpus, pathological_inputs
+from imagescanner.metadata import parse_webui_params, remove_param_groups
+
+LOOKAHEAD_PATTERN = r'(?=(?:[^"]*"[^"]*")*[^"]*$)'  # ensures the characters surrounding the lookahead are not inside quotes
+PARAM_REGEX = re.compile(rf" ?([^:]+): (.+?),{LOOKAHEAD_PATTERN}")
+PARAM_GROUP_REGEX = re.compile(rf", [^:]+: {{.+?{LOOKAHEAD_PATTERN}}}")
+
+SEED = 1
+FUZZ_COUNT = 20000
+FUZZ_ALPHABET = ["a", "b", " ", ",", ":", '"', "{", "}", "\n", ": ", ", ", "k: v, ", '"x, y"', ": {"]
+PATHOLOGICAL_SIZES = (1, 2, 3, 17, 64)  # the regexes get too slow on bigger ones
+
+
+def assert_same_as_regexes(text: str) -> None:
+    assert remove_param_groups(text) == PARAM_GROUP_REGEX.sub("", text), f"groups: {text[:200]!r}"
+    assert parse_webui_params(text) == PARAM_REGEX.findall(text), f"params: {text[:200]!r}"
+
+
+def test_corpus():
+    for case in build_corpus(SEED):
+        if case.raw:
+            assert_same_as_regexes(case.raw + ",")
+
+
+@pytest.mark.parametrize("name", list(pathological_inputs()))
+def test_pathological(name: str):
+    build = pathological_inputs()[name]
+    for size in PATHOLOGICAL_SIZES:
+        assert_same_as_regexes(build(size) + ",")
+
+
+def test_fuzz():
+    rng = random.Random(SEED)
+    for _ in range(FUZZ_COUNT):
+        assert_same_as_regexes("".join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 16))))
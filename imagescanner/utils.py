@@ -4,12 +4,59 @@ import asyncio
 import discord
 import PIL.Image
 from io import BytesIO
-from typing import Any, Dict
+from hashlib import md5
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+from dataclasses import dataclass
 
 from imagescanner.comfy import ComfyMetadataReader
 from imagescanner.metadata import Metadata, StableSwarmMetadata, WebuiMetadata
 from imagescanner.constants import SUPPORTED_FORMATS, RESOURCE_HASH_REGEX, log
 
+T = TypeVar("T")
+
+
+@dataclass
+class CachedMessage:
+    """The parts of a message needed to answer a scan request, so a cached scan doesn't need to fetch the message again."""
+    id: int
+    author: discord.Member | discord.User
+    channel: discord.abc.Messageable
+    guild: discord.Guild | None
+    attachments: list[discord.Attachment]
+    jump_url: str
+
+    @property
+    def permissions(self) -> discord.Permissions:
+        """The author's permissions in the channel, which is all Red's channel checks need from a message."""
+        return self.channel.permissions_for(self.author)  # type: ignore
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "CachedMessage":
+        return cls(message.id, message.author, message.channel, message.guild, list(message.attachments), message.jump_url)
+
+
+@dataclass
+class EmbedPayload:
+    """A prepared result embed that can be sent many times."""
+    index: int
+    embed: dict
+    raw: str
+    filename: str | None = None
+
+    def build_embed(self) -> discord.Embed:
+        return discord.Embed.from_dict(self.embed)
+
+
+async def run_once(in_flight: dict[Any, "asyncio.Future[T]"], key: Any, factory: Callable[[], Awaitable[T]]) -> T:
+    """Runs a coroutine only once for the same key while it is in flight, and lets every caller await the same result."""
+    if key not in in_flight:
+        future = asyncio.ensure_future(factory())
+        in_flight[key] = future
+        future.add_done_callback(lambda _: in_flight.pop(key, None))
+    return await asyncio.shield(in_flight[key])
+
+def image_filename(image_data: bytes) -> str:
+    return md5(image_data).hexdigest() + ".png"
 
 def build_embed(embed_dict: Dict[str, Any], author: discord.Member) -> discord.Embed:
     embed = discord.Embed(title="Here's your image!", color=author.color)
@@ -40,12 +87,19 @@ def read_metadata(image_data: bytes) -> Metadata | None:
         return metadata
     return None
 
-async def grab_attachment_metadata(i: int, attachment: discord.Attachment, metadata: Dict[int, Metadata], image_bytes: Dict[int, bytes]) -> None:
+async def grab_attachment_metadata(i: int, attachment: discord.Attachment, metadata: Dict[int, Metadata], image_bytes: Dict[int, bytes],
+                                   reader: Callable[[bytes], Awaitable[Metadata | None]] | None = None) -> None:
     if not attachment.filename.endswith(SUPPORTED_FORMATS):
         return
     try:
         current_image_bytes = await attachment.read()
-        current_image_metadata = await asyncio.to_thread(read_metadata, current_image_bytes)
+        if reader:
+            current_image_metadata = await reader(current_image_bytes)
+        else:
+            current_image_metadata = await asyncio.to_thread(read_metadata, current_image_bytes)
+    except asyncio.TimeoutError:
+        log.warning(f"Timed out reading metadata from {attachment.url}")
+        return
     except Exception:
         log.exception("Processing attachment")
         return
@@ -0,0 +1,86 @@
+import site
+import asyncio
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from imagescanner.metadata import Metadata
+from imagescanner.utils import read_metadata
+from imagescanner.constants import log
+
+# Red imports cogs from this folder without adding it to sys.path, so new processes couldn't find this package
+COG_FOLDER = str(Path(__file__).parents[1])
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """A pool of new processes that can import this cog."""
+    # the initializer is unpickled before it runs, so it can't come from this package either
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=site.addsitedir, initargs=(COG_FOLDER,))
+
+
+def terminate_pool(pool: ProcessPoolExecutor) -> None:
+    """Stops a pool even if its workers are busy."""
+    # there's no public way to stop a busy worker before python 3.14
+    if hasattr(pool, "terminate_workers"):
+        pool.terminate_workers()  # type: ignore
+        return
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class MetadataWorkers:
+    """
+    Runs read_metadata, including the Comfy workflow parsing, away from the event loop.
+    With 0 workers it runs in the default thread pool like before. With more, each worker is a process of its own,
+    so big workflows don't hold the GIL. A job that exceeds the timeout has its worker killed and restarted,
+    which doesn't affect the jobs running in the other workers.
+    """
+
+    def __init__(self, workers: int = 0, timeout: float = 30):
+        self.workers = workers
+        self.timeout = timeout  # only for worker processes, a thread can't be stopped
+        self.timeouts = 0
+        self._pools: list[ProcessPoolExecutor | None] = [None] * workers
+        self._idle: asyncio.Queue[int] = asyncio.Queue()
+        for index in range(workers):
+            self._idle.put_nowait(index)
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.workers > 0
+
+    async def read_metadata(self, image_data: bytes) -> Metadata | None:
+        if not self.uses_processes:
+            return await asyncio.to_thread(read_metadata, image_data)
+        index = await self._idle.get()
+        try:
+            pool = self._pools[index]
+            if pool is None:
+                pool = self._pools[index] = process_pool(1)
+            loop = asyncio.get_running_loop()
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(pool, read_metadata, image_data), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                log.warning(f"Metadata extraction took longer than {self.timeout} seconds, restarting worker {index}")
+                self._terminate(index, pool)
+                raise
+            except BrokenProcessPool:
+                log.warning(f"Metadata worker {index} died, restarting it")
+                self._terminate(index, pool)
+                raise
+        finally:
+            self._idle.put_nowait(index)
+
+    def shutdown(self) -> None:
+        for index, pool in enumerate(self._pools):
+            if pool is not None:
+                self._terminate(index, pool)
+
+    def _terminate(self, index: int, pool: ProcessPoolExecutor) -> None:
+        if self._pools[index] is pool:
+            self._pools[index] = None
+        terminate_pool(pool)
@@ -10,6 +10,10 @@ class BaseMinigameCog(commands.Cog):
     async def is_economy_enabled(self, guild: discord.Guild) -> bool:
         pass
 
+    @abstractmethod
+    async def connect4_difficulty(self, guild: discord.Guild) -> str:
+        pass
+
     @abstractmethod
     async def base_minigame_cmd(self,
                                 game_cls: Type["Minigame"],
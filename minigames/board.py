@@ -9,6 +9,11 @@ class Board:
         self.width = width
         self.height = height
         self._data = [fill] * (width * height)
+        self._history: List[Tuple[Pos, Any]] = []  # placed positions and what they held before
+
+    @property
+    def last_move(self) -> Optional[Pos]:
+        return self._history[-1][0] if self._history else None
 
     def _index(self, x: int, y: int):
         if not (0 <= x < self.width and 0 <= y < self.height):
@@ -23,112 +28,42 @@ class Board:
         x, y = pos
         self._data[self._index(x, y)] = value
 
+    def move(self, pos: Pos, value: Any):
+        """Places a value and remembers it, so that it can be undone without copying the board."""
+        self._history.append((pos, self[pos]))
+        self[pos] = value
+
+    def undo(self) -> Pos:
+        pos, previous = self._history.pop()
+        self[pos] = previous
+        return pos
+
     def copy(self):
         new_board = Board(self.width, self.height)
         new_board._data = list(self._data)
+        new_board._history = list(self._history)
         return new_board
 
 
-# These functions were originally handwritten in C# by me, and converted to Python with an LLM
-
-
-def find_lines(board: Board, value: Any, length: int, result: Optional[List[Pos]] = None):
-    win = False
-    line: List[Pos] = []
-
-    def check_cell(x: int, y: int):
-        nonlocal win, line
-        pos = (x, y)
-        if board[pos] == value:
-            line.append(pos)
-            if len(line) >= length:
-                win = True
-                if result is not None:
-                    if len(line) == length:
-                        result.extend(line)
-                    else:
-                        result.append(pos)
-        else:
-            line = []
-
-    # Horizontals
-    for y in range(board.height):
-        line = []
-        for x in range(board.width):
-            check_cell(x, y)
-
-    # Verticals
-    for x in range(board.width):
-        line = []
-        for y in range(board.height):
-            check_cell(x, y)
-
-    # Diagonals (top-left to bottom-right)
-    for d in range(length - 1, board.width + board.height - length + 1):
-        line = []
-        for y in range(board.height):
-            x = d - y
-            if 0 <= x < board.width:
-                check_cell(x, y)
-
-    # Diagonals (top-right to bottom-left)
-    for d in range(length - 1, board.width + board.height - length + 1):
-        line = []
-        for y in range(board.height):
-            x = board.width - 1 - d + y
-            if 0 <= x < board.width:
-                check_cell(x, y)
-
-    return win
-
-
-def try_complete_line(board: Board, value: Any, empty: Any, length: int) -> Optional[Pos]:
-    # Horizontals
-    for y in range(board.height):
-        count, missing = 0, None
-        for x in range(board.width):
-            if board[x, y] == value:
-                count += 1
-            elif board[x, y] is empty:
-                missing = (x, y)
-            if count == length - 1 and missing is not None:
-                return missing
-
-    # Verticals
-    for x in range(board.width):
-        count, missing = 0, None
-        for y in range(board.height):
-            if board[x, y] == value:
-                count += 1
-            elif board[x, y] is empty:
-                missing = (x, y)
-            if count == length - 1 and missing is not None:
-                return missing
-
-    # Diagonals (top-left to bottom-right)
-    for d in range(length - 1, board.width + board.height - length + 1):
-        count, missing = 0, None
-        for y in range(board.height):
-            x = d - y
-            if 0 <= x < board.width:
-                if board[x, y] == value:
-                    count += 1
-                elif board[x, y] is empty:
-                    missing = (x, y)
-                if count == length - 1 and missing is not None:
-                    return missing
-
-    # Diagonals (top-right to bottom-left)
-    for d in range(length - 1, board.width + board.height - length + 1):
-        count, missing = 0, None
-        for y in range(board.height):
-            x = board.width - 1 - d + y
-            if 0 <= x < board.width:
-                if board[x, y] == value:
-                    count += 1
-                elif board[x, y] is empty:
-                    missing = (x, y)
-                if count == length - 1 and missing is not None:
-                    return missing
-
-    return None
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+
+def find_lines_at(board: Board, pos: Pos, length: int, result: Optional[List[Pos]] = None) -> bool:
+    """
+    Whether the value at a position is part of a line of at least this length, adding the line to result if given.
+    After a move, only lines through the piece that was placed can be new.
+    """
+    value = board[pos]
+    x, y = pos
+    for dx, dy in DIRECTIONS:
+        line = [pos]
+        for step_x, step_y in ((dx, dy), (-dx, -dy)):
+            cx, cy = x + step_x, y + step_y
+            while 0 <= cx < board.width and 0 <= cy < board.height and board[cx, cy] == value:
+                line.append((cx, cy))
+                cx, cy = cx + step_x, cy + step_y
+        if len(line) >= length:
+            if result is not None:
+                result.extend(line)
+            return True
+    return False
@@ -1,4 +1,4 @@
-import random
+import asyncio
 import discord
 from enum import Enum
 from typing import List, Optional, Union
@@ -7,7 +7,8 @@ from redbot.core import bank
 from redbot.core.utils.chat_formatting import humanize_number
 
 from minigames.base import BaseMinigameCog, Minigame
-from minigames.board import Board, find_lines
+from minigames.board import Board, find_lines_at
+from minigames.connect4engine import ConnectFourEngine, Position, DIFFICULTIES, DEFAULT_DIFFICULTY
 from minigames.views.minigame_view import MinigameView
 from minigames.views.invite_view import InviteView
 from minigames.views.rematch_view import RematchView
@@ -49,6 +50,7 @@ class ConnectFourGame(Minigame):
         self.winner = Player.NONE
         self.time = 0
         self.cancelled = False
+        self.engine: Optional[ConnectFourEngine] = None
 
     async def do_turn(self, player: discord.Member, column: int):
         if player != self.member(self.current):
@@ -64,8 +66,8 @@ class ConnectFourGame(Minigame):
         
         self.last_interacted = datetime.now()
         self.time += 1
-        self.board[column, row] = self.current
-        if self.check_win(self.board, self.current, self.time):
+        self.board.move((column, row), self.current)
+        if self.check_win(self.board):
             self.winner = self.current
             await self.on_win(self.member(self.winner))
         elif self.is_finished():
@@ -75,30 +77,11 @@ class ConnectFourGame(Minigame):
             self.current = self.opponent(self.current)
 
     async def do_turn_ai(self):
-        moves = {}
-        avoid_moves = []
-        columns = self.available_columns(self.board)
-        if len(columns) == 1:
-            moves[columns[0]] = 0
-        else:
-            for column in columns: # All moves it can make
-                temp_board = self.board.copy()
-                self.drop_piece(temp_board, column, self.current)
-                if self.check_win(temp_board, self.current, self.time + 1): # Can win instantly
-                    moves = {column: 0}
-                    avoid_moves = []
-                    break
-                # The AI plays defensively, so it mostly avoids possible futures where it may lose
-                lose_count = self.may_lose_count(temp_board, self.current, self.opponent(self.current), self.time + 1, depth=3)
-                moves[column] = lose_count
-                if self.may_lose_count(temp_board, self.current, self.opponent(self.current), self.time + 1, depth=1) > 0: # Can lose next turn
-                    avoid_moves.append(column)
-        if len(avoid_moves) < len(moves):
-            for move in avoid_moves:
-                moves.pop(move)
-        least_loses = min(moves.values())
-        final_options = [col for col, val in moves.items() if val == least_loses]
-        move = random.choice(final_options)
+        if self.engine is None:
+            self.engine = ConnectFourEngine()
+        difficulty = await self.cog.connect4_difficulty(self.channel.guild)
+        position = Position.from_board(self.board, self.current, Player.NONE)
+        move = await asyncio.to_thread(self.engine.choose_move, position, DIFFICULTIES.get(difficulty, DIFFICULTIES[DEFAULT_DIFFICULTY]))
         await self.do_turn(self.member(self.current), move)
 
     def is_finished(self) -> bool:
@@ -130,8 +113,9 @@ class ConnectFourGame(Minigame):
         return Player.BLUE if current == Player.RED else Player.RED
     
     @classmethod
-    def check_win(cls, board: Board, color: Player, time: int) -> bool:
-        return find_lines(board, color, 4)
+    def check_win(cls, board: Board) -> bool:
+        """Whether the last piece dropped completed a line."""
+        return board.last_move is not None and find_lines_at(board, board.last_move, 4)
     
     @classmethod
     def get_highest_slot(cls, board: Board, column: int) -> Optional[int]:
@@ -142,39 +126,9 @@ class ConnectFourGame(Minigame):
                 return row
         return None
     
-    @classmethod
-    def drop_piece(cls, board: Board, column: int, color: Player):
-        if column < 0 or column > board.width - 1:
-            raise ValueError("Invalid column")
-        row = cls.get_highest_slot(board, column)
-        if row is None:
-            raise ValueError("Column is full")
-        board[column, row] = color
-    
     @classmethod
     def available_columns(cls, board: Board): 
         return [col for col in range(board.width) if cls.get_highest_slot(board, col) is not None]
-    
-    @classmethod
-    def get_random_unoccupied(cls, board: Board) -> int:
-        available_columns = cls.available_columns(board)
-        if not available_columns:
-            raise ValueError("No available columns")
-        return random.choice(available_columns)
-    
-    @classmethod
-    def may_lose_count(cls, board: Board, color: Player, current: Player, time: int, depth: int):
-        count = 0
-        if depth <= 0 or time == len(board._data):
-            return count
-        for column in cls.available_columns(board):
-            temp_board = board.copy()
-            cls.drop_piece(temp_board, column, current)
-            if current != color and cls.check_win(temp_board, current, time + 1):
-                count += 1
-            elif current != color or not cls.check_win(temp_board, current, time + 1):
-                count += cls.may_lose_count(temp_board, color, cls.opponent(current), time + 1, depth - 1)
-        return count
 
 
     async def get_content(self) -> Optional[str]:
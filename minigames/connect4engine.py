@@ -0,0 +1,261 @@
+"""
+Connect 4 on bitboards, for the bot's moves.
+Each column is 7 bits: its 6 cells from the bottom up, and an empty bit on top so that
+shifting pieces to look for lines never carries them into the next column.
+"""
+import time
+import random
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from minigames.board import Board
+
+WIDTH, HEIGHT = 7, 6
+COLUMN_BITS = HEIGHT + 1
+SIZE = WIDTH * HEIGHT
+BOTTOM = sum(1 << (col * COLUMN_BITS) for col in range(WIDTH))
+BOARD_MASK = BOTTOM * ((1 << HEIGHT) - 1)
+CENTER = ((1 << HEIGHT) - 1) << (WIDTH // 2 * COLUMN_BITS)
+ODD_ROWS = BOTTOM * 0b010101  # 1st, 3rd and 5th from the bottom, where the first player's threats count most
+EVEN_ROWS = BOTTOM * 0b101010
+COLUMN_ORDER = sorted(range(WIDTH), key=lambda col: abs(col - WIDTH // 2))  # center first
+DIRECTIONS = (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1)  # vertical, horizontal, both diagonals
+
+WIN = 1000  # minus the number of moves played, so faster wins score higher
+THREAT_VALUE = 10
+CENTER_VALUE = 3
+TT_SIZE = 1 << 18  # slots
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class Difficulty(NamedTuple):
+    depth: int  # plies
+    margin: int  # moves scoring this close to the best one may be picked at random
+
+
+DIFFICULTIES: Dict[str, Difficulty] = {
+    "easy": Difficulty(1, 40),
+    "normal": Difficulty(4, 10),
+    "hard": Difficulty(8, 0),
+    "expert": Difficulty(16, 0),
+}
+DEFAULT_DIFFICULTY = "normal"
+TIME_LIMIT = 1.0  # seconds, the deepest search finished by then is used
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def column_mask(col: int) -> int:
+    return ((1 << HEIGHT) - 1) << (col * COLUMN_BITS)
+
+
+def has_four(pieces: int) -> bool:
+    for shift in DIRECTIONS:
+        pairs = pieces & (pieces >> shift)
+        if pairs & (pairs >> 2 * shift):
+            return True
+    return False
+
+
+def winning_cells(pieces: int, mask: int) -> int:
+    """Empty cells that would complete four in a row for these pieces, playable or not."""
+    cells = (pieces << 1) & (pieces << 2) & (pieces << 3)
+    for shift in DIRECTIONS[1:]:
+        pair = (pieces << shift) & (pieces << 2 * shift)
+        cells |= pair & (pieces << 3 * shift)
+        cells |= pair & (pieces >> shift)
+        pair = (pieces >> shift) & (pieces >> 2 * shift)
+        cells |= pair & (pieces << shift)
+        cells |= pair & (pieces >> 3 * shift)
+    return cells & (BOARD_MASK ^ mask)
+
+
+class Position(NamedTuple):
+    current: int  # pieces of the player to move
+    mask: int  # all pieces
+    moves: int
+
+    @classmethod
+    def from_board(cls, board: Board, player: Any, empty: Any) -> "Position":
+        """From a board where row 0 is the top, with player to move."""
+        current = mask = moves = 0
+        for x in range(board.width):
+            for y in range(board.height):
+                value = board[x, y]
+                if value == empty:
+                    continue
+                bit = 1 << (x * COLUMN_BITS + board.height - 1 - y)
+                mask |= bit
+                moves += 1
+                if value == player:
+                    current |= bit
+        return cls(current, mask, moves)
+
+    @property
+    def key(self) -> int:
+        return self.current + self.mask  # unique for each position
+
+    def playable(self) -> int:
+        """The lowest empty cell of each column that isn't full."""
+        return (self.mask + BOTTOM) & BOARD_MASK
+
+    def can_play(self, col: int) -> bool:
+        return bool(self.playable() & column_mask(col))
+
+    def play(self, col: int) -> "Position":
+        mask = self.mask | (self.mask + (1 << (col * COLUMN_BITS)))
+        return Position(self.current ^ self.mask, mask, self.moves + 1)
+
+    def is_winning_move(self, col: int) -> bool:
+        return bool(winning_cells(self.current, self.mask) & self.playable() & column_mask(col))
+
+    def non_losing_moves(self) -> int:
+        """Playable cells that don't let the opponent win right away, or 0 if there's none."""
+        playable = self.playable()
+        threats = winning_cells(self.current ^ self.mask, self.mask)
+        forced = playable & threats
+        if forced:
+            if forced & (forced - 1):  # two threats to block
+                return 0
+            playable = forced
+        return playable & ~(threats >> 1)  # don't fill the cell under a threat
+
+    def evaluate(self) -> int:
+        """
+        Open lines of three and center pieces, from the point of view of the player to move.
+        When the board fills up, the first player gets to take the odd rows and the second player the even ones,
+        so lines of three waiting on those rows count double.
+        """
+        opponent = self.current ^ self.mask
+        mine, theirs = winning_cells(self.current, self.mask), winning_cells(opponent, self.mask)
+        my_rows, their_rows = (ODD_ROWS, EVEN_ROWS) if self.moves % 2 == 0 else (EVEN_ROWS, ODD_ROWS)
+        threats = popcount(mine) + popcount(mine & my_rows) - popcount(theirs) - popcount(theirs & their_rows)
+        center = popcount(self.current & CENTER) - popcount(opponent & CENTER)
+        return threats * THREAT_VALUE + center * CENTER_VALUE
+
+
+class TranspositionTable:
+    """Fixed size table of search results: (depth, bound type, score, best column) per position, deeper searches replace."""
+
+    def __init__(self, size: int = TT_SIZE):
+        self.size = size
+        self.slots: List[Optional[tuple]] = [None] * size
+        self.hits = 0
+        self.probes = 0
+
+    def get(self, key: int) -> Optional[tuple]:
+        self.probes += 1
+        slot = self.slots[key % self.size]
+        if slot is not None and slot[0] == key:
+            self.hits += 1
+            return slot[1:]
+        return None
+
+    def put(self, key: int, depth: int, bound: int, score: int, best: int) -> None:
+        index = key % self.size
+        slot = self.slots[index]
+        if slot is None or slot[0] == key or depth >= slot[1]:
+            self.slots[index] = (key, depth, bound, score, best)
+
+
+class ConnectFourEngine:
+    """
+    Negamax with alpha-beta, iterative deepening and a transposition table.
+    Kept for a whole game, so that the table carries over between moves.
+    """
+
+    def __init__(self, tt_size: int = TT_SIZE):
+        self.tt = TranspositionTable(tt_size)
+        self.nodes = 0
+
+    def choose_move(self, position: Position, difficulty: Difficulty, time_limit: Optional[float] = TIME_LIMIT) -> int:
+        """The column to play."""
+        self.nodes = 0
+        columns = [col for col in COLUMN_ORDER if position.can_play(col)]
+        if not columns:
+            raise ValueError("No available columns")
+        for col in columns:
+            if position.is_winning_move(col):
+                return col
+        deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        scores: List[Tuple[int, int]] = [(col, 0) for col in columns]
+        for depth in range(1, difficulty.depth + 1):
+            depth_scores = self._search_root(position, columns, depth, difficulty.margin, deadline)
+            if depth_scores is None:
+                break
+            scores = depth_scores
+            columns = [col for col, _ in sorted(scores, key=lambda item: item[1], reverse=True)]
+            if abs(max(score for _, score in scores)) > WIN - SIZE:  # the result is known
+                break
+        best = max(score for _, score in scores)
+        return random.choice([col for col, score in scores if score >= best - difficulty.margin])
+
+    def _search_root(self, position: Position, columns: List[int], depth: int, margin: int,
+                     deadline: Optional[float]) -> Optional[List[Tuple[int, int]]]:
+        scores = []
+        best = -WIN
+        for col in columns:
+            # moves that can't get within the margin of the best one only need to be proven worse
+            alpha = max(-WIN, best - margin - 1)
+            score = self._negamax(position.play(col), depth - 1, -WIN, -alpha, deadline)
+            if score is None:
+                return None
+            scores.append((col, -score))
+            best = max(best, -score)
+        return scores
+
+    def _negamax(self, position: Position, depth: int, alpha: int, beta: int, deadline: Optional[float]) -> Optional[int]:
+        """Score for the player to move, or None when time runs out."""
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+        self.nodes += 1
+        if winning_cells(position.current, position.mask) & position.playable():
+            return WIN - position.moves - 1
+        if position.moves >= SIZE - 1:  # the last move can't win as it was just checked
+            return 0
+        moves = position.non_losing_moves()
+        if not moves:
+            return -(WIN - position.moves - 2)
+        if depth <= 0:
+            return position.evaluate()
+
+        alpha_start, beta_start = alpha, beta
+        key = position.key
+        best_col = -1
+        entry = self.tt.get(key)
+        if entry is not None:
+            tt_depth, bound, tt_score, best_col = entry
+            if tt_depth >= depth:
+                if bound == EXACT:
+                    return tt_score
+                if bound == LOWER:
+                    alpha = max(alpha, tt_score)
+                elif bound == UPPER:
+                    beta = min(beta, tt_score)
+                if alpha >= beta:
+                    return tt_score
+
+        columns = [col for col in COLUMN_ORDER if moves & column_mask(col)]
+        if depth > 1:  # moves that make more threats first
+            columns.sort(key=lambda col: popcount(winning_cells(position.current | (moves & column_mask(col)), position.mask)), reverse=True)
+        if best_col in columns:
+            columns.remove(best_col)
+            columns.insert(0, best_col)
+
+        value = -WIN
+        for col in columns:
+            score = self._negamax(position.play(col), depth - 1, -beta, -alpha, deadline)
+            if score is None:
+                return None
+            score = -score
+            if score > value:
+                value = score
+                best_col = col
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        bound = UPPER if value <= alpha_start else LOWER if value >= beta_start else EXACT
+        self.tt.put(key, depth, bound, value, best_col)
+        return value
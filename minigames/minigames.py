@@ -8,6 +8,7 @@ from redbot.core.utils.chat_formatting import humanize_timedelta
 
 from minigames.base import Minigame, BaseMinigameCog
 from minigames.connect4 import ConnectFourGame
+from minigames.connect4engine import DIFFICULTIES, DEFAULT_DIFFICULTY
 from minigames.tictactoe import TicTacToeGame
 from minigames.views.replace_view import ReplaceView
 
@@ -32,13 +33,16 @@ class Minigames(BaseMinigameCog):
             "connect4_payout": 100,
             "tictactoe_payout": 10
         }
-        self.config.register_guild(**default_config)
+        self.config.register_guild(**default_config, connect4_difficulty=DEFAULT_DIFFICULTY)
         self.config.register_global(**default_config)
 
     async def is_economy_enabled(self, guild: discord.Guild) -> bool:
         economy = self.bot.get_cog("Economy")
         return economy is not None and not await self.bot.cog_disabled_in_guild(economy, guild)
 
+    async def connect4_difficulty(self, guild: discord.Guild) -> str:
+        return await self.config.guild(guild).connect4_difficulty()
+
     @commands.hybrid_command(name="tictactoe", aliases=["ttt"])
     @app_commands.describe(opponent="Invite another user to play.", bet="Optionally, bet an amount of currency.")
     @commands.guild_only()
@@ -172,6 +176,19 @@ class Minigames(BaseMinigameCog):
         await config_payout.set(payout)
         await ctx.send(f"New payout for Connect 4 is {payout} {currency}.")
 
+    @setconnect4.command(name="difficulty")
+    async def setconnect4_difficulty(self, ctx: commands.Context, difficulty: Optional[str]):
+        """Show or set how well the bot plays Connect 4: easy, normal, hard or expert."""
+        assert ctx.guild
+        if difficulty is None:
+            difficulty = await self.config.guild(ctx.guild).connect4_difficulty()
+            return await ctx.send(f"The bot plays Connect 4 on {difficulty} difficulty.")
+        difficulty = difficulty.lower()
+        if difficulty not in DIFFICULTIES:
+            return await ctx.send(f"Difficulty must be one of: {', '.join(DIFFICULTIES)}")
+        await self.config.guild(ctx.guild).connect4_difficulty.set(difficulty)
+        await ctx.send(f"The bot will now play Connect 4 on {difficulty} difficulty.")
+
 
     @commands.group(name="tictactoeset", aliases=["settictactoe", "tttset"], invoke_without_command=True)  # type: ignore
     @commands.admin_or_permissions(manage_guild=True)
@@ -7,7 +7,7 @@ from redbot.core import bank
 from redbot.core.utils.chat_formatting import humanize_number
 
 from minigames.base import BaseMinigameCog, Minigame
-from minigames.board import Board, find_lines, try_complete_line
+from minigames.board import Board, find_lines_at
 from minigames.views.minigame_view import MinigameView
 from minigames.views.invite_view import InviteView
 from minigames.views.rematch_view import RematchView
@@ -61,7 +61,7 @@ class TicTacToeGame(Minigame):
         
         self.last_interacted = datetime.now()
         self.time += 1
-        self.board._data[slot] = self.current
+        self.board.move((slot % 3, slot // 3), self.current)
         if self.check_win():
             self.winner = self.current
             await self.on_win(self.member(self.winner))
@@ -72,8 +72,8 @@ class TicTacToeGame(Minigame):
             self.current = self.opponent(self.current)
 
     async def do_turn_ai(self):
-        target = try_complete_line(self.board, self.current, Player.NONE, 3) \
-            or try_complete_line(self.board, self.opponent(self.current), Player.NONE, 3) \
+        target = self.find_winning_move(self.current) \
+            or self.find_winning_move(self.opponent(self.current)) \
             or self.get_random_unoccupied()
         await self.do_turn(self.member(self.current), target[1]*3 + target[0])
 
@@ -97,7 +97,7 @@ class TicTacToeGame(Minigame):
         self.accepted = True
 
     def check_win(self) -> bool:
-        return find_lines(self.board, self.current, 3)
+        return self.board.last_move is not None and find_lines_at(self.board, self.board.last_move, 3)
     
     def member(self, player: Player) -> discord.Member:
         if player.value < 0:
@@ -108,6 +108,19 @@ class TicTacToeGame(Minigame):
     def opponent(cls, current: Player) -> Player:
         return Player.CIRCLE if current == Player.CROSS else Player.CROSS
     
+    def find_winning_move(self, player: Player) -> Optional[Tuple[int, int]]:
+        """An empty slot that would complete a line for this player."""
+        for y in range(3):
+            for x in range(3):
+                if self.board[x, y] != Player.NONE:
+                    continue
+                self.board.move((x, y), player)
+                won = find_lines_at(self.board, (x, y), 3)
+                self.board.undo()
+                if won:
+                    return x, y
+        return None
+
     def get_random_unoccupied(self) -> Tuple[int, int]:
         empty_slots = []
         for y in range(3):
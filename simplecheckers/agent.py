@@ -2,11 +2,53 @@ import time
 import random
 import logging
 import draughts
-from typing import Optional, Tuple, Dict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from simplecheckers.bitboard import Position
+from simplecheckers.tablebase import DRAW, WIN, Tablebase
 
 log = logging.getLogger("simplecheckers.agent")
 
 INF = 10**9
+TB_WIN = INF // 2  # tablebase wins score this minus the plies left, so the fastest win is preferred
+TT_SIZE = 1 << 16  # slots
+MAX_DEPTH = 64  # plies, in practice the time limit stops the search first
+OVERRUN = 2.0  # a depth that's allowed to finish may take until this many times the time limit
+STOP_CHECK_NODES = 1024  # how often the search asks whether it should give up
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class TranspositionTable:
+    """
+    Fixed size table of search results: (depth, bound type, score, best move steps) per position.
+    A slot is replaced by deeper searches, or by anything once it is from an older search.
+    """
+
+    def __init__(self, size: int = TT_SIZE):
+        self.mask = size - 1
+        self.slots: List[Optional[tuple]] = [None] * size
+        self.age = 0
+        self.hits = 0
+        self.probes = 0
+
+    def get(self, key: int) -> Optional[tuple]:
+        self.probes += 1
+        slot = self.slots[key & self.mask]
+        if slot is not None and slot[0] == key:
+            self.hits += 1
+            return slot[2:]
+        return None
+
+    def put(self, key: int, depth: int, bound: int, score: int, best: Optional[Tuple[int, ...]]) -> None:
+        index = key & self.mask
+        slot = self.slots[index]
+        if slot is None or slot[0] == key or slot[1] != self.age or depth >= slot[2]:
+            self.slots[index] = (key, self.age, depth, bound, score, best)
+
+    def new_search(self) -> None:
+        self.age += 1
+
+    def clear(self) -> None:
+        self.slots = [None] * len(self.slots)
 
 
 class MinimaxAgent:
@@ -15,33 +57,58 @@ class MinimaxAgent:
     Asking an LLM to implement it has no intellectual merit but makes for a good player experience for minimal effort.
     """
 
-    def __init__(self, my_color: int):
+    def __init__(self, my_color: int, tt_size: int = TT_SIZE, tablebase: Optional[Tablebase] = None):
         self.my_color = my_color
         self.opp_color = draughts.WHITE if my_color == draughts.BLACK else draughts.BLACK
-        # transposition table: fen_key -> (depth, score)
-        self.tt: Dict[str, Tuple[int, int]] = {}
+        # kept between moves, so one agent should be used for the whole game
+        self.tt = TranspositionTable(tt_size)
+        self.tablebase = tablebase
+        # statistics of the last search
         self.nodes = 0
+        self.time_to_depth: Dict[int, float] = {}
+        self.should_stop: Optional[Callable[[], bool]] = None
+        self.stopped = False
 
 
-    def choose_move(self, board: draughts.Board, max_depth: int, time_limit: Optional[float] = None):
+    def choose_move(self, board: draughts.Board, max_depth: int, time_limit: Optional[float] = None,
+                    should_stop: Optional[Callable[[], bool]] = None):
+        """The move to play, or None if there is none or should_stop returned True, which means nobody wants the move anymore."""
         board = board.copy()  # just in case
+        position = Position.from_fen(board.fen)
+        self.tt.new_search()
+        self.nodes = 0
+        self.time_to_depth = {}
+        self.should_stop = should_stop
+        self.stopped = False
 
         start_time = time.time()
         deadline = start_time + time_limit if time_limit is not None else None
+        hard_deadline = start_time + time_limit * OVERRUN if time_limit is not None else None
 
         best_score = -INF
 
-        # root moves
-        root_moves = list(board.legal_moves())
+        # root moves come from pydraughts, the search uses the faster bitboard moves
+        bit_moves = {steps: (steps, captured) for steps, captured in position.legal_moves()}
+        root_moves = [m for m in board.legal_moves() if tuple(m.steps_move) in bit_moves]
+        if len(root_moves) != len(bit_moves):
+            log.warning(f"Bitboard moves differ from pydraughts in {board.fen}")
         if not root_moves:
             return None
+        if len(root_moves) == 1:  # nothing to think about
+            return root_moves[0]
+
+        # endgames the tablebase knows are played perfectly without searching
+        if self.tablebase is not None and self.tablebase.covers(position):
+            move = self._tablebase_move(position, root_moves, bit_moves)
+            if move is not None:
+                return move
 
         move_scores = []  # to collect (move, score) for the deepest completed depth
         reached_depth = 0
+        MARGIN = 20  # tweak for more/less randomness
 
         for depth in range(1, max_depth + 1):
             reached_depth = depth
-            self.nodes = 0
             depth_results = []
             depth_best_score = -INF
 
@@ -54,17 +121,18 @@ class MinimaxAgent:
 
             # allow overrun for this depth if it started with > half the time_limit remaining
             allow_overrun = time_limit is not None and time_remaining_at_depth_start is not None and time_remaining_at_depth_start > time_limit * 2.0 / 3.0
-            per_depth_deadline = deadline  # will be set to None if we choose to allow overrun
+            per_depth_deadline = deadline  # pushed back to the hard deadline if we choose to allow overrun
             overrunning = False
 
             # quick ordering function
             def quick_score(m):
-                board.push(m)
-                val = self._evaluate_simple(board)
-                board.pop()
-                return val
+                return self._evaluate(position.move(bit_moves[tuple(m.steps_move)]))
 
-            root_moves.sort(key=quick_score, reverse=(board.turn == self.my_color))
+            if move_scores:  # best moves of the previous depth first
+                previous = {id(m): score for m, score in move_scores}
+                root_moves.sort(key=lambda m: previous.get(id(m), -INF), reverse=True)
+            else:
+                root_moves.sort(key=quick_score, reverse=(board.turn == self.my_color))
 
             timed_out = False
 
@@ -72,43 +140,46 @@ class MinimaxAgent:
                 # check per-depth deadline before starting this root move
                 if per_depth_deadline is not None and time.time() > per_depth_deadline:
                     if allow_overrun and not overrunning:
-                        # disable the deadline for the rest of this depth so it can finish
+                        # push the deadline back for the rest of this depth so it can finish
                         overrunning = True
-                        per_depth_deadline = None
+                        per_depth_deadline = hard_deadline
                     else:
                         timed_out = True
                         break
 
-                board.push(m)
+                # moves that can't get within the margin of the best one only need to be proven worse
+                alpha = depth_best_score - MARGIN - 1 if depth_best_score > -INF else -INF
+                child = position.move(bit_moves[tuple(m.steps_move)])
                 score = self._alphabeta(
-                    board,
+                    child,
                     depth - 1,
-                    -INF,
+                    alpha,
                     INF,
-                    maximizing=(board.turn != self.my_color),
+                    maximizing=(child.turn == self.my_color),
                     deadline=per_depth_deadline
                 )
-                board.pop()
 
+                if score is None and self.stopped:
+                    return None
                 if score is None:
                     # If we get None, that means a time cutoff happened inside the subtree.
-                    # If we allowed overrun and haven't already disabled the deadline, disable it now
+                    # If we allowed overrun and haven't already pushed the deadline back, do it now
                     # and continue (so the rest of the depth can finish).
                     if allow_overrun and not overrunning:
                         overrunning = True
-                        per_depth_deadline = None
-                        # Re-run this move with no deadline so we get a concrete score and allow the depth to finish.
-                        board.push(m)
+                        per_depth_deadline = hard_deadline
+                        # Re-run this move with the later deadline so we get a concrete score and allow the depth to finish.
                         score = self._alphabeta(
-                            board,
+                            child,
                             depth - 1,
-                            -INF,
+                            alpha,
                             INF,
-                            maximizing=(board.turn != self.my_color),
-                            deadline=None
+                            maximizing=(child.turn == self.my_color),
+                            deadline=hard_deadline
                         )
-                        board.pop()
-                        # if still None (very unlikely), treat as timed out and break
+                        # if still None, the depth was too deep to finish, treat as timed out and break
+                        if score is None and self.stopped:
+                            return None
                         if score is None:
                             timed_out = True
                             break
@@ -124,6 +195,7 @@ class MinimaxAgent:
             if not timed_out and depth_results:
                 move_scores = depth_results
                 best_score = depth_best_score
+                self.time_to_depth[depth] = time.time() - start_time
             else:
                 break
 
@@ -132,63 +204,76 @@ class MinimaxAgent:
         
         log.debug(f"{reached_depth=}, {self.nodes=}, {best_score=}, elapsed={int((time.time() - start_time) * 1000)}ms")
 
-        MARGIN = 20  # tweak for more/less randomness
         candidates = [m for m, score in move_scores if score >= best_score - MARGIN]
         chosen = random.choice(candidates)
         return chosen
 
 
-    def _alphabeta(self, board: draughts.Board, depth: int, alpha: int, beta: int,
+    def _alphabeta(self, position: Position, depth: int, alpha: int, beta: int,
                    maximizing: bool, deadline: Optional[float]) -> Optional[int]:
         """
-        Alpha-beta search using push/pop (at calling sites). Returns score (int) or None on time cutoff.
+        Alpha-beta search over bitboard positions. Returns score (int) or None on time cutoff.
         - maximizing: True if we are maximizing for self.my_color at this node (i.e., the side to move equals agent)
         """
         # time cutoff
         if deadline is not None and time.time() > deadline:
             return None
+        if self.should_stop is not None and self.nodes % STOP_CHECK_NODES == 0 and self.should_stop():
+            self.stopped = True
+            return None
 
         self.nodes += 1
 
-        # terminal
-        if board.is_over():
-            win = board.winner()
-            if win is None:
-                return 0
-            return INF if win == self.my_color else -INF
+        if self.tablebase is not None:
+            score = self._tablebase_score(position)
+            if score is not None:
+                return score
 
         if depth == 0:
-            return self._evaluate_simple(board)
-
-        # transposition table lookup
-        # use board.fen for keying -- include side-to-move implicitly in fen if it's part of fen
-        tt_key = f"{board.fen}_{depth}_{'M' if maximizing else 'm'}"
-        if tt_key in self.tt:
-            return self.tt[tt_key][1]
-
-        moves = list(board.legal_moves())
+            # a side that can't move loses, and it can only be unable to move if it has no simple moves
+            if not position.mobility(position.turn) and not position.legal_moves():
+                return -INF if maximizing else INF
+            return self._evaluate(position)
+
+        # transposition table lookup, the hash includes the side to move, which decides maximizing
+        key = position.key
+        best_steps = None
+        entry = self.tt.get(key)
+        if entry is not None:
+            tt_depth, bound, tt_score, best_steps = entry
+            if tt_depth >= depth:
+                if bound == EXACT:
+                    return tt_score
+                if bound == LOWER:
+                    alpha = max(alpha, tt_score)
+                elif bound == UPPER:
+                    beta = min(beta, tt_score)
+                if alpha >= beta:
+                    return tt_score
+        alpha_start, beta_start = alpha, beta
+
+        moves = position.legal_moves()
         if not moves:
-            # no legal moves at non-terminal (should be handled by is_over, but be safe)
-            return -INF if board.turn != self.my_color else INF
-
-        # move ordering: shallow eval of resulting pos
-        def quick_after(move):
-            board.push(move)
-            v = self._evaluate_simple(board)
-            board.pop()
-            return v
-
-        moves.sort(key=quick_after, reverse=maximizing)
+            return -INF if maximizing else INF
+
+        # move ordering: the best move from the table first, then shallow eval of resulting pos
+        children = [(move, position.move(move)) for move in moves]
+        if depth > 1:  # at depth 1 sorting would evaluate every child twice
+            children.sort(key=lambda child: self._evaluate(child[1]), reverse=maximizing)
+        if best_steps is not None:
+            for i, (move, _) in enumerate(children):
+                if move[0] == best_steps:
+                    children.insert(0, children.pop(i))
+                    break
 
         value = -INF if maximizing else INF
+        best_move = children[0][0]
 
-        for m in moves:
+        for m, child in children:
             if deadline is not None and time.time() > deadline:
                 return None
 
-            board.push(m)
-            child_score = self._alphabeta(board, depth - 1, alpha, beta, not maximizing, deadline)
-            board.pop()
+            child_score = self._alphabeta(child, depth - 1, alpha, beta, not maximizing, deadline)
 
             if child_score is None:
                 return None  # time cutoff bubbled up
@@ -196,73 +281,57 @@ class MinimaxAgent:
             if maximizing:
                 if child_score > value:
                     value = child_score
+                    best_move = m
                 if value > alpha:
                     alpha = value
             else:
                 if child_score < value:
                     value = child_score
+                    best_move = m
                 if value < beta:
                     beta = value
 
             if alpha >= beta:
                 break
 
-        # store in tt
-        self.tt[tt_key] = (depth, value)
+        # store in tt, as a bound if the search was cut off by the window
+        bound = UPPER if value <= alpha_start else LOWER if value >= beta_start else EXACT
+        self.tt.put(key, depth, bound, value, best_move[0])
         return value
 
 
-    def _evaluate_simple(self, board: draughts.Board) -> int:
+    def _tablebase_score(self, position: Position) -> Optional[int]:
+        """Exact score of a position from the tablebase, from self.my_color's perspective, or None if it isn't there."""
+        assert self.tablebase is not None
+        probe = self.tablebase.probe(position)
+        if probe is None:
+            return None
+        result, distance = probe
+        if result == DRAW:
+            return 0
+        score = TB_WIN - distance if result == WIN else -TB_WIN + distance  # win fast, lose slowly
+        return score if position.turn == self.my_color else -score
+
+
+    def _tablebase_move(self, position: Position, root_moves: list, bit_moves: dict):
+        """One of the moves with the best tablebase score, or None if any of them is missing from the tablebase."""
+        scores = []
+        for m in root_moves:
+            child = position.move(bit_moves[tuple(m.steps_move)])
+            men, kings = child.pieces(child.turn)
+            score = INF if not men | kings else self._tablebase_score(child)  # taking the last piece wins outright
+            if score is None:
+                return None
+            scores.append((m, score))
+        best_score = max(score for _, score in scores)
+        log.debug(f"tablebase {best_score=}")
+        return random.choice([m for m, score in scores if score == best_score])
+
+
+    def _evaluate(self, position: Position) -> int:
         """
         Simple evaluation from self.my_color's perspective:
          - man = 100, king = 175
-         - mobility: small bonus for number of legal moves (signed by whose turn it is)
-         - uses str(board) to count piece characters (works with pydraughts ascii output)
+         - mobility: small bonus for number of simple moves (signed by whose turn it is)
         """
-        man_value = 100
-        king_value = 175
-
-        s = str(board)  # robust text representation; counts b/B/w/W
-        # count characters for black/white men and kings
-        my_man = 0
-        my_kings = 0
-        opp_man = 0
-        opp_kings = 0
-
-        # determine which characters correspond to which colors
-        # common prints: 'b' = black man, 'B' = black king, 'w' = white man, 'W' = white king
-        for ch in s:
-            if ch == 'b':
-                if self.my_color == draughts.BLACK:
-                    my_man += 1
-                else:
-                    opp_man += 1
-            elif ch == 'B':
-                if self.my_color == draughts.BLACK:
-                    my_kings += 1
-                else:
-                    opp_kings += 1
-            elif ch == 'w':
-                if self.my_color == draughts.WHITE:
-                    my_man += 1
-                else:
-                    opp_man += 1
-            elif ch == 'W':
-                if self.my_color == draughts.WHITE:
-                    my_kings += 1
-                else:
-                    opp_kings += 1
-
-        my_score = my_man * man_value + my_kings * king_value
-        opp_score = opp_man * man_value + opp_kings * king_value
-        material = my_score - opp_score
-
-        # mobility
-        try:
-            moves_count = len(list(board.legal_moves()))
-        except Exception:
-            moves_count = 0
-        mobility_bonus = 10 * moves_count * (1 if board.turn == self.my_color else -1)
-
-        total = material + mobility_bonus
-        return int(total)
+        return position.evaluate(self.my_color)
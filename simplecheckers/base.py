@@ -6,11 +6,17 @@ from datetime import datetime
 from redbot.core import Config, commands, bank, errors
 from redbot.core.bot import Red
 
+from simplecheckers.render import BoardImageCache, SpriteBoardRenderer
+from simplecheckers.workers import SearchWorkers
+
 
 class BaseCheckersCog(commands.Cog):
     def __init__(self, bot: Red):
         self.bot = bot
         self.games: Dict[int, BaseCheckersGame] = {}
+        self.search_workers = SearchWorkers()
+        self.board_cache = BoardImageCache()
+        self.board_renderer = SpriteBoardRenderer()
         self.config = Config.get_conf(self, identifier=766969962065)
         default_game = {
             "game": None,
@@ -25,7 +31,7 @@ class BaseCheckersCog(commands.Cog):
         }
         self.config.register_channel(**default_game)
         self.config.register_guild(**default_currency)
-        self.config.register_global(**default_currency)
+        self.config.register_global(**default_currency, search_workers=2)
 
     @abstractmethod
     async def is_economy_enabled(self, guild: discord.Guild) -> bool:
@@ -0,0 +1,245 @@
+"""
+Offline benchmark and self-play for the checkers MinimaxAgent. No Discord connection is needed.
+
+Searches a fixed set of positions from the opening to the endgame and measures nodes per second,
+time to each depth and how often the transposition table has the position, then plays seeded games between
+two agent configurations and counts wins, draws and losses of the first one, and how long each takes per move.
+Each opening is played twice with the colors swapped, so neither side gets the better openings.
+
+An agent configuration is a comma separated list of depth=N, time=SECONDS or none, tt=LOG2_SLOTS, tablebase=0 or 1.
+Games are only exactly repeatable without a time limit.
+
+Usage: python simplecheckers/benchmark.py [--depth 6] [--games 10] [--a depth=6] [--b depth=4] [--json results.json]
+"""
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import platform
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+if __name__ == "__main__":  # run as a script, without the package __init__ which loads the cog
+    package = types.ModuleType("simplecheckers")
+    package.__path__ = [str(Path(__file__).parent)]  # type: ignore
+    sys.modules.setdefault("simplecheckers", package)
+
+import draughts
+from simplecheckers.agent import MinimaxAgent
+from simplecheckers.tablebase import Tablebase
+
+VARIANT = "english"
+MAX_PLIES = 200  # a game this long is counted as a draw
+
+SEARCH_POSITIONS: List[Tuple[str, str]] = [
+    ("startpos", "B:W21,22,23,24,25,26,27,28,29,30,31,32:B1,2,3,4,5,6,7,8,9,10,11,12"),
+    ("opening", "B:W19,21,22,25,26,27,29,30,31,32:B1,11,12,13,2,3,4,5,7,8"),
+    ("middle", "B:W17,21,22,26,28,29,30,31:B1,10,12,24,4,5,6,7,9"),
+    ("trades", "B:W17,21,24,25,26,27,28:B1,15,18,20,3,4,5"),
+    ("thin", "B:W10,21,24,25,27,28:B18,19,20,4,5,9"),
+    ("kings", "B:W19,21,24,25,K2:B13,20,27,4,5,K28"),
+    ("endgame", "B:WK3,K6,K7:B13,25,4,K23,K28,K32"),
+]
+
+
+class AgentConfig(NamedTuple):
+    max_depth: int = 6
+    time_limit: Optional[float] = None
+    tt_bits: int = 16
+    tablebase: bool = False
+
+    @classmethod
+    def parse(cls, text: str) -> "AgentConfig":
+        """From something like depth=6,time=0.5,tt=16,tablebase=1"""
+        config = cls()
+        for item in filter(None, text.split(",")):
+            key, _, value = item.partition("=")
+            if key == "depth":
+                config = config._replace(max_depth=int(value))
+            elif key == "time":
+                config = config._replace(time_limit=None if value == "none" else float(value))
+            elif key == "tt":
+                config = config._replace(tt_bits=int(value))
+            elif key == "tablebase":
+                config = config._replace(tablebase=value not in ("0", "false", "no"))
+            else:
+                raise ValueError(f"Unknown agent option {key}")
+        return config
+
+    def __str__(self) -> str:
+        time_limit = "none" if self.time_limit is None else self.time_limit
+        return f"depth={self.max_depth},time={time_limit},tt={self.tt_bits},tablebase={int(self.tablebase)}"
+
+    def agent(self, color: int, tablebase: Optional[Tablebase]) -> MinimaxAgent:
+        return MinimaxAgent(color, 1 << self.tt_bits, tablebase if self.tablebase else None)
+
+
+def run_search(config: AgentConfig, tablebase: Optional[Tablebase], seed: int) -> List[Dict[str, Any]]:
+    rows = []
+    for name, fen in SEARCH_POSITIONS:
+        random.seed(seed)
+        board = draughts.Board(VARIANT, fen)
+        agent = config.agent(board.turn, tablebase)
+        start = time.perf_counter()
+        move = agent.choose_move(board, config.max_depth, config.time_limit)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "name": name,
+            "depth": max(agent.time_to_depth, default=0),
+            "best_move": move.pdn_move if move else None,
+            "nodes": agent.nodes,
+            "seconds": elapsed,
+            "nps": agent.nodes / elapsed if elapsed else 0.0,
+            "tt_hit_rate": agent.tt.hits / agent.tt.probes if agent.tt.probes else 0.0,
+            "time_to_depth": {str(depth): seconds for depth, seconds in sorted(agent.time_to_depth.items())},
+        })
+    return rows
+
+
+def play_game(configs: Tuple[AgentConfig, AgentConfig], tablebase: Optional[Tablebase],
+              opening: List[List[int]], seed: int) -> Dict[str, Any]:
+    """configs are black's and white's. The opening moves are played first, then the agents take over."""
+    random.seed(seed)
+    board = draughts.Board(VARIANT, "startpos")
+    for steps in opening:
+        board.push(draughts.Move(board, steps_move=steps))
+    agents = {draughts.BLACK: configs[0].agent(draughts.BLACK, tablebase), draughts.WHITE: configs[1].agent(draughts.WHITE, tablebase)}
+    limits = {draughts.BLACK: configs[0], draughts.WHITE: configs[1]}
+    move_times: Dict[int, List[float]] = {draughts.BLACK: [], draughts.WHITE: []}
+    while not board.is_over() and len(board.move_stack) < MAX_PLIES:
+        color = board.turn
+        start = time.perf_counter()
+        move = agents[color].choose_move(board, limits[color].max_depth, limits[color].time_limit)
+        move_times[color].append(time.perf_counter() - start)
+        if move is None:
+            break
+        board.push(move)
+    winner = board.winner() if board.is_over() else 0
+    return {
+        "winner": winner or 0,  # pydraughts colors, 0 for a draw
+        "plies": len(board.move_stack),
+        "move_times": move_times,
+    }
+
+
+def random_opening(rng: random.Random, plies: int) -> List[List[int]]:
+    board = draughts.Board(VARIANT, "startpos")
+    moves = []
+    for _ in range(plies):
+        if board.is_over():
+            break
+        move = rng.choice(board.legal_moves())
+        moves.append(list(move.steps_move))
+        board.push(move)
+    return moves
+
+
+def run_match(a: AgentConfig, b: AgentConfig, tablebase: Optional[Tablebase],
+              games: int, opening_plies: int, seed: int) -> Dict[str, Any]:
+    """Results are from the point of view of a."""
+    rng = random.Random(seed)
+    wins = draws = losses = plies = 0
+    times: Dict[str, List[float]] = {"a": [], "b": []}
+    rows = []
+    opening: List[List[int]] = []
+    for game in range(games):
+        if game % 2 == 0:
+            opening = random_opening(rng, opening_plies)
+        a_color = draughts.BLACK if game % 2 == 0 else draughts.WHITE
+        configs = (a, b) if a_color == draughts.BLACK else (b, a)
+        result = play_game(configs, tablebase, opening, seed + game)
+        if result["winner"] == 0:
+            draws += 1
+            outcome = "draw"
+        elif result["winner"] == a_color:
+            wins += 1
+            outcome = "win"
+        else:
+            losses += 1
+            outcome = "loss"
+        plies += result["plies"]
+        b_color = draughts.WHITE if a_color == draughts.BLACK else draughts.BLACK
+        times["a"].extend(result["move_times"][a_color])
+        times["b"].extend(result["move_times"][b_color])
+        rows.append({"game": game, "a_color": "black" if a_color == draughts.BLACK else "white", "opening": opening,
+                     "result": outcome, "plies": result["plies"]})
+        print(f"  game {game + 1}/{games}: a plays {rows[-1]['a_color']}, {outcome} in {result['plies']} plies")
+    return {
+        "a": str(a),
+        "b": str(b),
+        "games": games,
+        "wins": wins,
+        "draws": draws,
+        "losses": losses,
+        "score": (wins + draws / 2) / games if games else 0.0,
+        "average_plies": plies / games if games else 0.0,
+        "a_move_seconds": sum(times["a"]) / len(times["a"]) if times["a"] else 0.0,
+        "b_move_seconds": sum(times["b"]) / len(times["b"]) if times["b"] else 0.0,
+        "results": rows,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    search = report["search"]
+    print(f"\nSearch with {report['search_agent']} on Python {report['python']}")
+    print(f"{'position':<10}{'best':>8}{'depth':>6}{'nodes':>9}{'seconds':>9}{'nps':>8}{'tt hits':>9}  time to depth")
+    for row in search:
+        depths = ", ".join(f"{depth}: {seconds:.2f}s" for depth, seconds in row["time_to_depth"].items())
+        print(f"{row['name']:<10}{row['best_move'] or '-':>8}{row['depth']:>6}{row['nodes']:>9}{row['seconds']:>9.2f}"
+              f"{row['nps']:>8.0f}{row['tt_hit_rate']:>9.1%}  {depths}")
+    print(f"Total: {report['search_nodes']} nodes in {report['search_seconds']:.2f}s, {report['search_nps']:.0f} nodes/sec")
+    match = report.get("match")
+    if match:
+        print(f"\nSelf-play, a: {match['a']} against b: {match['b']}")
+        print(f"a won {match['wins']}, drew {match['draws']}, lost {match['losses']} of {match['games']} games, "
+              f"scoring {match['score']:.0%}, {match['average_plies']:.0f} plies per game")
+        print(f"Average move time: a {match['a_move_seconds']:.3f}s, b {match['b_move_seconds']:.3f}s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline search benchmark and self-play for the checkers agent.")
+    parser.add_argument("--depth", type=int, default=6, help="Search depth for the test positions.")
+    parser.add_argument("--games", type=int, default=10, help="Self-play games, 0 to skip them.")
+    parser.add_argument("--a", default="depth=6", help="Configuration of the first agent.")
+    parser.add_argument("--b", default="depth=4", help="Configuration of the second agent.")
+    parser.add_argument("--opening-plies", type=int, default=4, help="Random moves played before the agents take over.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the openings and the agents' choices.")
+    parser.add_argument("--tablebase", help="Endgame tablebase file, for configurations with tablebase=1.")
+    parser.add_argument("--json", dest="json_path", help="Write machine-readable results to this file.")
+    args = parser.parse_args(argv)
+
+    try:
+        a, b = AgentConfig.parse(args.a), AgentConfig.parse(args.b)
+    except ValueError as error:
+        parser.error(str(error))
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    search_agent = AgentConfig(max_depth=args.depth, tt_bits=a.tt_bits, tablebase=a.tablebase)
+    search = run_search(search_agent, tablebase, args.seed)
+    search_nodes = sum(row["nodes"] for row in search)
+    search_seconds = sum(row["seconds"] for row in search)
+    report: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "depth": args.depth,
+        "search_agent": str(search_agent),
+        "search": search,
+        "search_nodes": search_nodes,
+        "search_seconds": search_seconds,
+        "search_nps": search_nodes / search_seconds if search_seconds else 0.0,
+        "match": None,
+    }
+    if args.games > 0:
+        print(f"Playing {args.games} games")
+        report["match"] = run_match(a, b, tablebase, args.games, args.opening_plies, args.seed)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if tablebase:
+        tablebase.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
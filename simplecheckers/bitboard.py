@@ -0,0 +1,218 @@
+"""
+Compact English draughts positions for the agent's search, with their own move generator.
+Pieces are 32-bit masks where bit n-1 is square n of the standard numbering, black starts on squares 1-12.
+pydraughts stays the authority for the real game, and simplecheckers/test_bitboard.py checks that both generate the same moves.
+"""
+import random
+import draughts
+from typing import Dict, List, NamedTuple, Tuple
+
+BLACK, WHITE = draughts.BLACK, draughts.WHITE
+MAN_VALUE = 100
+KING_VALUE = 175
+MOBILITY_VALUE = 10
+FULL = 0xFFFFFFFF
+
+# Zobrist keys: one random number per piece and square, xored together, plus one more when white is to move
+_rand = random.Random(2024)
+ZOBRIST: Dict[str, List[int]] = {piece: [0] + [_rand.getrandbits(64) for _ in range(32)] for piece in "bBwW"}
+ZOBRIST_WHITE_TURN = _rand.getrandbits(64)
+
+# A move is its steps, as pydraughts writes them in Move.steps_move, and the mask of the pieces it captures
+BitMove = Tuple[Tuple[int, ...], int]
+
+
+def square_coords(square: int) -> Tuple[int, int]:
+    """Row and column of a square, with square 1 in the top row of the drawn board."""
+    row, index = divmod(square - 1, 4)
+    return row, 2 * index + 1 if row % 2 == 0 else 2 * index
+
+
+def _square(row: int, col: int) -> int:
+    if not 0 <= row < 8 or not 0 <= col < 8:
+        return 0
+    return row * 4 + col // 2 + 1
+
+
+def _tables(rows: Tuple[int, ...]) -> Tuple[List[List[int]], List[List[Tuple[int, int]]]]:
+    """For each square, the squares a piece moving along these row directions steps to, and (jumped, landing) pairs."""
+    steps: List[List[int]] = [[] for _ in range(33)]
+    jumps: List[List[Tuple[int, int]]] = [[] for _ in range(33)]
+    for square in range(1, 33):
+        row, col = square_coords(square)
+        for dr in rows:
+            for dc in (-1, 1):
+                if target := _square(row + dr, col + dc):
+                    steps[square].append(target)
+                    if landing := _square(row + 2 * dr, col + 2 * dc):
+                        jumps[square].append((target, landing))
+    return steps, jumps
+
+
+BLACK_STEPS, BLACK_JUMPS = _tables((1,))
+WHITE_STEPS, WHITE_JUMPS = _tables((-1,))
+KING_STEPS, KING_JUMPS = _tables((1, -1))
+BIT = [0] + [1 << (square - 1) for square in range(1, 33)]
+PROMOTION_ROW = {BLACK: 0xF0000000, WHITE: 0x0000000F}  # squares 29-32 and 1-4
+
+# Row masks to count simple moves with shifts: going down a row is +4, and +5 or +3 depending on the row
+EVEN_ROWS = 0x0F0F0F0F  # rows 0, 2, 4, 6
+ODD_ROWS = 0xF0F0F0F0
+LEFT_EDGE = 0x11111111  # first square of each row
+RIGHT_EDGE = 0x88888888
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def iter_squares(mask: int):
+    """Square numbers of the bits in a mask."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length()
+        mask ^= low
+
+
+class Position(NamedTuple):
+    black_men: int
+    black_kings: int
+    white_men: int
+    white_kings: int
+    turn: int
+    key: int  # zobrist hash
+
+    @classmethod
+    def from_fen(cls, fen: str) -> "Position":
+        """From a pydraughts fen such as W:W18,K2:B1,5"""
+        turn, *sides = fen.split(":")
+        masks = {"b": 0, "B": 0, "w": 0, "W": 0}
+        for side in sides:
+            if not side:
+                continue
+            color = side[0].lower()
+            for item in side[1:].split(","):
+                if not item:
+                    continue
+                piece = color.upper() if item.startswith("K") else color
+                first, _, last = item.lstrip("K").partition("-")
+                for square in range(int(first), int(last or first) + 1):
+                    masks[piece] |= BIT[square]
+        return cls.create(masks["b"], masks["B"], masks["w"], masks["W"], WHITE if turn == "W" else BLACK)
+
+    @classmethod
+    def create(cls, black_men: int, black_kings: int, white_men: int, white_kings: int, turn: int) -> "Position":
+        key = ZOBRIST_WHITE_TURN if turn == WHITE else 0
+        for piece, mask in zip("bBwW", (black_men, black_kings, white_men, white_kings)):
+            for square in iter_squares(mask):
+                key ^= ZOBRIST[piece][square]
+        return cls(black_men, black_kings, white_men, white_kings, turn, key)
+
+    @property
+    def occupied(self) -> int:
+        return self.black_men | self.black_kings | self.white_men | self.white_kings
+
+    def pieces(self, color: int) -> Tuple[int, int]:
+        """Men and kings of a color."""
+        return (self.black_men, self.black_kings) if color == BLACK else (self.white_men, self.white_kings)
+
+    def legal_moves(self) -> List[BitMove]:
+        """Captures are mandatory, and a capture continues while the same piece can keep jumping."""
+        men, kings = self.pieces(self.turn)
+        enemies = self.occupied & ~(men | kings)
+        empty = ~self.occupied & FULL
+        man_steps, man_jumps = (BLACK_STEPS, BLACK_JUMPS) if self.turn == BLACK else (WHITE_STEPS, WHITE_JUMPS)
+        promotion = PROMOTION_ROW[self.turn]
+        moves: List[BitMove] = []
+        for square in iter_squares(men):
+            _jump(moves, (square,), square, 0, enemies, empty | BIT[square], man_jumps, promotion)
+        for square in iter_squares(kings):
+            _jump(moves, (square,), square, 0, enemies, empty | BIT[square], KING_JUMPS, 0)
+        if moves:
+            return moves
+        for square in iter_squares(men):
+            moves.extend(((square, target), 0) for target in man_steps[square] if empty & BIT[target])
+        for square in iter_squares(kings):
+            moves.extend(((square, target), 0) for target in KING_STEPS[square] if empty & BIT[target])
+        return moves
+
+    def move(self, move: BitMove) -> "Position":
+        steps, captured = move
+        start, end = BIT[steps[0]], BIT[steps[-1]]
+        black_men, black_kings, white_men, white_kings, turn, key = self
+        key ^= ZOBRIST_WHITE_TURN
+        if captured:
+            for square in iter_squares(captured):
+                bit = BIT[square]
+                for piece, mask in (("b", black_men), ("B", black_kings), ("w", white_men), ("W", white_kings)):
+                    if mask & bit:
+                        key ^= ZOBRIST[piece][square]
+                        break
+            keep = ~captured
+            black_men, black_kings, white_men, white_kings = black_men & keep, black_kings & keep, white_men & keep, white_kings & keep
+        if turn == BLACK:
+            if black_kings & start:
+                black_kings = black_kings & ~start | end  # a king can capture its way back to the start
+                key ^= ZOBRIST["B"][steps[0]] ^ ZOBRIST["B"][steps[-1]]
+            elif end & PROMOTION_ROW[BLACK]:
+                black_men ^= start
+                black_kings |= end
+                key ^= ZOBRIST["b"][steps[0]] ^ ZOBRIST["B"][steps[-1]]
+            else:
+                black_men = black_men & ~start | end
+                key ^= ZOBRIST["b"][steps[0]] ^ ZOBRIST["b"][steps[-1]]
+        else:
+            if white_kings & start:
+                white_kings = white_kings & ~start | end  # a king can capture its way back to the start
+                key ^= ZOBRIST["W"][steps[0]] ^ ZOBRIST["W"][steps[-1]]
+            elif end & PROMOTION_ROW[WHITE]:
+                white_men ^= start
+                white_kings |= end
+                key ^= ZOBRIST["w"][steps[0]] ^ ZOBRIST["W"][steps[-1]]
+            else:
+                white_men = white_men & ~start | end
+                key ^= ZOBRIST["w"][steps[0]] ^ ZOBRIST["w"][steps[-1]]
+        return Position(black_men, black_kings, white_men, white_kings, WHITE if turn == BLACK else BLACK, key)
+
+    def mobility(self, color: int) -> int:
+        """Number of simple moves of a color, counted with shifts. Captures aren't included."""
+        men, kings = self.pieces(color)
+        empty = ~self.occupied & FULL
+        down = men | kings if color == BLACK else kings
+        up = men | kings if color == WHITE else kings
+        count = 0
+        if down:
+            count += popcount((down << 4) & empty)
+            count += popcount(((down & EVEN_ROWS & ~RIGHT_EDGE) << 5) & empty)
+            count += popcount(((down & ODD_ROWS & ~LEFT_EDGE) << 3) & empty)
+        if up:
+            count += popcount((up >> 4) & empty)
+            count += popcount(((up & EVEN_ROWS & ~RIGHT_EDGE) >> 3) & empty)
+            count += popcount(((up & ODD_ROWS & ~LEFT_EDGE) >> 5) & empty)
+        return count
+
+    def material(self, color: int) -> int:
+        men, kings = self.pieces(color)
+        return popcount(men) * MAN_VALUE + popcount(kings) * KING_VALUE
+
+    def evaluate(self, color: int) -> int:
+        """Material and mobility of the side to move, from the point of view of a color."""
+        other = WHITE if color == BLACK else BLACK
+        mobility = self.mobility(self.turn) * MOBILITY_VALUE
+        return self.material(color) - self.material(other) + (mobility if self.turn == color else -mobility)
+
+
+def _jump(moves: List[BitMove], steps: Tuple[int, ...], square: int, captured: int,
+          enemies: int, empty: int, jumps: List[List[Tuple[int, int]]], promotion: int) -> None:
+    """Adds every capture sequence continuing from a square. Captured pieces stay on the board until the move ends."""
+    found = False
+    for jumped, landing in jumps[square]:
+        if enemies & BIT[jumped] and not captured & BIT[jumped] and empty & BIT[landing]:
+            found = True
+            next_captured = captured | BIT[jumped]
+            if promotion & BIT[landing]:  # a man that becomes king ends its move
+                moves.append((steps + (landing,), next_captured))
+            else:
+                _jump(moves, steps + (landing,), landing, next_captured, enemies, empty, jumps, promotion)
+    if not found and captured:
+        moves.append((steps, captured))
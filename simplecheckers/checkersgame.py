@@ -10,8 +10,10 @@ from redbot.core.data_manager import bundled_data_path
 from redbot.core.utils.chat_formatting import humanize_number
 
 from simplecheckers.base import BaseCheckersCog, BaseCheckersGame
-from simplecheckers.agent import MinimaxAgent
+from simplecheckers.agent import MAX_DEPTH
+from simplecheckers.bitboard import Position, popcount
 from simplecheckers.utils import board_to_png
+from simplecheckers.render import board_image_key
 from simplecheckers.views.bots_view import BotsView
 from simplecheckers.views.invite_view import InviteView
 from simplecheckers.views.game_view import GameView
@@ -23,6 +25,7 @@ log = logging.getLogger("red.crab-cogs.simplecheckers")
 COLOR_WHITE = 0xDD2E44
 COLOR_BLACK = 0x000000
 COLOR_TIE = 0x78B159
+THINK_TIME = 1.0  # seconds, the agent searches as deep as it can in that time
 
 
 class CheckersGame(BaseCheckersGame):
@@ -41,6 +44,7 @@ class CheckersGame(BaseCheckersGame):
         self.last_arrows: List[int] = []
         self.winner: Optional[discord.Member] = None
         self.tie = False
+        self.search: Optional[asyncio.Future] = None
     
     def is_cancelled(self):
         return self.cancelled
@@ -52,11 +56,8 @@ class CheckersGame(BaseCheckersGame):
         return self.surrendered and self.time <= 5
 
     def count_pieces(self, color: int):
-        board_str = str(self.board)
-        if color == draughts.WHITE:
-            return board_str.count("w") + board_str.count("W")
-        else:
-            return board_str.count("b") + board_str.count("B")
+        men, kings = Position.from_fen(self.board.fen).pieces(color)
+        return popcount(men | kings)
         
     def check_ai_surrender(self):
         if self.time >= 100 and all(p.bot for p in self.players):
@@ -71,6 +72,8 @@ class CheckersGame(BaseCheckersGame):
 
     async def cancel(self, member: Optional[discord.Member]):
         self.cancelled = True
+        if self.search and not self.search.done():
+            self.search.cancel()
         if member in self.players:
             self.surrendered = member
         await self.save_state()
@@ -79,6 +82,7 @@ class CheckersGame(BaseCheckersGame):
         if self.is_finished():
             if self.cog.games.get(self.channel.id) == self:
                 del self.cog.games[self.channel.id]
+                self.cog.search_workers.release(self.channel.id)
             await self.cog.config.channel(self.channel).clear()
 
             if self.surrendered and not self.is_premature_surrender():
@@ -120,21 +124,38 @@ class CheckersGame(BaseCheckersGame):
         return True, ""
     
     async def move_engine(self):
-        agent = MinimaxAgent(self.board.turn)
-        move = await asyncio.to_thread(agent.choose_move, self.board, 6, 1.0)
-        if not move:
+        self.search = asyncio.ensure_future(self.cog.search_workers.choose_move(self.channel.id, self.board, MAX_DEPTH, THINK_TIME))
+        try:
+            steps = await self.search
+        except asyncio.CancelledError:
+            if self.cancelled:  # the game ended while the agent was thinking
+                return
+            raise
+        finally:
+            self.search = None
+        if not steps:
             raise ValueError("Agent failed to make a move")
-        move_str = " ".join(str(n) for n in move.steps_move)
+        move_str = " ".join(str(n) for n in steps)
         success, message = await self.move_user(move_str)
         if not success:
             log.error(f"Invalid agent move {move_str}")
             raise ValueError(message)
             
     async def generate_board_image(self) -> BytesIO:
-        overlay_path = str(bundled_data_path(self.cog) / "overlay.png")
         arrows = self.last_arrows if not self.is_cancelled() else []
-        b = await asyncio.to_thread(board_to_png, self.board, overlay_path, arrows)
-        return BytesIO(b)
+        key = board_image_key(self.board, arrows)
+        image = self.cog.board_cache.get(key)
+        if image is None:
+            image = await asyncio.to_thread(self._render_board, self.board.copy(), arrows)
+            self.cog.board_cache.set(key, image)
+        return BytesIO(image)
+
+    def _render_board(self, board: draughts.Board, arrows: List[int]) -> bytes:
+        try:
+            return self.cog.board_renderer.render(board, arrows)
+        except Exception:  # the old way is slower but works as long as ImageMagick does
+            log.warning("Drawing board from sprites", exc_info=True)
+            return board_to_png(board, str(bundled_data_path(self.cog) / "overlay.png"), arrows)
 
     async def update_message(self, interaction: Optional[discord.Interaction] = None):
         if not self.accepted:
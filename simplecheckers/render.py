@@ -0,0 +1,152 @@
+import draughts
+from io import BytesIO
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageDraw
+
+from simplecheckers.bitboard import Position, square_coords, iter_squares
+
+BOARD_SIZE = 512  # pixels
+SQUARE_SIZE = BOARD_SIZE // 8
+BOARD_CACHE_BYTES = 16 * 1024**2
+SUPERSAMPLE = 4  # sprites are drawn bigger and scaled down, for smooth edges
+
+# Same look as utils.board_to_svg
+LIGHT_SQUARE = "#E8D0AA"
+DARK_SQUARE = "#B87C4C"
+BLACK_FILL = "#111111"
+RED_FILL = "#DD2E44"
+ARROW_COLOR = (0x17, 0x84, 0x1E)
+ARROW_OPACITY = 0.95
+PIECE_RADIUS = 0.4
+KING_RADIUS = 0.78  # of the piece radius
+PIECE_STROKE = 3
+
+BoardImageKey = Tuple[str, Tuple[int, ...]]
+
+
+class BoardImageCache:
+    """Least recently used board images, limited by their total size in bytes."""
+
+    def __init__(self, max_bytes: int = BOARD_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images: OrderedDict[BoardImageKey, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def get(self, key: BoardImageKey) -> Optional[bytes]:
+        image = self._images.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._images.move_to_end(key)
+        return image
+
+    def set(self, key: BoardImageKey, image: bytes) -> None:
+        if len(image) > self.max_bytes:
+            return
+        if key in self._images:
+            self.bytes -= len(self._images.pop(key))
+        self._images[key] = image
+        self.bytes += len(image)
+        while self.bytes > self.max_bytes:
+            _, old = self._images.popitem(last=False)
+            self.bytes -= len(old)
+
+    def clear(self) -> None:
+        self._images.clear()
+        self.bytes = 0
+
+
+def board_image_key(board: draughts.Board, arrows: List[int]) -> BoardImageKey:
+    return board.fen, tuple(arrows)
+
+
+class SpriteBoardRenderer:
+    """
+    Draws boards that look like utils.board_to_png by pasting pieces onto a board, with PIL.
+    The board, overlay and pieces are drawn once and then reused,
+    so drawing a position only costs a few image operations and a PNG encode.
+    """
+
+    def __init__(self, overlay_path: Optional[str] = None):
+        self.background = self._draw_background()
+        self.overlay: Optional[Image.Image] = None
+        if overlay_path:
+            with Image.open(overlay_path) as overlay:
+                self.overlay = overlay.convert("RGBA").resize((BOARD_SIZE, BOARD_SIZE))
+        self.sprites: Dict[str, Image.Image] = {piece: self._draw_piece(piece) for piece in "bBwW"}
+
+    def render(self, board: draughts.Board, arrows: List[int]) -> bytes:
+        position = Position.from_fen(board.fen)
+        image = self.background.copy()
+        if arrows:
+            image.alpha_composite(self._draw_arrows(arrows))
+        for piece, mask in zip("bBwW", (position.black_men, position.black_kings, position.white_men, position.white_kings)):
+            sprite = self.sprites[piece]
+            for square in iter_squares(mask):
+                image.alpha_composite(sprite, self._corner(square))
+        if self.overlay:
+            image.alpha_composite(self.overlay)
+        buffer = BytesIO()
+        image.convert("RGB").save(buffer, "png")  # opaque by now, and RGB encodes faster and smaller
+        return buffer.getvalue()
+
+    @staticmethod
+    def _corner(square: int) -> Tuple[int, int]:
+        row, col = square_coords(square)
+        return col * SQUARE_SIZE, row * SQUARE_SIZE
+
+    @staticmethod
+    def _center(square: int) -> Tuple[float, float]:
+        row, col = square_coords(square)
+        return (col + 0.5) * SQUARE_SIZE, (row + 0.5) * SQUARE_SIZE
+
+    @staticmethod
+    def _draw_background() -> Image.Image:
+        image = Image.new("RGBA", (BOARD_SIZE, BOARD_SIZE), LIGHT_SQUARE)
+        draw = ImageDraw.Draw(image)
+        for row in range(8):
+            for col in range(8):
+                if (row + col) % 2 == 1:
+                    x, y = col * SQUARE_SIZE, row * SQUARE_SIZE
+                    draw.rectangle((x, y, x + SQUARE_SIZE - 1, y + SQUARE_SIZE - 1), fill=DARK_SQUARE)
+        return image
+
+    @staticmethod
+    def _draw_piece(piece: str) -> Image.Image:
+        fill, stroke = (BLACK_FILL, RED_FILL) if piece.lower() == "b" else (RED_FILL, BLACK_FILL)
+        size = SQUARE_SIZE * SUPERSAMPLE
+        image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        center = size / 2
+        width = PIECE_STROKE * SUPERSAMPLE
+        radii = [SQUARE_SIZE * PIECE_RADIUS * SUPERSAMPLE]
+        if piece.isupper():
+            radii.append(radii[0] * KING_RADIUS)
+        for radius in radii:
+            outer = radius + width / 2  # svg strokes are centered on the edge
+            draw.ellipse((center - outer, center - outer, center + outer, center + outer), fill=fill, outline=stroke, width=width)
+        return image.resize((SQUARE_SIZE, SQUARE_SIZE), Image.LANCZOS)
+
+    def _draw_arrows(self, arrows: List[int]) -> Image.Image:
+        """A line through the squares of the move, with a dot on each square but the last."""
+        shape = Image.new("L", (BOARD_SIZE, BOARD_SIZE), 0)
+        draw = ImageDraw.Draw(shape)
+        centers = [self._center(square) for square in arrows]
+        width = max(4.0, SQUARE_SIZE * 0.16)
+        node = max(3.0, SQUARE_SIZE * 0.08)
+        if len(centers) > 1:
+            draw.line(centers, fill=255, width=round(width), joint="curve")
+            for x, y in (centers[0], centers[-1]):  # round caps
+                draw.ellipse((x - width / 2, y - width / 2, x + width / 2, y + width / 2), fill=255)
+        for x, y in centers[:-1]:
+            draw.ellipse((x - node, y - node, x + node, y + node), fill=255)
+        layer = Image.new("RGBA", (BOARD_SIZE, BOARD_SIZE), ARROW_COLOR)
+        layer.putalpha(shape.point(lambda value: round(value * ARROW_OPACITY)))
+        return layer
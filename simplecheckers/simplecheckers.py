@@ -1,3 +1,5 @@
+import os
+import asyncio
 import logging
 import discord
 from typing import List, Optional, Union
@@ -5,10 +7,14 @@ from datetime import datetime
 
 from redbot.core import commands, app_commands, bank
 from redbot.core.bot import Red
+from redbot.core.data_manager import bundled_data_path, cog_data_path
 from redbot.core.utils.chat_formatting import humanize_timedelta
 
 from simplecheckers.base import BaseCheckersCog
 from simplecheckers.checkersgame import CheckersGame
+from simplecheckers.render import SpriteBoardRenderer
+from simplecheckers.tablebase import Tablebase, build_file
+from simplecheckers.workers import SearchWorkers, process_pool
 from simplecheckers.views.bots_view import BotsView
 from simplecheckers.views.game_view import GameView
 from simplecheckers.views.replace_view import ReplaceView
@@ -30,6 +36,8 @@ class SimpleCheckers(BaseCheckersCog):
         super().__init__(bot)
 
     async def cog_load(self):
+        self.search_workers = SearchWorkers(await self.config.search_workers(), self.tablebase_path())
+        self.board_renderer = SpriteBoardRenderer(str(bundled_data_path(self) / "overlay.png"))
         all_channels = await self.config.all_channels()
         for channel_id, config in all_channels.items():
             try:
@@ -55,6 +63,12 @@ class SimpleCheckers(BaseCheckersCog):
         for game in self.games.values():
             if game.view:
                 game.view.stop()
+        self.search_workers.shutdown()
+        self.board_cache.clear()
+
+    def tablebase_path(self) -> Optional[str]:
+        path = cog_data_path(self) / "endgame.bin"
+        return str(path) if path.exists() else None
 
     async def is_economy_enabled(self, guild: discord.Guild) -> bool:
         economy = self.bot.get_cog("Economy")
@@ -233,3 +247,60 @@ class SimpleCheckers(BaseCheckersCog):
             return await ctx.send("Payout must be a positive number or 0.")
         await config_payout.set(payout)
         await ctx.send(f"New payout for Checkers is {payout} {currency}.")
+
+    @setcheckers.command(name="workers")
+    @commands.is_owner()
+    async def setcheckers_workers(self, ctx: commands.Context, workers: Optional[int]):
+        """
+        Show or set how many processes the bot thinks its moves in.
+        With 0, it thinks in a thread of the bot itself, which slows down everything else while it thinks.
+        """
+        if workers is None:
+            return await ctx.send(f"The bot thinks in {self.search_workers.workers} processes. "
+                                  f"Games in progress: {len(self.games)}, searches that ran out of time: {self.search_workers.timeouts}")
+        if workers < 0 or workers > 16:
+            return await ctx.send("The number of processes must be between 0 and 16.")
+        await self.config.search_workers.set(workers)
+        self.search_workers.close()  # moves being thought finish in the old workers
+        self.search_workers = SearchWorkers(workers, self.tablebase_path())
+        await ctx.send(f"The bot will now think in {workers} processes." if workers else "The bot will now think in a thread.")
+
+    @setcheckers.group(name="tablebase", aliases=["endgame"], invoke_without_command=True)
+    @commands.is_owner()
+    async def setcheckers_tablebase(self, ctx: commands.Context):
+        """
+        Show the endgame tablebase used by the bot.
+        With it, the bot plays endgames with few pieces perfectly, and finishes won endgames instead of wandering around.
+        """
+        path = self.tablebase_path()
+        if path is None:
+            return await ctx.send(f"No endgame tablebase has been built. Use `{ctx.clean_prefix}setcheckers tablebase build` to build it.")
+        try:
+            tablebase = Tablebase(path)
+        except (OSError, ValueError):
+            return await ctx.send("The endgame tablebase file can't be read, build it again.")
+        await ctx.send(f"The endgame tablebase knows {len(tablebase)} positions: all with up to {tablebase.pieces} pieces, "
+                       f"and with up to {tablebase.kings} pieces if they're all kings.")
+        tablebase.close()
+
+    @setcheckers_tablebase.command(name="build")
+    async def setcheckers_tablebase_build(self, ctx: commands.Context):
+        """
+        Build the endgame tablebase in the bot's data folder.
+        It takes about a minute and half a gigabyte of memory, in a separate process.
+        """
+        path = cog_data_path(self) / "endgame.bin"
+        temp_path = path.with_suffix(".tmp")
+        async with ctx.typing():
+            loop = asyncio.get_running_loop()
+            with process_pool(1) as pool:
+                try:
+                    count = await loop.run_in_executor(pool, build_file, str(temp_path))
+                except Exception:  # the process dies if it runs out of memory
+                    log.exception("Building the checkers tablebase")
+                    return await ctx.send("Couldn't build the endgame tablebase. Check the logs for details.")
+            os.replace(temp_path, path)
+            # the workers have the old file open, start them again once they finish the moves they're thinking
+            self.search_workers.close()
+            self.search_workers = SearchWorkers(self.search_workers.workers, str(path))
+        await ctx.send(f"Built the endgame tablebase with {count} positions.")
@@ -0,0 +1,206 @@
+"""
+Endgame tablebase for English draughts: whether the side to move wins, loses or draws, and in how many plies,
+for every position with few pieces. Built locally by retrograde analysis over bitboard positions,
+and saved as a sorted array of zobrist keys plus one byte per position, which is memory-mapped to be read.
+
+    python simplecheckers/tablebase.py [--pieces 3] [--kings 4] [--output endgame.bin]
+
+By default it covers every position with up to 3 pieces, and positions with up to 4 pieces if they're all kings,
+which is where games tend to drag on. Building that takes a few minutes.
+"""
+import sys
+import mmap
+import time
+import struct
+import bisect
+import argparse
+import itertools
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+if __name__ == "__main__":  # run as a script
+    sys.path.insert(0, str(__import__("pathlib").Path(__file__).parents[1]))
+
+from simplecheckers.bitboard import BIT, BLACK, WHITE, PROMOTION_ROW, ZOBRIST_WHITE_TURN, Position, popcount
+
+MAGIC = b"CKTB"
+VERSION = 1
+HEADER = struct.Struct("<4sHBBQQ")  # magic, version, pieces, kings, zobrist check, count
+DEFAULT_PIECES = 3
+DEFAULT_KINGS = 4
+DRAW, WIN, LOSS = 0, 1, 2
+MAX_DISTANCE = 127  # plies, longer distances are stored as this
+
+Probe = Tuple[int, int]  # result for the side to move, and plies until the game ends
+
+
+def encode(result: int, distance: int) -> int:
+    distance = min(distance, MAX_DISTANCE)
+    return 0 if result == DRAW else 1 + distance if result == WIN else 128 + distance
+
+
+def decode(value: int) -> Probe:
+    if value == 0:
+        return DRAW, 0
+    return (WIN, value - 1) if value < 128 else (LOSS, value - 128)
+
+
+def covered(position: Position, pieces: int, kings: int) -> bool:
+    count = popcount(position.occupied)
+    return count <= pieces or count <= kings and not position.black_men | position.white_men
+
+
+class Tablebase:
+    """A built tablebase file, memory-mapped. Probing costs a binary search."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.pieces, self.kings, check, count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION or check != ZOBRIST_WHITE_TURN:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a tablebase for this version")
+        self.count = count
+        self._keys = memoryview(self._mmap)[HEADER.size:HEADER.size + 8 * count].cast("Q")
+        self._values = memoryview(self._mmap)[HEADER.size + 8 * count:HEADER.size + 9 * count]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def covers(self, position: Position) -> bool:
+        return covered(position, self.pieces, self.kings)
+
+    def probe(self, position: Position) -> Optional[Probe]:
+        if not self.covers(position):
+            return None
+        index = bisect.bisect_left(self._keys, position.key)  # type: ignore
+        if index == self.count or self._keys[index] != position.key:
+            return None
+        return decode(self._values[index])
+
+    def close(self) -> None:
+        self._keys.release()
+        self._values.release()
+        self._mmap.close()
+
+
+def _positions(count: int, kings_only: bool) -> List[Position]:
+    """Every position with this many pieces and both colors, with no man on the row where it would have been crowned."""
+    positions = []
+    pieces = "BW" if kings_only else "bBwW"
+    for squares in itertools.combinations(range(1, 33), count):
+        for kinds in itertools.product(pieces, repeat=count):
+            if not any(kind in "bB" for kind in kinds) or not any(kind in "wW" for kind in kinds):
+                continue
+            masks = {"b": 0, "B": 0, "w": 0, "W": 0}
+            for square, kind in zip(squares, kinds):
+                masks[kind] |= BIT[square]
+            if masks["b"] & PROMOTION_ROW[BLACK] or masks["w"] & PROMOTION_ROW[WHITE]:
+                continue
+            for turn in (BLACK, WHITE):
+                positions.append(Position.create(masks["b"], masks["B"], masks["w"], masks["W"], turn))
+    return positions
+
+
+def _solve(positions: List[Position], solved: Dict[int, int]) -> Dict[int, int]:
+    """
+    Retrograde analysis of positions whose moves lead either to each other or to already solved positions.
+    Results are found in order of distance, so wins are as short as possible and losses as long as possible.
+    """
+    index = {position.key: i for i, position in enumerate(positions)}
+    parents: List[List[int]] = [[] for _ in positions]
+    unresolved_moves = array("H", bytes(2 * len(positions)))  # moves that don't yet lead to a win for the opponent
+    resolved = bytearray(len(positions))  # encoded result, 0 while unknown
+    events: Dict[int, List[Tuple[int, int]]] = {}  # plies -> (position, result of one of its children)
+
+    for i, position in enumerate(positions):
+        moves = position.legal_moves()
+        unresolved_moves[i] = len(moves)
+        if not moves:
+            events.setdefault(0, []).append((-1 - i, LOSS))  # negative: the position itself is decided
+            continue
+        for move in moves:
+            child = position.move(move)
+            j = index.get(child.key)
+            if j is not None:
+                parents[j].append(i)
+            elif child.key in solved:
+                result, distance = decode(solved[child.key])
+                if result != DRAW:
+                    events.setdefault(distance, []).append((i, result))
+            else:  # took the last piece
+                events.setdefault(0, []).append((i, LOSS))
+
+    distance = 0
+    while events:
+        bucket = events.pop(distance, [])
+        while bucket:
+            target, child_result = bucket.pop()
+            if target < 0:  # a position decided at this distance, tell its parents
+                i = -1 - target
+                if resolved[i]:
+                    continue
+                resolved[i] = encode(child_result, distance)
+                bucket.extend((parent, child_result) for parent in parents[i])
+                continue
+            if resolved[target]:
+                continue
+            if child_result == LOSS:  # moving there wins
+                events.setdefault(distance + 1, []).append((-1 - target, WIN))
+            else:
+                unresolved_moves[target] -= 1
+                if unresolved_moves[target] == 0:  # every move loses
+                    events.setdefault(distance + 1, []).append((-1 - target, LOSS))
+        distance += 1
+
+    return {position.key: resolved[i] for i, position in enumerate(positions)}
+
+
+def build(pieces: int = DEFAULT_PIECES, kings: int = DEFAULT_KINGS, progress: Optional[Callable[[str], None]] = None) -> Dict[int, int]:
+    """Solves every covered position, smallest first, as captures only lead to fewer pieces. Returns key -> encoded result."""
+    solved: Dict[int, int] = {}
+    for count in range(2, max(pieces, kings) + 1):
+        start = time.perf_counter()
+        positions = _positions(count, kings_only=count > pieces)
+        solved.update(_solve(positions, solved))
+        if progress:
+            progress(f"{count} pieces{' (kings)' if count > pieces else ''}: {len(positions)} positions in {time.perf_counter() - start:.0f}s")
+    return solved
+
+
+def write(path: str, table: Dict[int, int], pieces: int, kings: int) -> None:
+    keys = array("Q", sorted(table))
+    values = bytes(table[key] for key in keys)
+    if sys.byteorder != "little":
+        keys.byteswap()
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, pieces, kings, ZOBRIST_WHITE_TURN, len(keys)))
+        f.write(keys.tobytes())
+        f.write(values)
+
+
+def build_file(path: str, pieces: int = DEFAULT_PIECES, kings: int = DEFAULT_KINGS) -> int:
+    """Builds and saves a tablebase, returning how many positions it has. Meant to run in another process."""
+    table = build(pieces, kings)
+    write(path, table, pieces, kings)
+    return len(table)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build an English draughts endgame tablebase.")
+    parser.add_argument("--pieces", type=int, default=DEFAULT_PIECES, help="Cover every position with up to this many pieces.")
+    parser.add_argument("--kings", type=int, default=DEFAULT_KINGS, help="Also cover positions with up to this many pieces if they're all kings.")
+    parser.add_argument("--output", default="endgame.bin", help="File to write.")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    table = build(args.pieces, args.kings, print)
+    write(args.output, table, args.pieces, args.kings)
+    results = [decode(value)[0] for value in table.values()]
+    print(f"{len(table)} positions, {results.count(WIN)} wins, {results.count(LOSS)} losses, {results.count(DRAW)} draws, "
+          f"in {time.perf_counter() - start:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+"""
+Differential check of the bitboard move generator against pydraughts, which stays the authority for the real game.
+Plays random games and compares the legal moves and the position after every move.
+
+Usage: python -m pytest simplecheckers/test_bitboard.py
+"""
+import random
+import draughts
+
+from simplecheckers.bitboard import Position
+
+SEED = 0
+GAMES = 100
+
+
+def test_same_moves_as_pydraughts():
+    rng = random.Random(SEED)
+    positions = 0
+    for _ in range(GAMES):
+        board = draughts.Board("english", "startpos")
+        position = Position.from_fen(board.fen)
+        while not board.is_over():
+            positions += 1
+            expected = {tuple(move.steps_move): move for move in board.legal_moves()}
+            generated = {steps: (steps, captured) for steps, captured in position.legal_moves()}
+            assert set(generated) == set(expected), board.fen
+            assert position == Position.from_fen(board.fen), board.fen
+            steps = rng.choice(sorted(expected))
+            board.push(expected[steps])
+            position = position.move(generated[steps])
+    assert positions > GAMES
@@ -0,0 +1,245 @@
+import site
+import struct
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+import draughts
+from pathlib import Path
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from simplecheckers.agent import MinimaxAgent
+from simplecheckers.tablebase import Tablebase
+
+log = logging.getLogger("red.crab-cogs.simplecheckers")
+
+DEADLINE_GRACE = 5  # seconds on top of the time limit before a search is considered stuck
+# Red imports cogs from this folder without adding it to sys.path, so new processes couldn't find this package
+COG_FOLDER = str(Path(__file__).parents[1])
+
+# Agents of the games searched in this process, by game and color, so their tables last between moves
+_agents: Dict[Tuple[int, int], MinimaxAgent] = {}
+# The endgame tablebase, opened once per process
+_tablebase: Optional[Tablebase] = None
+_tablebase_errors: Set[str] = set()
+# The memory where the bot writes the id of a search this process should give up on, by name
+_stop_memory: Dict[str, SharedMemory] = {}
+STOP_FORMAT = "q"
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """A pool of new processes that can import this cog."""
+    # the initializer is unpickled before it runs, so it can't come from this package either
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=site.addsitedir, initargs=(COG_FOLDER,))
+
+
+def terminate_pool(pool: ProcessPoolExecutor) -> None:
+    """Stops a pool even if its workers are busy."""
+    # there's no public way to stop a busy worker before python 3.14
+    if hasattr(pool, "terminate_workers"):
+        pool.terminate_workers()  # type: ignore
+        return
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _open_tablebase(path: Optional[str]) -> Optional[Tablebase]:
+    global _tablebase
+    if _tablebase is not None and _tablebase.path != path:
+        _tablebase.close()
+        _tablebase = None
+    if _tablebase is None and path and path not in _tablebase_errors:
+        try:
+            _tablebase = Tablebase(path)
+        except (OSError, ValueError):
+            _tablebase_errors.add(path)  # only complain once
+            log.warning(f"Couldn't open the checkers tablebase at {path}", exc_info=True)
+    return _tablebase
+
+
+def search_move(game_id: int, variant: str, fen: str, max_depth: int, time_limit: float,
+                tablebase_path: Optional[str] = None, should_stop: Optional[Callable[[], bool]] = None) -> Optional[Tuple[int, ...]]:
+    """The steps of the move the agent picks for a position, where everything passed in and out can be pickled."""
+    board = draughts.Board(variant, fen)
+    key = (game_id, board.turn)
+    if key not in _agents:
+        _agents[key] = MinimaxAgent(board.turn)
+    agent = _agents[key]
+    agent.tablebase = _open_tablebase(tablebase_path) if variant == "english" else None
+    move = agent.choose_move(board, max_depth, time_limit, should_stop)
+    return tuple(move.steps_move) if move else None
+
+
+def search_move_in_worker(game_id: int, variant: str, fen: str, max_depth: int, time_limit: float,
+                          tablebase_path: Optional[str], stop_name: str, search_id: int) -> Optional[Tuple[int, ...]]:
+    """Same as search_move, but it gives up once the bot writes search_id to the shared memory called stop_name."""
+    if stop_name not in _stop_memory:
+        _stop_memory[stop_name] = SharedMemory(stop_name)
+    buffer = _stop_memory[stop_name].buf
+    return search_move(game_id, variant, fen, max_depth, time_limit, tablebase_path,
+                       lambda: struct.unpack_from(STOP_FORMAT, buffer)[0] == search_id)
+
+
+def forget_game(game_id: int) -> None:
+    for key in [key for key in _agents if key[0] == game_id]:
+        del _agents[key]
+
+
+class _Worker:
+    """A pool of one process, and the memory it reads to know which search to give up on."""
+
+    def __init__(self):
+        self.pool = process_pool(1)
+        self.stop = SharedMemory(create=True, size=struct.calcsize(STOP_FORMAT))
+        struct.pack_into(STOP_FORMAT, self.stop.buf, 0, 0)
+        self.searches = 0  # submitted and not finished
+        self.closing = False
+        self.freed = False
+
+    def request_stop(self, search_id: int) -> None:
+        if not self.freed:
+            struct.pack_into(STOP_FORMAT, self.stop.buf, 0, search_id)
+
+    def finished(self) -> None:
+        self.searches -= 1
+        if self.closing and not self.searches:
+            self._free()
+
+    def close(self) -> None:
+        """Lets the searches it has finish, then the process exits."""
+        self.closing = True
+        self.pool.shutdown(wait=False)
+        if not self.searches:
+            self._free()
+
+    def terminate(self) -> None:
+        terminate_pool(self.pool)
+        self._free()
+
+    def _free(self) -> None:
+        if self.freed:
+            return
+        self.freed = True
+        self.stop.close()
+        try:
+            self.stop.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SearchWorkers:
+    """
+    Runs the checkers search away from the event loop.
+    With 0 workers it runs in the default thread pool like before, which holds the GIL while it thinks.
+    With more, each worker is a process, and a game keeps to the same one so its agents keep their tables.
+    A search that runs past its deadline has its process killed, and a cancelled search stops thinking.
+    """
+
+    def __init__(self, workers: int = 2, tablebase_path: Optional[str] = None):
+        self.workers = workers
+        self.tablebase_path = tablebase_path  # endgame tablebase file, each process opens it on its own
+        self.timeouts = 0
+        self._workers: List[Optional[_Worker]] = [None] * workers
+        self._games: List[Set[int]] = [set() for _ in range(workers)]
+        self._affinity: Dict[int, int] = {}
+        self._search_ids = itertools.count(1)
+        self._thread_searches = 0
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.workers > 0
+
+    async def choose_move(self, game_id: int, board: draughts.Board, max_depth: int, time_limit: float) -> Optional[Tuple[int, ...]]:
+        args = (game_id, board.variant, board.fen, max_depth, time_limit, self.tablebase_path)
+        if not self.uses_processes:
+            return await self._choose_move_in_thread(*args)
+        index = self._worker_for(game_id)
+        worker = self._workers[index]
+        if worker is None:
+            worker = self._workers[index] = _Worker()
+        search_id = next(self._search_ids)
+        loop = asyncio.get_running_loop()
+        worker.searches += 1
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(worker.pool, search_move_in_worker, *args, worker.stop.name, search_id),
+                                          time_limit + DEADLINE_GRACE)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            log.warning(f"Checkers search took longer than {time_limit + DEADLINE_GRACE} seconds, restarting worker {index}")
+            self._terminate(index, worker)
+            raise
+        except BrokenProcessPool:
+            log.warning(f"Checkers worker {index} died, restarting it")
+            self._terminate(index, worker)
+            raise
+        except asyncio.CancelledError:
+            worker.request_stop(search_id)  # otherwise the process keeps thinking about a move nobody wants
+            raise
+        finally:
+            worker.finished()
+
+    async def _choose_move_in_thread(self, *args) -> Optional[Tuple[int, ...]]:
+        stop = threading.Event()
+        self._thread_searches += 1
+        try:
+            return await asyncio.to_thread(search_move, *args, stop.is_set)
+        except asyncio.CancelledError:
+            stop.set()  # the thread can't be killed, but it can stop thinking
+            raise
+        finally:
+            self._thread_searches -= 1
+
+    def release(self, game_id: int) -> None:
+        """Call when a game ends, so that its agents are freed."""
+        if not self.uses_processes:
+            forget_game(game_id)
+            return
+        index = self._affinity.pop(game_id, None)
+        if index is None:
+            return
+        self._games[index].discard(game_id)
+        worker = self._workers[index]
+        if worker is not None:
+            try:
+                worker.pool.submit(forget_game, game_id)
+            except RuntimeError:  # shut down
+                pass
+
+    def close(self) -> None:
+        """Stops taking searches, but lets the ones in progress finish, for when new workers replace these."""
+        for index, worker in enumerate(self._workers):
+            if worker is not None:
+                self._workers[index] = None
+                worker.close()
+        if not self.uses_processes:
+            _agents.clear()  # the searches in progress hold on to their agents
+            if not self._thread_searches:  # otherwise the next search with another file replaces it
+                _open_tablebase(None)
+
+    def shutdown(self) -> None:
+        """Stops everything right away, searches in progress included."""
+        for index, worker in enumerate(self._workers):
+            if worker is not None:
+                self._terminate(index, worker)
+        if not self.uses_processes:
+            _agents.clear()
+            _open_tablebase(None)
+
+    def _worker_for(self, game_id: int) -> int:
+        if game_id not in self._affinity:
+            index = min(range(self.workers), key=lambda i: len(self._games[i]))
+            self._affinity[game_id] = index
+            self._games[index].add(game_id)
+        return self._affinity[game_id]
+
+    def _terminate(self, index: int, worker: _Worker) -> None:
+        if self._workers[index] is worker:
+            self._workers[index] = None
+        # the agents of this worker's games are gone with it, they'll start over in the new process
+        worker.terminate()
@@ -1,5 +1,6 @@
 import chess
 import chess.engine
+import chess.polyglot
 import discord
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Tuple, Union
@@ -7,14 +8,26 @@ from datetime import datetime
 from redbot.core import Config, commands, bank, errors
 from redbot.core.bot import Red
 
+from simplechess.enginepool import EnginePool
+from simplechess.render import BoardImageCache, SpriteBoardRenderer
+from simplechess.thinktime import ThinkTimeScheduler
+from simplechess.utils import svg_to_png
+
 
 class BaseChessCog(commands.Cog):
     def __init__(self, bot: Red):
         self.bot = bot
         self.games: Dict[int, BaseChessGame] = {}
-        self.engine: Optional[chess.engine.UciProtocol] = None
+        self.engine_pools: Dict[str, EnginePool] = {}
+        self.opening_book: Optional[chess.polyglot.MemoryMappedReader] = None
+        self.book_depth = 10
+        self.board_cache = BoardImageCache()
+        self.think_time = ThinkTimeScheduler()
+        self.board_renderer = SpriteBoardRenderer(svg_to_png)
         self.config = Config.get_conf(self, identifier=766969962064)
         default_game = {
+            "state": None,  # the whole game as one record, see ChessGame.to_record
+            # older versions saved each of these separately, they're only read to restore those games
             "game": None,
             "message": 0,
             "players": [],
@@ -25,13 +38,17 @@ class BaseChessCog(commands.Cog):
             "payout": 500,
         }
         self.config.register_channel(**default_game)
-        self.config.register_guild(**default_currency)
-        self.config.register_global(**default_currency)
+        self.config.register_guild(**default_currency, engine="sunfish")
+        self.config.register_global(**default_currency, engine_workers=2, book_path=None, book_depth=10, expire_days=30, engine_budget=30)
         
     @abstractmethod
     async def is_economy_enabled(self, guild: discord.Guild) -> bool:
         pass
 
+    @abstractmethod
+    async def get_engine_pool(self, guild: discord.Guild) -> EnginePool:
+        pass
+
     @abstractmethod
     async def chess_new(self,
                         ctx: Union[commands.Context, discord.Interaction],
@@ -92,6 +109,10 @@ class BaseChessGame(ABC):
     async def save_state(self) -> None:
         pass
 
+    @abstractmethod
+    async def flush_state(self) -> None:
+        pass
+
     def member(self, color: chess.Color) -> discord.Member:
         return self.players[1] if color == chess.BLACK else self.players[0]
     
@@ -0,0 +1,325 @@
+"""
+Offline benchmark for the bundled engines. No Discord connection is needed.
+
+Counts perft on the standard perft positions and compares them against the known numbers, which catches
+move generation bugs in Position.gen_moves/move, then measures nodes per second and time to each depth
+of a search over a fixed set of middlegame and endgame positions, for sunfish and for the bitboard engine.
+Any perft mismatch fails the run, and so does the bitboard engine taking longer than sunfish to reach the depth.
+With --games, the two engines also play each other from the same positions with a fixed time per move.
+
+Results can be saved with --json and later passed to --compare, which fails the run if the search got slower.
+
+Usage: python simplechess/benchmark.py [--depth 4] [--perft-extra 0] [--games 0] [--movetime 200]
+                                       [--json results.json] [--compare old.json]
+"""
+import sys
+import json
+import time
+import types
+import argparse
+import platform
+import importlib.util
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DATA_PATH = Path(__file__).parent / "data"
+# The engine starts its UCI loop when run, so it is loaded without that part
+SUNFISH_UCI_HOOK = "# minifier-hide start\nimport sys"
+
+# name, fen, known perft counts starting at depth 1, default depth
+PERFT_POSITIONS: List[Tuple[str, str, List[int], int]] = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281], 3),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862], 2),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238], 3),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467], 2),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379], 2),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890], 2),
+]
+
+SEARCH_POSITIONS: List[Tuple[str, str]] = [
+    ("opening", "r1bq1rk1/pp2b1pp/n1pp1n2/3P1p2/2P1p3/2N1P2N/PP2BPPP/R1BQK2R b KQ - 1 9"),
+    ("castled", "r3k2r/2pb1ppp/2pp1q2/p7/1nP1B3/1P2P3/P2N1PPP/R2QK2R w KQkq a6 0 14"),
+    ("closed", "4rrk1/2p1b1p1/p1p3q1/4p3/2P2n1p/1P1NR2P/PB3PP1/3R1QK1 b - - 2 24"),
+    ("attack", "r3qbrk/6p1/2b2pPp/p3pP1Q/PpPpP2P/3P1B2/2PB3K/R5R1 w - - 16 42"),
+    ("queens", "6k1/1R3p2/6p1/2Bp3p/3P2q1/P7/1P2rQ1K/5R2 b - - 4 44"),
+    ("rooks", "7r/2p3k1/1p1p1qp1/1P1Bp3/p1P2r1P/P7/4R3/Q4RK1 w - - 0 36"),
+    ("pawns", "8/8/1p2k1p1/3p3p/1p1P1P1P/1P2PK2/8/8 w - - 3 54"),
+]
+
+
+def load_engine() -> Tuple[types.ModuleType, types.ModuleType]:
+    """Loads the bundled sunfish and its UCI helpers as modules."""
+    sunfish = types.ModuleType("sunfish")
+    sunfish.__file__ = str(DATA_PATH / "sunfish.py")
+    source = (DATA_PATH / "sunfish.py").read_text(encoding="utf-8").split(SUNFISH_UCI_HOOK)[0]
+    exec(compile(source, sunfish.__file__, "exec"), sunfish.__dict__)
+    spec = importlib.util.spec_from_file_location("sunfish_uci", DATA_PATH / "uci.py")
+    assert spec and spec.loader
+    uci = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(uci)
+    uci.sunfish = sunfish  # type: ignore
+    return sunfish, uci
+
+
+def load_bitboard_engine() -> types.ModuleType:
+    """Loads the bundled python-chess engine as a module, its UCI loop only runs as a script."""
+    spec = importlib.util.spec_from_file_location("bitboard", DATA_PATH / "bitboard.py")
+    assert spec and spec.loader
+    bitboard = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bitboard)
+    return bitboard
+
+
+def perft(uci: types.ModuleType, pos: Any, depth: int) -> int:
+    """Legal move count, skipping moves that leave the king capturable, like uci.perft."""
+    if uci.can_kill_king(pos):
+        return -1
+    if depth == 0:
+        return 1
+    total = 0
+    for move in pos.gen_moves():
+        count = perft(uci, pos.move(move), depth - 1)
+        if count != -1:
+            total += count
+    return total
+
+
+def run_perft(uci: types.ModuleType, extra_depth: int) -> List[Dict[str, Any]]:
+    rows = []
+    for name, fen, expected, default_depth in PERFT_POSITIONS:
+        depth = min(default_depth + extra_depth, len(expected))
+        pos = uci.from_fen(*fen.split())
+        start = time.perf_counter()
+        nodes = perft(uci, pos, depth)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "name": name,
+            "depth": depth,
+            "nodes": nodes,
+            "expected": expected[depth - 1],
+            "ok": nodes == expected[depth - 1],
+            "seconds": elapsed,
+            "nps": nodes / elapsed if elapsed else 0.0,
+        })
+    return rows
+
+
+def run_search(sunfish: types.ModuleType, uci: types.ModuleType, max_depth: int) -> List[Dict[str, Any]]:
+    rows = []
+    for name, fen in SEARCH_POSITIONS:
+        pos = uci.from_fen(*fen.split())
+        searcher = sunfish.Searcher()
+        finished_at: Dict[int, float] = {}
+        nodes_at: Dict[int, int] = {}
+        best = None
+        start = time.perf_counter()
+        for depth, gamma, score, move in searcher.search([pos]):
+            if depth > max_depth:
+                break
+            finished_at[depth] = time.perf_counter() - start
+            nodes_at[depth] = searcher.nodes
+            if score >= gamma and move:
+                best = uci.render_move(move, uci.get_color(pos) == uci.WHITE)
+        elapsed = finished_at.get(max_depth, time.perf_counter() - start)
+        nodes = nodes_at.get(max_depth, searcher.nodes)
+        rows.append({
+            "name": name,
+            "depth": max_depth,
+            "best_move": best,
+            "nodes": nodes,
+            "seconds": elapsed,
+            "nps": nodes / elapsed if elapsed else 0.0,
+            "time_to_depth": {str(depth): seconds for depth, seconds in sorted(finished_at.items())},
+        })
+    return rows
+
+
+def run_bitboard_search(bitboard: types.ModuleType, max_depth: int) -> List[Dict[str, Any]]:
+    import chess
+    rows = []
+    for name, fen in SEARCH_POSITIONS:
+        searcher = bitboard.Searcher()
+        finished_at: Dict[int, float] = {}
+        nodes_at: Dict[int, int] = {}
+        best = None
+        start = time.perf_counter()
+        for depth, score, pv in searcher.search(chess.Board(fen), max_depth):
+            finished_at[depth] = time.perf_counter() - start
+            nodes_at[depth] = searcher.nodes
+            best = pv[0].uci() if pv else best
+        elapsed = finished_at.get(max_depth, time.perf_counter() - start)
+        nodes = nodes_at.get(max_depth, searcher.nodes)
+        rows.append({
+            "name": name,
+            "depth": max_depth,
+            "best_move": best,
+            "nodes": nodes,
+            "seconds": elapsed,
+            "nps": nodes / elapsed if elapsed else 0.0,
+            "time_to_depth": {str(depth): seconds for depth, seconds in sorted(finished_at.items())},
+        })
+    return rows
+
+
+def compare_time_to_depth(sunfish_rows: List[Dict[str, Any]], bitboard_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Total time both engines took to finish each depth over all positions."""
+    rows = []
+    depths = sorted({int(depth) for row in sunfish_rows + bitboard_rows for depth in row["time_to_depth"]})
+    for depth in depths:
+        sunfish_seconds = [row["time_to_depth"].get(str(depth)) for row in sunfish_rows]
+        bitboard_seconds = [row["time_to_depth"].get(str(depth)) for row in bitboard_rows]
+        if None in sunfish_seconds or None in bitboard_seconds:
+            continue  # a search ended early, usually with a mate
+        sunfish_total, bitboard_total = sum(sunfish_seconds), sum(bitboard_seconds)
+        rows.append({
+            "depth": depth,
+            "sunfish_seconds": sunfish_total,
+            "bitboard_seconds": bitboard_total,
+            "ratio": bitboard_total / sunfish_total if sunfish_total else 0.0,
+        })
+    return rows
+
+
+def sunfish_move(sunfish: types.ModuleType, uci: types.ModuleType, board: Any, movetime: float) -> str:
+    """The move sunfish picks for a python-chess board in about movetime seconds, like its UCI loop does."""
+    pos = uci.from_fen(*board.fen().split())
+    best = None
+    start = time.perf_counter()
+    for depth, gamma, score, move in sunfish.Searcher().search([pos]):
+        if score >= gamma and move:
+            best = uci.render_move(move, uci.get_color(pos) == uci.WHITE)
+        if best and time.perf_counter() - start > movetime:
+            break
+    return best or next(iter(board.legal_moves)).uci()
+
+
+def bitboard_move(searcher: Any, board: Any, movetime: float) -> str:
+    best = None
+    for depth, score, pv in searcher.search(board, movetime=movetime):
+        best = pv[0] if pv else best
+    return (best or next(iter(board.legal_moves))).uci()
+
+
+def run_match(sunfish: types.ModuleType, uci: types.ModuleType, bitboard: types.ModuleType,
+              games: int, movetime: float, max_plies: int = 200) -> Dict[str, Any]:
+    """Games between the engines from the search positions, with each side played by both. Unfinished games are draws."""
+    import chess
+    wins = draws = losses = 0
+    for game in range(games):
+        name, fen = SEARCH_POSITIONS[game // 2 % len(SEARCH_POSITIONS)]
+        board = chess.Board(fen)
+        bitboard_color = board.turn if game % 2 == 0 else not board.turn
+        searcher = bitboard.Searcher()
+        while not board.is_game_over(claim_draw=True) and len(board.move_stack) < max_plies:
+            if board.turn == bitboard_color:
+                board.push_uci(bitboard_move(searcher, board, movetime))
+            else:
+                board.push_uci(sunfish_move(sunfish, uci, board, movetime))
+        outcome = board.outcome(claim_draw=True)
+        if outcome is None or outcome.winner is None:
+            draws += 1
+        elif outcome.winner == bitboard_color:
+            wins += 1
+        else:
+            losses += 1
+        print(f"Game {game + 1}/{games} from {name}, bitboard engine as {chess.COLOR_NAMES[bitboard_color]}: "
+              f"{board.result(claim_draw=True) if outcome else 'unfinished'}")
+    return {"games": games, "movetime": movetime, "wins": wins, "draws": draws, "losses": losses}
+
+
+def print_search(title: str, rows: List[Dict[str, Any]]) -> None:
+    nodes = sum(row["nodes"] for row in rows)
+    seconds = sum(row["seconds"] for row in rows)
+    print(f"\n{title}")
+    print(f"{'position':<12}{'best':>7}{'nodes':>10}{'seconds':>9}{'nps':>9}  time to depth")
+    for row in rows:
+        depths = ", ".join(f"{depth}: {seconds:.2f}s" for depth, seconds in row["time_to_depth"].items())
+        print(f"{row['name']:<12}{row['best_move'] or '-':>7}{row['nodes']:>10}{row['seconds']:>9.2f}{row['nps']:>9.0f}  {depths}")
+    print(f"Total: {nodes} nodes in {seconds:.2f}s, {nodes / seconds if seconds else 0:.0f} nodes/sec")
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{report['engine']} on Python {report['python']}")
+    print("\nPerft")
+    print(f"{'position':<12}{'depth':>6}{'nodes':>10}{'expected':>10}{'ok':>5}{'seconds':>9}{'nps':>9}")
+    for row in report["perft"]:
+        print(f"{row['name']:<12}{row['depth']:>6}{row['nodes']:>10}{row['expected']:>10}{'yes' if row['ok'] else 'NO':>5}"
+              f"{row['seconds']:>9.2f}{row['nps']:>9.0f}")
+    print_search(f"Sunfish search to depth {report['depth']}", report["search"])
+    if report.get("bitboard_search"):
+        print_search(f"Bitboard engine search to depth {report['depth']}", report["bitboard_search"])
+        print("\nTime to depth, all positions")
+        print(f"{'depth':<7}{'sunfish':>9}{'bitboard':>10}{'ratio':>8}")
+        for row in report["time_to_depth"]:
+            print(f"{row['depth']:<7}{row['sunfish_seconds']:>9.2f}{row['bitboard_seconds']:>10.2f}{row['ratio']:>7.2f}x")
+    if report.get("match"):
+        match = report["match"]
+        print(f"\nBitboard engine against sunfish at {match['movetime'] * 1000:.0f}ms per move: "
+              f"{match['wins']} wins, {match['draws']} draws, {match['losses']} losses")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Prints the change in search speed against an older report. Returns whether it's within the tolerance."""
+    old_rows = {row["name"]: row for row in baseline.get("search", [])}
+    print(f"\nCompared to {baseline.get('engine')} at depth {baseline.get('depth')}")
+    for row in report["search"]:
+        old = old_rows.get(row["name"])
+        if old and old["seconds"]:
+            print(f"  {row['name']:<12} {row['seconds'] / old['seconds']:>6.2f}x time, {row['nodes'] / max(old['nodes'], 1):>6.2f}x nodes")
+    if not baseline.get("search_seconds") or baseline.get("depth") != report["depth"]:
+        print("  Not comparable, the depth differs")
+        return True
+    ratio = report["search_seconds"] / baseline["search_seconds"]
+    print(f"  Total: {ratio:.2f}x time")
+    return ratio <= 1 + tolerance
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline perft and search speed benchmark for the bundled engines.")
+    parser.add_argument("--depth", type=int, default=4, help="Search depth for the test positions.")
+    parser.add_argument("--perft-extra", type=int, default=0, help="Count perft this many plies deeper than the defaults.")
+    parser.add_argument("--json", dest="json_path", help="Write machine-readable results to this file.")
+    parser.add_argument("--no-bitboard", action="store_true", help="Skip the bitboard engine, which needs python-chess.")
+    parser.add_argument("--games", type=int, default=0, help="Play this many games between the engines.")
+    parser.add_argument("--movetime", type=int, default=200, help="Milliseconds per move in those games.")
+    parser.add_argument("--compare", help="Results of an earlier run to compare the search speed against.")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed slowdown against --compare, and of the bitboard engine against sunfish, as a fraction.")
+    args = parser.parse_args(argv)
+
+    sunfish, uci = load_engine()
+    search = run_search(sunfish, uci, args.depth)
+    search_nodes = sum(row["nodes"] for row in search)
+    search_seconds = sum(row["seconds"] for row in search)
+    report = {
+        "python": platform.python_version(),
+        "engine": sunfish.version,
+        "depth": args.depth,
+        "perft": run_perft(uci, args.perft_extra),
+        "search": search,
+        "search_nodes": search_nodes,
+        "search_seconds": search_seconds,
+        "search_nps": search_nodes / search_seconds if search_seconds else 0.0,
+    }
+    if not args.no_bitboard:
+        bitboard = load_bitboard_engine()
+        report["bitboard_search"] = run_bitboard_search(bitboard, args.depth)
+        report["time_to_depth"] = compare_time_to_depth(search, report["bitboard_search"])
+        if args.games:
+            report["match"] = run_match(sunfish, uci, bitboard, args.games, args.movetime / 1000)
+    print_report(report)
+    ok = all(row["ok"] for row in report["perft"])
+    if report.get("time_to_depth") and report["time_to_depth"][-1]["ratio"] > 1 + args.tolerance:
+        print(f"\nThe bitboard engine is slower than sunfish to depth {report['time_to_depth'][-1]['depth']}")
+        ok = False
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            ok = compare(report, json.load(f), args.tolerance) and ok
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,13 +4,14 @@ import discord
 import chess
 import chess.svg
 from io import BytesIO
-from typing import List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 from datetime import datetime
 from redbot.core import bank
 from redbot.core.utils.chat_formatting import humanize_number
 
 from simplechess.base import BaseChessCog, BaseChessGame
 from simplechess.utils import svg_to_png
+from simplechess.render import BOARD_SIZE, board_image_key
 from simplechess.views.bots_view import BotsView
 from simplechess.views.invite_view import InviteView
 from simplechess.views.game_view import GameView
@@ -22,6 +23,7 @@ log = logging.getLogger("red.crab-cogs.simplechess")
 COLOR_WHITE = 0xffffff
 COLOR_BLACK = 0x000000
 COLOR_TIE = 0x78B159
+SAVE_DELAY = 2  # seconds, changes made within this time are saved together
 
 
 class ChessGame(BaseChessGame):
@@ -39,6 +41,41 @@ class ChessGame(BaseChessGame):
         self.last_board = self.board.copy()
         self.winner: Optional[discord.Member] = None
         self.tie = False
+        self.out_of_book = False
+        self.dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._save_lock = asyncio.Lock()
+
+    @classmethod
+    def from_record(cls,
+                    cog: BaseChessCog,
+                    players: List[discord.Member],
+                    channel: Union[discord.TextChannel, discord.Thread],
+                    record: Dict[str, Any]
+                    ) -> "ChessGame":
+        game = cls(cog, players, channel, record["fen"], record["depth"], record["bet"])
+        game.accepted = game.init_done = record.get("accepted", True)  # bets are taken when an invite is accepted
+        for move in record["moves"].split():
+            game.board.push_uci(move)
+        game.last_board = game.board.copy()
+        if game.last_board.move_stack:
+            game.last_board.pop()
+        if record.get("last_interacted"):
+            game.last_interacted = datetime.fromtimestamp(record["last_interacted"])
+        return game
+
+    def to_record(self) -> Dict[str, Any]:
+        """The game as a single config value, so that saving it is one write."""
+        return {
+            "fen": self.board.root().fen(),
+            "moves": " ".join(move.uci() for move in self.board.move_stack),
+            "players": [player.id for player in self.players],
+            "depth": self.limit.depth,
+            "bet": self.bet,
+            "message": self.message.id if self.message else 0,
+            "last_interacted": self.last_interacted.timestamp(),
+            "accepted": self.accepted,
+        }
 
     def is_cancelled(self):
         return self.cancelled
@@ -71,7 +108,14 @@ class ChessGame(BaseChessGame):
         if self.is_finished():
             if self.cog.games.get(self.channel.id) == self:
                 del self.cog.games[self.channel.id]
-            await self.cog.config.channel(self.channel).clear()
+                for pool in self.cog.engine_pools.values():
+                    pool.release(self.channel.id)
+            self.dirty = False
+            if self._save_task:
+                self._save_task.cancel()
+                self._save_task = None
+            async with self._save_lock:
+                await self.cog.config.channel(self.channel).clear()
             
             if self.surrendered and not self.is_premature_surrender():
                 self.winner = self.players[1] if self.players.index(self.surrendered) == 0 else self.players[0]
@@ -83,10 +127,31 @@ class ChessGame(BaseChessGame):
             await self._on_win(self.winner)
             
         else:
-            await self.cog.config.channel(self.channel).game.set(self.board.fen())
-            await self.cog.config.channel(self.channel).depth.set(self.limit.depth)
-            await self.cog.config.channel(self.channel).players.set([player.id for player in self.players])
-            await self.cog.config.channel(self.channel).bet.set(self.bet)
+            self._schedule_save()
+
+    def _schedule_save(self):
+        """Marks the game as changed. It's written a moment later, together with any other changes made until then."""
+        self.dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(SAVE_DELAY)
+        self._save_task = None
+        try:
+            await self.flush_state()
+        except Exception:
+            log.error(f"Saving game in {self.channel.id}", exc_info=True)
+
+    async def flush_state(self):
+        if self._save_task:
+            self._save_task.cancel()
+            self._save_task = None
+        async with self._save_lock:
+            if not self.dirty or self.is_finished():
+                return
+            self.dirty = False
+            await self.cog.config.channel(self.channel).set({"state": self.to_record()})
 
     async def move_user(self, san_or_uci: str) -> Tuple[bool, str]:
         try:
@@ -104,9 +169,29 @@ class ChessGame(BaseChessGame):
         await self.do_move(move)
         return True, ""
     
+    def book_move(self) -> Optional[chess.Move]:
+        book = self.cog.opening_book
+        if book is None or self.out_of_book or self.board.fullmove_number > self.cog.book_depth:
+            return None
+        try:
+            return book.weighted_choice(self.board).move
+        except IndexError:  # once out of the book, there's no way back in
+            self.out_of_book = True
+            return None
+
     async def move_engine(self):
-        assert self.cog.engine
-        result = await self.cog.engine.play(self.board, limit=self.limit)
+        if move := self.book_move():
+            await self.do_move(move)
+            return
+        legal_moves = list(self.board.legal_moves)
+        if len(legal_moves) == 1:  # nothing to think about
+            await self.do_move(legal_moves[0])
+            return
+        pool = await self.cog.get_engine_pool(self.channel.guild)
+        spectator = all(player.bot for player in self.players)
+        limit = self.cog.think_time.limit(self.board, self.limit, pool.queue_depth, spectator)
+        result = await pool.play(self.channel.id, self.board, limit=limit)
+        self.cog.think_time.record(result.info.get("time", limit.time or 0))
         if result.move:
             await self.do_move(result.move)
         else:
@@ -115,11 +200,22 @@ class ChessGame(BaseChessGame):
     async def generate_board_image(self) -> BytesIO:
         is_finished = self.is_finished()
         lastmove = self.board.peek() if self.board.move_stack and not is_finished else None
-        arrows = [(lastmove.from_square, lastmove.to_square)] if lastmove and not is_finished else []
         check = self.board.king(self.board.turn) if self.board.is_check() and not is_finished else None
-        svg = chess.svg.board(self.board, lastmove=lastmove, check=check, arrows=arrows, size=512)
-        b = await asyncio.to_thread(svg_to_png, svg)
-        return BytesIO(b or b'')
+        key = board_image_key(self.board, lastmove, check)
+        image = self.cog.board_cache.get(key)
+        if image is None:
+            image = await asyncio.to_thread(self._render_board, self.board.copy(stack=False), lastmove, check)
+            self.cog.board_cache.set(key, image)
+        return BytesIO(image)
+
+    def _render_board(self, board: chess.Board, lastmove: Optional[chess.Move], check: Optional[chess.Square]) -> bytes:
+        try:
+            return self.cog.board_renderer.render(board, lastmove, check)
+        except Exception:  # the old way is slower but works as long as ImageMagick does
+            log.warning("Drawing board from sprites", exc_info=True)
+            arrows = [(lastmove.from_square, lastmove.to_square)] if lastmove else []
+            svg = chess.svg.board(board, lastmove=lastmove, check=check, arrows=arrows, size=BOARD_SIZE)
+            return svg_to_png(svg) or b''
 
     async def update_message(self, interaction: Optional[discord.Interaction] = None):
         content = f"{self.players[0].mention} you're being invited to play chess." if not self.accepted else ""
@@ -205,4 +301,5 @@ class ChessGame(BaseChessGame):
                     pass
 
         self.view = view
-        await self.cog.config.channel(self.channel).message.set(self.message.id if self.message else 0)
+        if not self.is_finished():
+            self._schedule_save()
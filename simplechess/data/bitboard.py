@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+# Alternative engine for SimpleChess, built on the bitboard move generation of python-chess.
+# Alpha-beta with iterative deepening, a transposition table, quiescence search and an
+# incrementally updated piece-square evaluation and zobrist hash. Speaks the same subset of UCI as sunfish.
+
+import time
+import random
+import threading
+import chess
+from functools import partial
+
+print = partial(print, flush=True)
+
+version = "crab bitboard 1.0"
+
+MATE = 100_000
+MATE_BOUND = MATE - 1000
+EXACT, LOWER, UPPER = 0, 1, 2
+ENTRY_BYTES = 200  # rough size of a transposition table entry in memory
+CHECK_EVERY = 1024  # nodes between time checks
+FUTILITY_MARGIN = 150  # centipawns a quiet move is assumed to gain at most, per ply left
+DELTA_MARGIN = 200  # centipawns a capture in the quiescence search is assumed to gain on top of the piece taken
+
+# Transposition table size in MB, exposed as the Hash option
+Hash = 16
+
+# Simplified evaluation function by Tomasz Michniewski, tables from a8 to h1 for white
+PIECE_VALUES = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 20000}
+PIECE_TABLES = {
+    chess.PAWN: (
+         0,  0,  0,  0,  0,  0,  0,  0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+         5,  5, 10, 25, 25, 10,  5,  5,
+         0,  0,  0, 20, 20,  0,  0,  0,
+         5, -5,-10,  0,  0,-10, -5,  5,
+         5, 10, 10,-20,-20, 10, 10,  5,
+         0,  0,  0,  0,  0,  0,  0,  0),
+    chess.KNIGHT: (
+        -50,-40,-30,-30,-30,-30,-40,-50,
+        -40,-20,  0,  0,  0,  0,-20,-40,
+        -30,  0, 10, 15, 15, 10,  0,-30,
+        -30,  5, 15, 20, 20, 15,  5,-30,
+        -30,  0, 15, 20, 20, 15,  0,-30,
+        -30,  5, 10, 15, 15, 10,  5,-30,
+        -40,-20,  0,  5,  5,  0,-20,-40,
+        -50,-40,-30,-30,-30,-30,-40,-50),
+    chess.BISHOP: (
+        -20,-10,-10,-10,-10,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5, 10, 10,  5,  0,-10,
+        -10,  5,  5, 10, 10,  5,  5,-10,
+        -10,  0, 10, 10, 10, 10,  0,-10,
+        -10, 10, 10, 10, 10, 10, 10,-10,
+        -10,  5,  0,  0,  0,  0,  5,-10,
+        -20,-10,-10,-10,-10,-10,-10,-20),
+    chess.ROOK: (
+         0,  0,  0,  0,  0,  0,  0,  0,
+         5, 10, 10, 10, 10, 10, 10,  5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+         0,  0,  0,  5,  5,  0,  0,  0),
+    chess.QUEEN: (
+        -20,-10,-10, -5, -5,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5,  5,  5,  5,  0,-10,
+         -5,  0,  5,  5,  5,  5,  0, -5,
+          0,  0,  5,  5,  5,  5,  0, -5,
+        -10,  5,  5,  5,  5,  5,  0,-10,
+        -10,  0,  5,  0,  0,  0,  0,-10,
+        -20,-10,-10, -5, -5,-10,-10,-20),
+    chess.KING: (
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -20,-30,-30,-40,-40,-30,-30,-20,
+        -10,-20,-20,-20,-20,-20,-20,-10,
+         20, 20,  0,  0,  0,  0, 20, 20,
+         20, 30, 10,  0,  0, 10, 30, 20),
+}
+# PST[color][piece_type][square] including the piece value, squares from a1 to h8
+PST = {
+    chess.WHITE: {pt: [PIECE_VALUES[pt] + table[sq ^ 56] for sq in chess.SQUARES] for pt, table in PIECE_TABLES.items()},
+    chess.BLACK: {pt: [PIECE_VALUES[pt] + table[sq] for sq in chess.SQUARES] for pt, table in PIECE_TABLES.items()},
+}
+CASTLING_ROOKS = {chess.G1: (chess.H1, chess.F1), chess.C1: (chess.A1, chess.D1),
+                  chess.G8: (chess.H8, chess.F8), chess.C8: (chess.A8, chess.D8)}
+
+# Zobrist keys: ZOBRIST[color][piece_type][square], castling rights by rook square, en passant square, and black to move
+_random = random.Random(0x5EED)
+ZOBRIST = {color: {pt: [_random.getrandbits(64) for _ in chess.SQUARES] for pt in PIECE_TABLES} for color in chess.COLORS}
+ZOBRIST_CASTLING = [_random.getrandbits(64) for _ in chess.SQUARES]
+ZOBRIST_EP = {square: _random.getrandbits(64) for square in chess.SQUARES}
+ZOBRIST_EP[None] = 0
+ZOBRIST_BLACK = _random.getrandbits(64)
+
+
+class SearchStopped(Exception):
+    pass
+
+
+def evaluate(board):
+    """Material and piece-square score from white's point of view, from scratch"""
+    score = 0
+    for square, piece in board.piece_map().items():
+        value = PST[piece.color][piece.piece_type][square]
+        score += value if piece.color else -value
+    return score
+
+
+def castling_hash(castling_rights):
+    key = 0
+    for square in chess.scan_forward(castling_rights):
+        key ^= ZOBRIST_CASTLING[square]
+    return key
+
+
+def zobrist(board):
+    """Hash of the position, from scratch"""
+    key = castling_hash(board.castling_rights) ^ ZOBRIST_EP[board.ep_square]
+    for square, piece in board.piece_map().items():
+        key ^= ZOBRIST[piece.color][piece.piece_type][square]
+    return key if board.turn else key ^ ZOBRIST_BLACK
+
+
+def push(board, move, key):
+    """Plays a move, which may be a null move, and returns the hash of the new position updated from key"""
+    if move:
+        color = board.turn
+        own, other = ZOBRIST[color], ZOBRIST[not color]
+        piece = board.piece_type_at(move.from_square)
+        key ^= own[piece][move.from_square] ^ own[move.promotion or piece][move.to_square]
+        if piece == chess.PAWN and move.to_square == board.ep_square:
+            key ^= other[chess.PAWN][move.to_square - 8 if color else move.to_square + 8]
+        else:
+            captured = board.piece_type_at(move.to_square)
+            if captured:
+                key ^= other[captured][move.to_square]
+        if piece == chess.KING and abs(move.to_square - move.from_square) == 2:
+            rook_from, rook_to = CASTLING_ROOKS[move.to_square]
+            key ^= own[chess.ROOK][rook_from] ^ own[chess.ROOK][rook_to]
+    castling_rights, ep_square = board.castling_rights, board.ep_square
+    board.push(move)
+    if board.castling_rights != castling_rights:
+        key ^= castling_hash(castling_rights) ^ castling_hash(board.castling_rights)
+    return key ^ ZOBRIST_EP[ep_square] ^ ZOBRIST_EP[board.ep_square] ^ ZOBRIST_BLACK
+
+
+def move_delta(board, move):
+    """Change in the white point of view score caused by a move, before it's played"""
+    color = board.turn
+    own, other = PST[color], PST[not color]
+    piece = board.piece_type_at(move.from_square)
+    delta = own[piece][move.to_square] - own[piece][move.from_square]
+    if move.promotion:
+        delta += own[move.promotion][move.to_square] - own[chess.PAWN][move.to_square]
+    if piece == chess.PAWN and move.to_square == board.ep_square:
+        captured_square = move.to_square - 8 if color else move.to_square + 8
+        delta += other[chess.PAWN][captured_square]
+    else:
+        captured = board.piece_type_at(move.to_square)
+        if captured:
+            delta += other[captured][move.to_square]
+    if piece == chess.KING and abs(move.to_square - move.from_square) == 2:
+        rook_from, rook_to = CASTLING_ROOKS[move.to_square]
+        delta += own[chess.ROOK][rook_to] - own[chess.ROOK][rook_from]
+    return delta if color else -delta
+
+
+class Searcher:
+    def __init__(self, hash_mb=None):
+        self.max_entries = max((hash_mb or Hash) * 1024 * 1024 // ENTRY_BYTES, 1024)
+        self.tt = {}
+        self.nodes = 0
+        self.killers = {}
+        self.history = {}
+        self.stop_event = threading.Event()
+        self.deadline = None
+
+    def clear(self):
+        self.tt.clear()
+
+    def search(self, board, max_depth=100, movetime=None):
+        """Iterative deepening. Yields (depth, score, pv) after each completed depth."""
+        self.nodes = 0
+        self.killers = {}
+        self.history = {}
+        self.stop_event.clear()
+        self.deadline = time.time() + movetime if movetime else None
+        if len(self.tt) > self.max_entries:
+            self.tt.clear()
+        board = board.copy()
+        self.score = evaluate(board)
+        self.hash = zobrist(board)
+        # positions already seen in the game or in the current line count as draws when reached again
+        self.seen = set()
+        self.path = set()
+        replay = board.root()
+        for move in board.move_stack:
+            self.seen.add(zobrist(replay))
+            replay.push(move)
+        for depth in range(1, max_depth + 1):
+            try:
+                score = self.negamax(board, depth, -MATE, MATE, 0)
+            except SearchStopped:
+                return
+            yield depth, score, self.pv(board, depth)
+            if abs(score) > MATE_BOUND:
+                return
+
+    def stopped(self):
+        return self.stop_event.is_set() or (self.deadline is not None and time.time() > self.deadline)
+
+    def order(self, board, moves, tt_move, ply):
+        """Best move of an earlier search, captures by most valuable victim and least valuable attacker, promotions,
+        killers, then quiet moves by how often they caused a cutoff before"""
+        killers = self.killers.get(ply, ())
+        history = self.history
+        def key(move):
+            if move == tt_move:
+                return -1_000_000
+            victim = board.piece_type_at(move.to_square)
+            if victim:
+                return -100_000 - PIECE_VALUES[victim] + PIECE_VALUES[board.piece_type_at(move.from_square)] // 100
+            if move.promotion:
+                return -90_000 - PIECE_VALUES[move.promotion]
+            if move in killers:
+                return -50_000
+            return -min(history.get((move.from_square, move.to_square), 0), 40_000)  # stays behind the killers
+        return sorted(moves, key=key)
+
+    def negamax(self, board, depth, alpha, beta, ply, can_null=True):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0 and self.stopped():
+            raise SearchStopped()
+        key = self.hash
+        if ply > 0 and (key in self.seen or key in self.path or board.halfmove_clock >= 100):
+            return 0
+        in_check = board.is_check()
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self.quiesce(board, alpha, beta, ply)
+
+        original_alpha = alpha
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, flag, value, tt_move = entry
+            if entry_depth >= depth and ply > 0:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+
+        static = self.score if board.turn else -self.score
+        # Reverse futility pruning: near the leaves, a position far above beta isn't going to drop below it
+        if ply > 0 and depth <= 3 and not in_check and abs(beta) < MATE_BOUND and static - FUTILITY_MARGIN * depth >= beta:
+            return static - FUTILITY_MARGIN * depth
+
+        # Null move pruning: if passing the turn still fails high, a real move would too.
+        # Not done in check or without pieces, where zugzwang makes passing unsound.
+        if can_null and ply > 0 and depth >= 3 and not in_check and beta < MATE_BOUND \
+                and board.occupied_co[board.turn] & ~(board.pawns | board.kings):
+            self.hash = push(board, chess.Move.null(), key)
+            try:
+                value = -self.negamax(board, depth - 3 - (depth >= 6), -beta, -beta + 1, ply + 1, can_null=False)
+            finally:
+                board.pop()
+                self.hash = key
+            if value >= beta:
+                return value
+
+        moves = list(board.generate_legal_moves())
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        # Futility pruning: in the last ply, quiet moves can't bring a position far below alpha back up
+        futile = depth == 1 and not in_check and abs(alpha) < MATE_BOUND and static + FUTILITY_MARGIN <= alpha
+        best, best_move = -MATE, None
+        self.path.add(key)
+        try:
+            for index, move in enumerate(self.order(board, moves, tt_move, ply)):
+                quiet = not move.promotion and not board.is_capture(move)
+                delta = move_delta(board, move)
+                self.score += delta
+                self.hash = push(board, move, key)
+                try:
+                    if futile and quiet and index > 0 and not board.is_check():
+                        continue
+                    if index == 0:
+                        value = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+                    else:
+                        # Late quiet moves are searched shallower with a null window, and again in full if they look good
+                        reduction = 1 if quiet and depth >= 3 and index >= 4 and not in_check and not board.is_check() else 0
+                        value = -self.negamax(board, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                        if alpha < value < beta:
+                            value = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+                finally:
+                    board.pop()
+                    self.score -= delta
+                    self.hash = key
+                if value > best:
+                    best, best_move = value, move
+                if value > alpha:
+                    alpha = value
+                if alpha >= beta:
+                    if quiet:
+                        killers = self.killers.setdefault(ply, [])
+                        if move not in killers:
+                            killers.insert(0, move)
+                            del killers[2:]
+                        history_key = (move.from_square, move.to_square)
+                        self.history[history_key] = self.history.get(history_key, 0) + depth * depth
+                    break
+        finally:
+            self.path.discard(key)
+
+        flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+        self.tt[key] = (depth, flag, best, best_move)
+        return best
+
+    def quiesce(self, board, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0 and self.stopped():
+            raise SearchStopped()
+        in_check = board.is_check()
+        if in_check:
+            moves = list(board.generate_legal_moves())
+            if not moves:
+                return -MATE + ply
+        else:
+            stand_pat = self.score if board.turn else -self.score
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = list(board.generate_legal_captures())
+        for move in self.order(board, moves, None, ply):
+            delta = move_delta(board, move)
+            if not in_check:
+                # Delta pruning: skip captures that leave us below alpha even if nothing is taken back
+                if stand_pat + (delta if board.turn else -delta) + DELTA_MARGIN <= alpha:
+                    continue
+                # Taking a defended piece with a more valuable one usually loses material
+                victim = board.piece_type_at(move.to_square) or chess.PAWN
+                if not move.promotion and PIECE_VALUES[board.piece_type_at(move.from_square)] > PIECE_VALUES[victim] \
+                        and board.is_attacked_by(not board.turn, move.to_square):
+                    continue
+            self.score += delta
+            board.push(move)
+            try:
+                value = -self.quiesce(board, -beta, -alpha, ply + 1)
+            finally:
+                board.pop()
+                self.score -= delta
+            if value >= beta:
+                return value
+            alpha = max(alpha, value)
+        return alpha
+
+    def pv(self, board, depth):
+        moves = []
+        board = board.copy(stack=False)
+        for _ in range(depth):
+            entry = self.tt.get(zobrist(board))
+            if entry is None or entry[3] is None or not board.is_legal(entry[3]):
+                break
+            moves.append(entry[3])
+            board.push(entry[3])
+        return moves
+
+
+def go(searcher, board, max_depth, movetime):
+    start = time.time()
+    best = None
+    for depth, score, pv in searcher.search(board, max_depth, movetime):
+        elapsed = max(time.time() - start, 0.001)
+        if pv:
+            best = pv[0]
+        score_text = f"mate {(MATE - abs(score) + 1) // 2 * (1 if score > 0 else -1)}" if abs(score) > MATE_BOUND else f"cp {score}"
+        print(f"info depth {depth} score {score_text} nodes {searcher.nodes} nps {round(searcher.nodes / elapsed)} "
+              f"time {round(1000 * elapsed)} pv {' '.join(move.uci() for move in pv)}")
+    if best is None or not board.is_legal(best):
+        best = next(iter(board.legal_moves), None)
+    return best.uci() if best else "(none)"
+
+
+def main():
+    global Hash
+    board = chess.Board()
+    searcher = Searcher()
+    thread = None
+    searching = threading.Event()
+    result = []
+
+    def run_search(max_depth, movetime):
+        result.append(go(searcher, board, max_depth, movetime))
+        # done before sending the move, so that a command sent right after it isn't ignored as if we were still searching
+        searching.clear()
+        print("bestmove", result[-1])
+
+    while True:
+        try:
+            args = input().split()
+        except EOFError:
+            args = ["quit"]
+        if not args:
+            continue
+        command = args[0]
+
+        if command in ("stop", "quit"):
+            if thread:
+                searcher.stop_event.set()
+                thread.join()
+                thread = None
+            if command == "quit":
+                break
+            continue
+
+        if searching.is_set():
+            if command == "isready":
+                print("readyok")
+            continue
+
+        if command == "uci":
+            print(f"id name {version}")
+            print(f"option name Hash type spin default {Hash} min 1 max 1024")
+            print("uciok")
+
+        elif command == "isready":
+            print("readyok")
+
+        elif command == "ucinewgame":
+            searcher.clear()
+
+        elif command == "setoption" and len(args) >= 5 and args[2] == "Hash":
+            Hash = int(args[4])
+            searcher = Searcher()
+
+        elif command == "position":
+            if args[1] == "startpos":
+                board = chess.Board()
+                rest = args[2:]
+            else:
+                board = chess.Board(" ".join(args[2:8]))
+                rest = args[8:]
+            if rest and rest[0] == "moves":
+                for move in rest[1:]:
+                    board.push_uci(move)
+
+        elif command == "go":
+            max_depth, movetime = 100, None
+            options = dict(zip(args[1::2], args[2::2]))
+            if "depth" in options:
+                max_depth = int(options["depth"])
+            if "movetime" in options:
+                movetime = int(options["movetime"]) / 1000
+            elif "wtime" in options or "btime" in options:
+                remaining = int(options.get("wtime" if board.turn else "btime", 60000)) / 1000
+                increment = int(options.get("winc" if board.turn else "binc", 0)) / 1000
+                movetime = min(remaining / 40 + increment, remaining / 2)
+            if thread:
+                thread.join()  # only sending its move is left
+            searching.set()
+            thread = threading.Thread(target=run_search, args=(max_depth, movetime), daemon=True)
+            thread.start()
+
+
+if __name__ == "__main__":
+    main()
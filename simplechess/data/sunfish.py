@@ -1,7 +1,7 @@
 #!/usr/bin/env pypy3
 from __future__ import print_function
 
-import time, math
+import time, math, random
 from itertools import count
 from collections import namedtuple, defaultdict
 
@@ -123,14 +123,31 @@ QS = 40
 QS_A = 140
 EVAL_ROUGHNESS = 15
 
+# Transposition table size in MB, exposed to UCI as the Hash option
+Hash = 16
+
 # minifier-hide start
 opt_ranges = dict(
     QS = (0, 300),
     QS_A = (0, 300),
     EVAL_ROUGHNESS = (0, 50),
+    Hash = (1, 1024),
 )
 # minifier-hide end
 
+# Zobrist keys. Positions are always seen from the side to move, so each position
+# carries the hash of its board and the hash of its rotated board, which swap on rotate.
+_rand = random.Random(2023)
+zobrist = {p: [_rand.getrandbits(64) for _ in range(120)] for p in "PNBRQKpnbrqk"}
+zobrist["."] = [0] * 120
+zobrist_rot = {p: [zobrist[p.swapcase()][119 - i] for i in range(120)] for p in zobrist}
+zobrist_wc = {(a, b): _rand.getrandbits(64) for a in (False, True) for b in (False, True)}
+zobrist_bc = {(a, b): _rand.getrandbits(64) for a in (False, True) for b in (False, True)}
+zobrist_ep = [0] + [_rand.getrandbits(64) for _ in range(119)]
+zobrist_kp = [0] + [_rand.getrandbits(64) for _ in range(119)]
+zobrist_depth = [_rand.getrandbits(64) for _ in range(1000)]
+zobrist_null = _rand.getrandbits(64)
+
 
 ###############################################################################
 # Chess logic
@@ -140,7 +157,17 @@ opt_ranges = dict(
 Move = namedtuple("Move", "i j prom")
 
 
-class Position(namedtuple("Position", "board score wc bc ep kp")):
+def board_hashes(board):
+    """Zobrist hashes of a board and of its rotation, computed from scratch"""
+    zh = zr = 0
+    for i, p in enumerate(board):
+        if p in zobrist:
+            zh ^= zobrist[p][i]
+            zr ^= zobrist_rot[p][i]
+    return zh, zr
+
+
+class Position(namedtuple("Position", "board score wc bc ep kp zh zr")):
     """A state of a chess game
     board -- a 120 char representation of the board
     score -- the board evaluation
@@ -148,8 +175,14 @@ class Position(namedtuple("Position", "board score wc bc ep kp")):
     bc -- the opponent castling rights, [west/king side, east/queen side]
     ep - the en passant square
     kp - the king passant square
+    zh - the zobrist hash of the board
+    zr - the zobrist hash of the rotated board
     """
 
+    def key(self):
+        """Zobrist key of the whole position"""
+        return self.zh ^ zobrist_wc[self.wc] ^ zobrist_bc[self.bc] ^ zobrist_ep[self.ep] ^ zobrist_kp[self.kp]
+
     def gen_moves(self):
         # For each of our pieces, iterate through each possible 'ray' of moves,
         # as defined in the 'directions' map. The rays are broken e.g. by
@@ -196,12 +229,17 @@ class Position(namedtuple("Position", "board score wc bc ep kp")):
             self.board[::-1].swapcase(), -self.score, self.bc, self.wc,
             119 - self.ep if self.ep and not nullmove else 0,
             119 - self.kp if self.kp and not nullmove else 0,
+            self.zr, self.zh,
         )
 
     def move(self, move):
         i, j, prom = move
         p, q = self.board[i], self.board[j]
-        put = lambda board, i, p: board[:i] + p + board[i + 1 :]
+        # Squares that changed, to update the hashes once the board is final
+        changed = []
+        def put(board, i, p):
+            changed.append((i, board[i], p))
+            return board[:i] + p + board[i + 1 :]
         # Copy variables and reset ep and kp
         board = self.board
         wc, bc, ep, kp = self.wc, self.bc, 0, 0
@@ -229,8 +267,12 @@ class Position(namedtuple("Position", "board score wc bc ep kp")):
                 ep = i + N
             if j == self.ep:
                 board = put(board, j + S, ".")
+        zh, zr = self.zh, self.zr
+        for k, old, new in changed:
+            zh ^= zobrist[old][k] ^ zobrist[new][k]
+            zr ^= zobrist_rot[old][k] ^ zobrist_rot[new][k]
         # We rotate the returned position, so it's ready for the next player
-        return Position(board, score, wc, bc, ep, kp).rotate()
+        return Position(board, score, wc, bc, ep, kp, zh, zr).rotate()
 
     def value(self, move):
         i, j, prom = move
@@ -263,14 +305,81 @@ class Position(namedtuple("Position", "board score wc bc ep kp")):
 # lower <= s(pos) <= upper
 Entry = namedtuple("Entry", "lower upper")
 
+# Rough memory used by a slot in both tables, to turn the Hash option into a number of slots
+TABLE_SLOT_BYTES = 256
+
+
+class ScoreTable:
+    """Fixed size table of score bounds, one slot per (position, depth, can_null) key.
+    A slot is replaced by deeper searches or by anything once it is from an older search."""
+
+    def __init__(self, size):
+        self.mask = size - 1
+        self.slots = [None] * size
+        self.age = 0
+
+    def get(self, key):
+        slot = self.slots[key & self.mask]
+        if slot is not None and slot[0] == key:
+            return slot[3]
+        return None
+
+    def put(self, key, depth, entry):
+        index = key & self.mask
+        slot = self.slots[index]
+        if slot is None or slot[0] == key or slot[2] != self.age or depth >= slot[1]:
+            self.slots[index] = (key, depth, self.age, entry)
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+
+
+class MoveTable:
+    """Fixed size table of the best move found in each position, with the same replacement as ScoreTable"""
+
+    def __init__(self, size):
+        self.mask = size - 1
+        self.slots = [None] * size
+        self.age = 0
+
+    def get(self, pos, default=None):
+        return self.probe(pos.key(), default)
+
+    def probe(self, key, default=None):
+        slot = self.slots[key & self.mask]
+        if slot is not None and slot[0] == key:
+            return slot[3]
+        return default
+
+    def put(self, key, depth, move):
+        index = key & self.mask
+        slot = self.slots[index]
+        if slot is None or slot[0] == key or slot[2] != self.age or depth >= slot[1]:
+            self.slots[index] = (key, depth, self.age, move)
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+
+
+def table_size(megabytes):
+    """Largest power of two number of slots that fits in the given size"""
+    slots = max(megabytes * 1024 * 1024 // TABLE_SLOT_BYTES, 1)
+    return 1 << (slots.bit_length() - 1)
+
 
 class Searcher:
-    def __init__(self):
-        self.tp_score = {}
-        self.tp_move = {}
+    def __init__(self, hash_mb=None):
+        size = table_size(hash_mb or Hash)
+        self.tp_score = ScoreTable(size)
+        self.tp_move = MoveTable(size)
         self.history = set()
         self.nodes = 0
 
+    def clear(self):
+        """Forgets everything, for a new game"""
+        self.tp_score.clear()
+        self.tp_move.clear()
+
     def bound(self, pos, gamma, depth, can_null=True):
         """ Let s* be the "true" score of the sub-tree we are searching.
             The method returns r, where
@@ -293,7 +402,9 @@ class Searcher:
         # Look in the table if we have already searched this position before.
         # We also need to be sure, that the stored search was over the same
         # nodes as the current search.
-        entry = self.tp_score.get((pos, depth, can_null), Entry(-MATE_UPPER, MATE_UPPER))
+        pos_key = pos.key()
+        key = pos_key ^ zobrist_depth[depth] ^ (zobrist_null if can_null else 0)
+        entry = self.tp_score.get(key) or Entry(-MATE_UPPER, MATE_UPPER)
         if entry.lower >= gamma: return entry.lower
         if entry.upper < gamma: return entry.upper
 
@@ -324,14 +435,14 @@ class Searcher:
                 yield None, pos.score
 
             # Look for the strongest ove from last time, the hash-move.
-            killer = self.tp_move.get(pos)
+            killer = self.tp_move.probe(pos_key)
 
             # If there isn't one, try to find one with a more shallow search.
             # This is known as Internal Iterative Deepening (IID). We set
             # can_null=True, since we want to make sure we actually find a move.
             if not killer and depth > 2:
                 self.bound(pos, gamma, depth - 3, can_null=False)
-                killer = self.tp_move.get(pos)
+                killer = self.tp_move.probe(pos_key)
 
             # If depth == 0 we only try moves with high intrinsic score (captures and
             # promotions). Otherwise we do all moves. This is called quiescent search.
@@ -370,7 +481,7 @@ class Searcher:
             if best >= gamma:
                 # Save the move for pv construction and killer heuristic
                 if move is not None:
-                    self.tp_move[pos] = move
+                    self.tp_move.put(pos_key, depth, move)
                 break
 
         # Stalemate checking is a bit tricky: Say we failed low, because
@@ -399,9 +510,9 @@ class Searcher:
 
         # Table part 2
         if best >= gamma:
-            self.tp_score[pos, depth, can_null] = Entry(best, entry.upper)
+            self.tp_score.put(key, depth, Entry(best, entry.upper))
         if best < gamma:
-            self.tp_score[pos, depth, can_null] = Entry(entry.lower, best)
+            self.tp_score.put(key, depth, Entry(entry.lower, best))
 
         return best
 
@@ -409,7 +520,9 @@ class Searcher:
         """Iterative deepening MTD-bi search"""
         self.nodes = 0
         self.history = set(history)
-        self.tp_score.clear()
+        # The tables are kept between moves of the same game, older entries just lose priority
+        self.tp_score.age += 1
+        self.tp_move.age += 1
 
         gamma = 0
         # In finished games, we could potentially go far enough to cause a recursion
@@ -445,7 +558,7 @@ def render(i):
     rank, fil = divmod(i - A1, 10)
     return chr(fil + ord("a")) + str(-rank + 1)
 
-hist = [Position(initial, 0, (True, True), (True, True), 0, 0)]
+hist = [Position(initial, 0, (True, True), (True, True), 0, 0, *board_hashes(initial))]
 
 #input = raw_input
 
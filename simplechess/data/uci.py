@@ -65,7 +65,7 @@ def go_loop(searcher, hist, stop_event, max_movetime=0, max_depth=0, debug=False
     # we are in "go infinite" since it's simply translated to "go depth 100".
 
     my_pv = pv(searcher, hist[-1], include_scores=False)
-    print("bestmove", my_pv[0] if my_pv else "(none)")
+    return my_pv[0] if my_pv else "(none)"
 
 
 def mate_loop(
@@ -108,8 +108,7 @@ def mate_loop(
         if stop_event.is_set():
             break
     move = searcher.tp_move.get(hist[-1])
-    move_str = render_move(move, white_pov=len(hist) % 2 == 1)
-    print("bestmove", move_str)
+    return render_move(move, white_pov=len(hist) % 2 == 1)
 
 
 def perft(pos, depth, debug=False):
@@ -189,6 +188,11 @@ def run(sunfish_module, startpos):
                 elif args[0] == "setoption":
                     _, uci_key, _, uci_value = args[1:]
                     setattr(sunfish, uci_key, int(uci_value))
+                    if uci_key == "Hash":
+                        searcher = sunfish.Searcher()
+
+                elif args[0] == "ucinewgame":
+                    searcher.clear()
 
                 # FIXME: It seems we should reply to "isready" even while thinking.
                 # See: https://talkchess.com/forum3/viewtopic.php?f=7&t=81233&start=10
@@ -255,9 +259,11 @@ def run(sunfish_module, startpos):
                         debug=debug,
                     )
 
-                    # Make sure we get informed if the job fails
+                    # Make sure we get informed if the job fails.
+                    # The best move is sent once the future is done, so that a command
+                    # sent right after it isn't ignored as if we were still searching.
                     def callback(fut):
-                        fut.result(timeout=0)
+                        print("bestmove", fut.result(timeout=0))
 
                     go_future.add_done_callback(callback)
 
@@ -290,7 +296,7 @@ def from_fen(board, color, castling, enpas, _hclock, _fclock):
     else:
         score = sum(sunfish.pst[c][i] for i, c in enumerate(board) if c.isupper())
         score -= sum(sunfish.pst[c.upper()][119-i] for i, c in enumerate(board) if c.islower())
-        pos = sunfish.Position(board, score, wc, bc, ep, 0)
+        pos = sunfish.Position(board, score, wc, bc, ep, 0, *sunfish.board_hashes(board))
     return pos if color == 'w' else pos.rotate()
 
 
@@ -0,0 +1,185 @@
+import time
+import asyncio
+import logging
+import chess
+import chess.engine
+from typing import Dict, List, Optional, Set
+
+log = logging.getLogger("red.crab-cogs.simplechess")
+
+HEALTH_CHECK_INTERVAL = 60  # seconds
+PING_TIMEOUT = 10  # seconds
+MOVE_GRACE_TIME = 10  # seconds on top of the think time before an engine is considered stuck
+
+
+class EngineWorker:
+    """One engine process. Commands are serialized, as a new command would cancel the one in progress."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.engine: Optional[chess.engine.UciProtocol] = None
+        self.lock = asyncio.Lock()
+        self.games: Set[int] = set()
+        self.waiting = 0
+        self.moves = 0
+        self.starts = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.engine is not None and not self.engine.returncode.done()
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.moves if self.moves else 0.0
+
+    @property
+    def respawns(self) -> int:
+        return max(self.starts - 1, 0)
+
+
+class EnginePool:
+    """
+    Runs several engine processes so that bot games don't wait behind each other.
+    A game sticks to the same engine while it lasts, which keeps the engine's search tables warm.
+    Engines that die or stop responding are replaced.
+    """
+
+    def __init__(self, command: List[str], size: int = 2):
+        self.command = command
+        self.size = max(1, size)
+        self.workers: List[EngineWorker] = []
+        self.affinity: Dict[int, EngineWorker] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(worker.waiting for worker in self.workers)
+
+    @property
+    def moves(self) -> int:
+        return sum(worker.moves for worker in self.workers)
+
+    @property
+    def average_latency(self) -> float:
+        moves = self.moves
+        return sum(worker.total_latency for worker in self.workers) / moves if moves else 0.0
+
+    @property
+    def max_latency(self) -> float:
+        return max((worker.max_latency for worker in self.workers), default=0.0)
+
+    @property
+    def respawns(self) -> int:
+        return sum(worker.respawns for worker in self.workers)
+
+    async def start(self) -> None:
+        await self.resize(self.size)
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def quit(self) -> None:
+        if self._health_task:
+            self._health_task.cancel()
+        for worker in self.workers:
+            await self._stop(worker)
+        self.workers.clear()
+        self.affinity.clear()
+
+    async def resize(self, size: int) -> None:
+        self.size = max(1, size)
+        while len(self.workers) < self.size:
+            worker = EngineWorker(len(self.workers))
+            self.workers.append(worker)
+            await self._spawn(worker)
+        while len(self.workers) > self.size:
+            worker = self.workers.pop()
+            for game_id in worker.games:
+                self.affinity.pop(game_id, None)
+            async with worker.lock:
+                await self._stop(worker)
+
+    async def play(self, game_id: int, board: chess.Board, limit: chess.engine.Limit) -> chess.engine.PlayResult:
+        worker = self._worker_for(game_id)
+        start = time.perf_counter()
+        worker.waiting += 1
+        try:
+            await worker.lock.acquire()
+        finally:
+            worker.waiting -= 1
+        try:
+            engine_start = time.perf_counter()
+            result = await self._play(worker, game_id, board, limit)
+            result.info["time"] = time.perf_counter() - engine_start  # without the wait for the engine
+        finally:
+            worker.lock.release()
+        latency = time.perf_counter() - start
+        worker.moves += 1
+        worker.total_latency += latency
+        worker.max_latency = max(worker.max_latency, latency)
+        return result
+
+    def release(self, game_id: int) -> None:
+        """Call when a game ends so that its engine can be given to another game."""
+        worker = self.affinity.pop(game_id, None)
+        if worker:
+            worker.games.discard(game_id)
+
+    def _worker_for(self, game_id: int) -> EngineWorker:
+        worker = self.affinity.get(game_id)
+        if worker is None or worker not in self.workers:
+            worker = min(self.workers, key=lambda w: (len(w.games), w.waiting))
+            self.affinity[game_id] = worker
+            worker.games.add(game_id)
+        return worker
+
+    async def _play(self, worker: EngineWorker, game_id: int, board: chess.Board, limit: chess.engine.Limit) -> chess.engine.PlayResult:
+        timeout = (limit.time or 0) + MOVE_GRACE_TIME
+        for attempt in range(2):
+            if not worker.alive:
+                await self._spawn(worker)
+            assert worker.engine
+            try:
+                return await asyncio.wait_for(worker.engine.play(board, limit, game=game_id), timeout)
+            except (chess.engine.EngineError, chess.engine.EngineTerminatedError, asyncio.TimeoutError) as error:
+                log.warning(f"Engine {worker.index} failed to play ({type(error).__name__}), restarting it")
+                await self._stop(worker)
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+    async def _spawn(self, worker: EngineWorker) -> None:
+        await self._stop(worker)
+        worker.starts += 1
+        _, engine = await chess.engine.popen_uci(self.command)
+        await engine.ping()
+        worker.engine = engine
+
+    @staticmethod
+    async def _stop(worker: EngineWorker) -> None:
+        engine, worker.engine = worker.engine, None
+        if engine is None or engine.returncode.done():
+            return
+        try:
+            await asyncio.wait_for(engine.quit(), PING_TIMEOUT)
+        except (chess.engine.EngineError, asyncio.TimeoutError):
+            engine.transport.kill()  # type: ignore
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            for worker in list(self.workers):
+                if worker.lock.locked():
+                    continue  # busy engines are checked by their own moves
+                async with worker.lock:
+                    try:
+                        if not worker.alive:
+                            raise chess.engine.EngineTerminatedError("engine process dead")
+                        assert worker.engine
+                        await asyncio.wait_for(worker.engine.ping(), PING_TIMEOUT)
+                    except (chess.engine.EngineError, chess.engine.EngineTerminatedError, asyncio.TimeoutError):
+                        log.warning(f"Engine {worker.index} is not responding, restarting it")
+                        try:
+                            await self._spawn(worker)
+                        except Exception:
+                            log.exception(f"Restarting engine {worker.index}")
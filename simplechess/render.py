@@ -0,0 +1,169 @@
+import chess
+import chess.svg
+from io import BytesIO
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from PIL import Image, ImageDraw
+
+BOARD_SIZE = 512  # pixels
+BOARD_CACHE_BYTES = 32 * 1024**2
+# Layout of chess.svg.board with coordinates and borders, in its own units
+SVG_BOARD_OFFSET = 17
+SVG_FULL_SIZE = 394
+ARROW_COLOR = "arrow green"
+
+BoardImageKey = Tuple[str, Optional[str], Optional[int], bool, Tuple[Tuple[str, str], ...]]
+
+
+class BoardImageCache:
+    """Least recently used board images, limited by their total size in bytes."""
+
+    def __init__(self, max_bytes: int = BOARD_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images: OrderedDict[BoardImageKey, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def get(self, key: BoardImageKey) -> Optional[bytes]:
+        image = self._images.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._images.move_to_end(key)
+        return image
+
+    def set(self, key: BoardImageKey, image: bytes) -> None:
+        if len(image) > self.max_bytes:
+            return
+        if key in self._images:
+            self.bytes -= len(self._images.pop(key))
+        self._images[key] = image
+        self.bytes += len(image)
+        while self.bytes > self.max_bytes:
+            _, old = self._images.popitem(last=False)
+            self.bytes -= len(old)
+
+    def clear(self) -> None:
+        self._images.clear()
+        self.bytes = 0
+
+
+def board_image_key(board: chess.BaseBoard, lastmove: Optional[chess.Move], check: Optional[chess.Square],
+                    orientation: chess.Color = chess.WHITE, colors: Optional[Dict[str, str]] = None) -> BoardImageKey:
+    return (board.board_fen(), lastmove.uci() if lastmove else None, check, orientation, tuple(sorted((colors or {}).items())))
+
+
+class SpriteBoardRenderer:
+    """
+    Draws boards that look like chess.svg.board by pasting pieces onto a board, with PIL.
+    The board, highlighted squares, check mark and pieces are rasterized from SVG once and then reused,
+    so drawing a position only costs a few image operations and a PNG encode.
+    """
+
+    def __init__(self, rasterize: Callable[[str], bytes], size: int = BOARD_SIZE, colors: Optional[Dict[str, str]] = None):
+        self.rasterize = rasterize
+        self.size = size
+        self.colors = colors or {}
+        self.scale = size / SVG_FULL_SIZE
+        # pixel edges of the 8 columns/rows, so that squares tile the board without gaps
+        self.edges = [round((SVG_BOARD_OFFSET + i * chess.svg.SQUARE_SIZE) * self.scale) for i in range(9)]
+        self._boards: Dict[chess.Color, Image.Image] = {}
+        self._highlighted: Dict[chess.Color, Image.Image] = {}
+        self._checks: Dict[Tuple[chess.Color, bool], Image.Image] = {}
+        self._pieces: Dict[Tuple[str, int], Image.Image] = {}
+
+    def render(self, board: chess.BaseBoard, lastmove: Optional[chess.Move] = None, check: Optional[chess.Square] = None,
+               orientation: chess.Color = chess.WHITE) -> bytes:
+        image = self._board(orientation).copy()
+        if lastmove:
+            highlighted = self._highlighted_board(orientation)
+            for square in (lastmove.from_square, lastmove.to_square):
+                box = self._box(square, orientation)
+                image.paste(highlighted.crop(box), box[:2])
+        if check is not None:
+            box = self._box(check, orientation)
+            image.paste(self._check(orientation, bool(chess.BB_LIGHT_SQUARES & chess.BB_SQUARES[check])), box[:2])
+        for square, piece in board.piece_map().items():
+            box = self._box(square, orientation)
+            sprite = self._piece(piece.symbol(), box[2] - box[0])
+            image.alpha_composite(sprite, box[:2])
+        if lastmove and lastmove.from_square != lastmove.to_square:
+            image = Image.alpha_composite(image, self._arrow(lastmove, orientation))
+        buffer = BytesIO()
+        image.save(buffer, "png", compress_level=1)
+        return buffer.getvalue()
+
+    def _box(self, square: chess.Square, orientation: chess.Color) -> Tuple[int, int, int, int]:
+        file, rank = chess.square_file(square), chess.square_rank(square)
+        col = file if orientation else 7 - file
+        row = 7 - rank if orientation else rank
+        return self.edges[col], self.edges[row], self.edges[col + 1], self.edges[row + 1]
+
+    def _load(self, svg: str) -> Image.Image:
+        with Image.open(BytesIO(self.rasterize(svg))) as image:
+            return image.convert("RGBA")
+
+    def _board(self, orientation: chess.Color) -> Image.Image:
+        if orientation not in self._boards:
+            self._boards[orientation] = self._load(chess.svg.board(None, orientation=orientation, colors=self.colors, size=self.size))
+        return self._boards[orientation]
+
+    def _highlighted_board(self, orientation: chess.Color) -> Image.Image:
+        """A board where every square has the color of a last move square."""
+        if orientation not in self._highlighted:
+            light = self.colors.get("square light lastmove", chess.svg.DEFAULT_COLORS["square light lastmove"])
+            dark = self.colors.get("square dark lastmove", chess.svg.DEFAULT_COLORS["square dark lastmove"])
+            fill = {square: light if chess.BB_LIGHT_SQUARES & chess.BB_SQUARES[square] else dark for square in chess.SQUARES}
+            self._highlighted[orientation] = self._load(chess.svg.board(None, orientation=orientation, fill=fill, colors=self.colors, size=self.size))
+        return self._highlighted[orientation]
+
+    def _check(self, orientation: chess.Color, light: bool) -> Image.Image:
+        if (orientation, light) not in self._checks:
+            square = chess.B1 if light else chess.A1
+            board = self._load(chess.svg.board(None, orientation=orientation, check=square, colors=self.colors, size=self.size))
+            self._checks[orientation, light] = board.crop(self._box(square, orientation))
+        return self._checks[orientation, light]
+
+    def _piece(self, symbol: str, size: int) -> Image.Image:
+        if (symbol, size) not in self._pieces:
+            self._pieces[symbol, size] = self._load(chess.svg.piece(chess.Piece.from_symbol(symbol), size=size)).resize((size, size))
+        return self._pieces[symbol, size]
+
+    def _arrow(self, move: chess.Move, orientation: chess.Color) -> Image.Image:
+        """Same geometry as the arrows of chess.svg.board"""
+        color = self.colors.get(ARROW_COLOR, chess.svg.DEFAULT_COLORS[ARROW_COLOR])
+        rgb, alpha = color[:7], int(color[7:9] or "ff", 16)
+        square = chess.svg.SQUARE_SIZE
+
+        def center(sq: chess.Square) -> Tuple[float, float]:
+            file, rank = chess.square_file(sq), chess.square_rank(sq)
+            x = SVG_BOARD_OFFSET + (file + 0.5 if orientation else 7.5 - file) * square
+            y = SVG_BOARD_OFFSET + (7.5 - rank if orientation else rank + 0.5) * square
+            return x, y
+
+        (xtail, ytail), (xhead, yhead) = center(move.from_square), center(move.to_square)
+        marker_size, marker_margin = 0.75 * square, 0.1 * square
+        dx, dy = xhead - xtail, yhead - ytail
+        hypot = (dx * dx + dy * dy) ** 0.5
+        shaft_x = xhead - dx * (marker_size + marker_margin) / hypot
+        shaft_y = yhead - dy * (marker_size + marker_margin) / hypot
+        xtip = xhead - dx * marker_margin / hypot
+        ytip = yhead - dy * marker_margin / hypot
+        marker = [(xtip, ytip),
+                  (shaft_x + dy * 0.5 * marker_size / hypot, shaft_y - dx * 0.5 * marker_size / hypot),
+                  (shaft_x - dy * 0.5 * marker_size / hypot, shaft_y + dx * 0.5 * marker_size / hypot)]
+
+        # drawn opaque on its own layer and then made translucent, so the shaft and head don't overlap darker
+        shape = Image.new("L", (self.size, self.size), 0)
+        draw = ImageDraw.Draw(shape)
+        scale = self.scale
+        draw.line([(xtail * scale, ytail * scale), (shaft_x * scale, shaft_y * scale)], fill=255, width=round(0.2 * square * scale))
+        draw.polygon([(x * scale, y * scale) for x, y in marker], fill=255)
+        layer = Image.new("RGBA", (self.size, self.size), rgb)
+        layer.putalpha(shape.point(lambda value: value * alpha // 255))
+        return layer
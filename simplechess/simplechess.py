@@ -1,19 +1,23 @@
 import sys
+import time
+import asyncio
 import logging
 import discord
-import chess.engine
-from typing import List, Optional, Union
+import chess.polyglot
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
 
 from redbot.core import commands, app_commands, bank
 from redbot.core.bot import Red
-from redbot.core.data_manager import bundled_data_path
+from redbot.core.data_manager import bundled_data_path, cog_data_path
 from redbot.core.utils.chat_formatting import humanize_timedelta
 
-from simplechess.base import BaseChessCog
+from simplechess.base import BaseChessCog, BaseChessGame
 from simplechess.chessgame import ChessGame
+from simplechess.enginepool import EnginePool
 from simplechess.views.bots_view import BotsView
 from simplechess.views.game_view import GameView
+from simplechess.views.invite_view import InviteView
 from simplechess.views.replace_view import ReplaceView
 
 log = logging.getLogger("red.crab-cogs.simplechess")
@@ -21,6 +25,13 @@ log = logging.getLogger("red.crab-cogs.simplechess")
 TIME_LIMIT = 5 # minutes
 DEFAULT_DIFFICULTY = 1 # depth
 STARTING = "Starting game..."
+ENGINES = {
+    "sunfish": "sunfish.py",
+    "bitboard": "bitboard.py",
+}
+DEFAULT_ENGINE = "sunfish"
+SWEEP_INTERVAL = 3600 # seconds
+UNLOAD_TIME = 3600 # seconds without moves before a game is put back in storage
 
 
 class SimpleChess(BaseChessCog):
@@ -31,39 +42,177 @@ class SimpleChess(BaseChessCog):
 
     def __init__(self, bot: Red):
         super().__init__(bot)
+        self.engine_lock = asyncio.Lock()
+        self.saved_games: Dict[int, Dict[str, Any]] = {}
+        self.sweeper_task: Optional[asyncio.Task] = None
 
     async def cog_load(self):
-        _, engine = await chess.engine.popen_uci([sys.executable, '-u', str(bundled_data_path(self) / "sunfish.py")])
-        self.engine = engine
-        await self.engine.ping()
+        await self.start_engine_pool(DEFAULT_ENGINE)
+        self.book_depth = await self.config.book_depth()
+        self.think_time.budget = await self.config.engine_budget()
+        book_path = await self.config.book_path()
+        if book_path:
+            try:
+                self.opening_book = chess.polyglot.open_reader(book_path)
+            except OSError:
+                log.error(f"Opening book {book_path}", exc_info=True)
 
+        # games are only rebuilt when someone uses them, so that old games don't slow down loading
         all_channels = await self.config.all_channels()
         for channel_id, config in all_channels.items():
+            record = config["state"]
+            if not record:
+                record = self.legacy_record(config)
+                if record:  # converted once, so that its expiry clock starts now and not on every load
+                    await self.config.channel_from_id(channel_id).set({"state": record})
+            if record:
+                self.saved_games[channel_id] = record
+        self.sweeper_task = asyncio.create_task(self.sweep_loop())
+
+    def restore_game(self, channel: Any, record: Dict[str, Any]) -> Optional[ChessGame]:
+        if not isinstance(channel, (discord.TextChannel, discord.Thread)):
+            return None
+        players: List[discord.Member] = [channel.guild.get_member(user_id) for user_id in record["players"]] # type: ignore
+        if any(player is None for player in players):
+            return None
+        return ChessGame.from_record(self, players, channel, record)
+
+    async def get_game(self, channel: Union[discord.TextChannel, discord.Thread]) -> Optional[BaseChessGame]:
+        """The game in a channel, restoring it from the config if it wasn't in use since the bot started."""
+        if channel.id in self.games:
+            return self.games[channel.id]
+        record = self.saved_games.get(channel.id)
+        if record is None:
+            return None
+        try:
+            game = self.restore_game(channel, record)
+        except Exception:
+            log.error(f"Parsing game in {channel.id}", exc_info=True)
+            game = None
+        if game is None:
+            return None
+        del self.saved_games[channel.id]
+        self.games[channel.id] = game
+        view = BotsView(game) if all(player.bot for player in game.players) \
+            else InviteView(game, await bank.get_currency_name(channel.guild)) if not game.accepted \
+            else GameView(game)
+        self.bot.add_view(view)
+        game.view = view
+        try:
+            game.message = await channel.fetch_message(record["message"])
+        except discord.HTTPException:
+            pass
+        return game
+
+    async def sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
             try:
-                channel = self.bot.get_channel(channel_id)
-                if not config["game"] or not isinstance(channel, (discord.TextChannel, discord.Thread)):
-                    continue
-                players: List[discord.Member] = [channel.guild.get_member(user_id) for user_id in config["players"]] # type: ignore
-                if any(player is None for player in players):
-                    continue
-                game = ChessGame(self, players, channel, config["game"], config["depth"], config["bet"])
-                self.games[channel.id] = game
-                view = BotsView(game) if all(player.bot for player in players) else GameView(game)
-                self.bot.add_view(view)
-                game.view = view
-                try:
-                    game.message = await channel.fetch_message(config["message"])
-                except discord.NotFound:
-                    pass
-            except Exception: # don't interrupt load sequence
-                log.error(f"Parsing game in {channel_id}", exc_info=True)
+                await self.sweep_games()
+            except Exception:
+                log.error("Sweeping chess games", exc_info=True)
+
+    async def sweep_games(self):
+        """Puts idle games back in storage and cancels games nobody has played in a long time."""
+        for game in list(self.games.values()):
+            idle = (datetime.now() - game.last_interacted).total_seconds()
+            if not game.accepted or game.is_finished() or idle < UNLOAD_TIME:
+                continue
+            if game.view:
+                game.view.stop()
+            await game.flush_state()
+            if self.games.get(game.channel.id) == game:
+                del self.games[game.channel.id]
+                self.saved_games[game.channel.id] = game.to_record()
+
+        expire_time = await self.config.expire_days() * 86400
+        now = time.time()
+        for channel_id, record in list(self.saved_games.items()):
+            if channel_id in self.games:  # replaced by a new game
+                del self.saved_games[channel_id]
+                continue
+            if now - record["last_interacted"] < expire_time:
+                continue
+            del self.saved_games[channel_id]
+            game = self.restore_game(self.bot.get_channel(channel_id), record)
+            if game:
+                self.games[channel_id] = game
+                await game.cancel(None)  # returns bets and clears the saved game
+            else:
+                await self.config.channel_from_id(channel_id).clear()
+
+    @staticmethod
+    def legacy_record(config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Games saved by older versions, one field at a time and without their moves. Their expiry counts from the conversion."""
+        if not config["game"]:
+            return None
+        return {
+            "fen": config["game"],
+            "moves": "",
+            "players": config["players"],
+            "depth": config["depth"],
+            "bet": config["bet"],
+            "message": config["message"],
+            "last_interacted": time.time(),
+        }
 
     async def cog_unload(self):
-        for game in self.games.values():
+        if self.sweeper_task:
+            self.sweeper_task.cancel()
+        for game in list(self.games.values()):
             if game.view:
                 game.view.stop()
-        if self.engine:
-            await self.engine.quit()
+            try:
+                await game.flush_state()
+            except Exception:
+                log.error(f"Saving game in {game.channel.id}", exc_info=True)
+        for pool in self.engine_pools.values():
+            await pool.quit()
+        if self.opening_book:
+            self.opening_book.close()
+        self.board_cache.clear()
+
+    async def start_engine_pool(self, engine: str) -> EnginePool:
+        async with self.engine_lock:
+            if engine not in self.engine_pools:
+                command = [sys.executable, '-u', str(bundled_data_path(self) / ENGINES[engine])]
+                pool = EnginePool(command, await self.config.engine_workers())
+                await pool.start()
+                self.engine_pools[engine] = pool
+            return self.engine_pools[engine]
+
+    async def get_engine_pool(self, guild: discord.Guild) -> EnginePool:
+        engine = await self.config.guild(guild).engine()
+        if engine not in ENGINES:
+            engine = DEFAULT_ENGINE
+        return self.engine_pools.get(engine) or await self.start_engine_pool(engine)
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        """Buttons of a game that's still in storage restore it, and are then handled by its view."""
+        if interaction.type != discord.InteractionType.component or not interaction.data:
+            return
+        custom_id = str(interaction.data.get("custom_id", ""))
+        parts = custom_id.split()
+        if len(parts) != 3 or parts[0] != "simplechess" or not parts[1].isdigit():
+            return
+        channel = interaction.channel
+        if not isinstance(channel, (discord.TextChannel, discord.Thread)) or channel.id != int(parts[1]) \
+                or channel.id in self.games or channel.id not in self.saved_games:
+            return
+        game = await self.get_game(channel)
+        if not game or not game.view:
+            return
+        view = game.view
+        for item in view.children:
+            if isinstance(item, discord.ui.Button) and item.custom_id == custom_id:
+                # the same checks discord.py runs before the callback of a view it's listening to
+                try:
+                    if await item.interaction_check(interaction) and await view.interaction_check(interaction):
+                        await item.callback(interaction)
+                except Exception as error:
+                    await view.on_error(interaction, error, item)
+                return
 
     async def is_economy_enabled(self, guild: discord.Guild) -> bool:
         economy = self.bot.get_cog("Economy")
@@ -97,8 +246,8 @@ class SimpleChess(BaseChessCog):
             bet = await self.payout(ctx.guild)
 
         # Game already exists
-        if ctx.channel.id in self.games and not self.games[ctx.channel.id].is_finished():
-            old_game = self.games[ctx.channel.id]
+        old_game = await self.get_game(ctx.channel)
+        if old_game and not old_game.is_finished():
             try:
                 old_message = await ctx.channel.fetch_message(old_game.message.id) if old_game.message else None # re-fetch
             except discord.NotFound:
@@ -156,8 +305,8 @@ class SimpleChess(BaseChessCog):
         if not opponent.bot or opponent == ctx.guild.me:
             return await ctx.send("Opponent must be a bot different from myself.")
         
-        if ctx.channel.id in self.games and not self.games[ctx.channel.id].is_finished():
-            old_game = self.games[ctx.channel.id]
+        old_game = await self.get_game(ctx.channel)
+        if old_game and not old_game.is_finished():
             try:
                 old_message = await ctx.channel.fetch_message(old_game.message.id) if old_game.message else None # re-fetch
             except discord.NotFound:
@@ -250,3 +399,125 @@ class SimpleChess(BaseChessCog):
             return await ctx.send("Payout must be a positive number or 0.")
         await config_payout.set(payout)
         await ctx.send(f"New payout for Chess is {payout} {currency}.")
+
+    @setchess.command(name="engine")
+    async def setchess_engine(self, ctx: commands.Context, engine: Optional[str]):
+        """
+        Show or set the engine the bot plays with in this server.
+        `sunfish` is the classic engine. `bitboard` searches several times faster, so it sees further in the same time.
+        """
+        assert ctx.guild
+        if engine is None:
+            current = await self.config.guild(ctx.guild).engine()
+            return await ctx.send(f"The bot plays with the {current} engine. Available engines: {', '.join(ENGINES)}")
+        engine = engine.lower()
+        if engine not in ENGINES:
+            return await ctx.send(f"Unknown engine. Available engines: {', '.join(ENGINES)}")
+        await self.config.guild(ctx.guild).engine.set(engine)
+        await self.start_engine_pool(engine)
+        await ctx.send(f"The bot will now play with the {engine} engine.")
+
+    @setchess.command(name="engines")
+    @commands.is_owner()
+    async def setchess_engines(self, ctx: commands.Context, workers: Optional[int]):
+        """Show the engine pools, or set how many processes each engine runs at once, so that bot games don't have to wait for each other."""
+        if workers is None:
+            lines = []
+            for name, pool in self.engine_pools.items():
+                lines.append(f"**{name}** processes: {len(pool.workers)}, games waiting for a move: {pool.queue_depth}")
+                lines.append(f"Moves: {pool.moves}, latency: {pool.average_latency:.2f}s average, {pool.max_latency:.2f}s max, restarts: {pool.respawns}")
+                for worker in pool.workers:
+                    lines.append(f"`#{worker.index}` {'alive' if worker.alive else 'dead'}, games: {len(worker.games)}, "
+                                 f"waiting: {worker.waiting}, moves: {worker.moves}, latency: {worker.average_latency:.2f}s")
+            lines.append(f"Thinking time in the last minute: {self.think_time.used:.1f}s of a budget of {self.think_time.budget:.0f}s")
+            return await ctx.send("\n".join(lines))
+        if workers < 1 or workers > 16:
+            return await ctx.send("The number of engine processes must be between 1 and 16.")
+        await self.config.engine_workers.set(workers)
+        for pool in self.engine_pools.values():
+            await pool.resize(workers)
+        await ctx.send(f"Now using {workers} processes per engine.")
+
+    @setchess.command(name="budget")
+    @commands.is_owner()
+    async def setchess_budget(self, ctx: commands.Context, seconds: Optional[int]):
+        """
+        Show or set how many seconds the engines may think in total per minute, across all games.
+        No move gets more than what's left of the budget, and games between bots think less once most of it is used.
+        """
+        if seconds is None:
+            return await ctx.send(f"The engines may think for {self.think_time.budget:.0f} seconds per minute. "
+                                  f"Used in the last minute: {self.think_time.used:.1f} seconds.")
+        if seconds < 1:
+            return await ctx.send("The budget must be at least 1 second per minute.")
+        self.think_time.budget = seconds
+        await self.config.engine_budget.set(seconds)
+        await ctx.send(f"The engines may now think for {seconds} seconds per minute.")
+
+    @setchess.command(name="expiry", aliases=["expire"])
+    @commands.is_owner()
+    async def setchess_expiry(self, ctx: commands.Context, days: Optional[int]):
+        """Show or set after how many days without moves a game is cancelled, returning any bets."""
+        if days is None:
+            days = await self.config.expire_days()
+            return await ctx.send(f"Games are cancelled after {days} days without moves. {len(self.saved_games)} games are in storage.")
+        if days < 1:
+            return await ctx.send("Games must last at least 1 day.")
+        await self.config.expire_days.set(days)
+        await ctx.send(f"Games will be cancelled after {days} days without moves.")
+
+    @setchess.group(name="book", invoke_without_command=True)
+    @commands.is_owner()
+    async def setchess_book(self, ctx: commands.Context, path: Optional[str]):
+        """
+        Show or set the opening book used by the bot, a Polyglot .bin file.
+        Give the path to the file in the host machine, or attach the file to the command.
+        Book moves are instant and varied, and the engine takes over once the game leaves the book.
+        """
+        if path is None and not ctx.message.attachments:
+            book_path = await self.config.book_path()
+            if not book_path:
+                return await ctx.send("No opening book is set. The engine plays every move.")
+            return await ctx.send(f"Opening book: `{book_path}`, used for the first {self.book_depth} moves.")
+        if ctx.message.attachments:
+            attachment = ctx.message.attachments[0]
+            if not attachment.filename.lower().endswith(".bin"):
+                return await ctx.send("The opening book must be a Polyglot .bin file.")
+            book_path = str(cog_data_path(self) / "book.bin")
+            if self.opening_book:
+                self.opening_book.close()
+                self.opening_book = None
+            await attachment.save(book_path)  # type: ignore
+        else:
+            book_path = str(path)
+        try:
+            book = chess.polyglot.open_reader(book_path)
+            book.find(chess.Board())
+        except IndexError:
+            book.close()
+            return await ctx.send("That opening book has no moves for the starting position.")
+        except (OSError, ValueError):
+            return await ctx.send("Couldn't read that file as an opening book.")
+        if self.opening_book:
+            self.opening_book.close()
+        self.opening_book = book
+        await self.config.book_path.set(book_path)
+        await ctx.send(f"Opening book set, with {len(book)} entries.")
+
+    @setchess_book.command(name="depth")
+    async def setchess_book_depth(self, ctx: commands.Context, moves: int):
+        """Set for how many moves the opening book may be used."""
+        if moves < 1 or moves > 50:
+            return await ctx.send("The book depth must be between 1 and 50 moves.")
+        self.book_depth = moves
+        await self.config.book_depth.set(moves)
+        await ctx.send(f"The opening book will be used for the first {moves} moves.")
+
+    @setchess_book.command(name="clear", aliases=["remove", "none"])
+    async def setchess_book_clear(self, ctx: commands.Context):
+        """Stop using an opening book."""
+        if self.opening_book:
+            self.opening_book.close()
+            self.opening_book = None
+        await self.config.book_path.clear()
+        await ctx.send("The engine will play every move.")
@@ -0,0 +1,63 @@
+import time
+import chess
+import chess.engine
+from collections import deque
+from typing import Deque, Tuple
+
+MIN_THINK_TIME = 0.1  # seconds
+BUDGET_WINDOW = 60  # seconds
+OPENING_MOVES = 10
+ENDGAME_MATERIAL = 13  # non-pawn material of both sides, counting minor pieces as 3, rooks as 5, queens as 9
+FEW_MOVES = 10  # legal moves
+
+PIECE_VALUES = {chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+
+
+class ThinkTimeScheduler:
+    """
+    Decides how long the engine may think about each move.
+    Positions that are easy, games waiting behind other games, and games between bots get less time,
+    and the total time the engines spend thinking is kept under a budget per minute.
+    The budget is a hard cap: a move never gets more than what's left of it, apart from the minimum think time.
+    """
+
+    def __init__(self, budget: float = 30.0):
+        self.budget = budget  # engine seconds per minute, shared by all games
+        self._spent: Deque[Tuple[float, float]] = deque()
+
+    @property
+    def used(self) -> float:
+        """Engine seconds spent in the last minute."""
+        cutoff = time.monotonic() - BUDGET_WINDOW
+        while self._spent and self._spent[0][0] < cutoff:
+            self._spent.popleft()
+        return sum(seconds for _, seconds in self._spent)
+
+    def record(self, seconds: float) -> None:
+        """Time an engine spent on a move, not counting the wait for it."""
+        self._spent.append((time.monotonic(), seconds))
+
+    def limit(self, board: chess.Board, base: chess.engine.Limit, queue_depth: int = 0, spectator: bool = False) -> chess.engine.Limit:
+        """The limit for one engine move. The base limit's time is the most a move can get, and its depth is kept."""
+        think_time = base.time or 1.0
+        think_time *= self.position_factor(board)
+        think_time /= 1 + queue_depth
+        remaining = self.budget - self.used
+        if spectator and remaining <= self.budget * 0.25:
+            think_time /= 2
+        think_time = min(think_time, remaining)
+        return chess.engine.Limit(time=max(MIN_THINK_TIME, min(think_time, base.time or 1.0)), depth=base.depth)
+
+    @staticmethod
+    def position_factor(board: chess.Board) -> float:
+        """How much of the full time a position deserves, by game phase and number of choices."""
+        factor = 1.0
+        if board.fullmove_number <= OPENING_MOVES:
+            factor *= 0.5 + 0.5 * board.fullmove_number / OPENING_MOVES
+        material = sum(value * len(board.pieces(piece, color))
+                       for piece, value in PIECE_VALUES.items() for color in chess.COLORS)
+        if material <= ENDGAME_MATERIAL:
+            factor *= 0.7
+        if board.legal_moves.count() <= FEW_MOVES:
+            factor *= 0.6
+        return factor
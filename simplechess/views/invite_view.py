@@ -14,8 +14,8 @@ class InviteView(discord.ui.View):
         self.game = game
         currency_name = re.sub(r"<a?:(\w+):\d+>", r"\1", currency_name)  # extract emoji name
         label = "Accept" if game.bet == 0 else f"Accept and bet {humanize_number(game.bet)} {currency_name}"[:MAX_BUTTON_LABEL]
-        accept_button = discord.ui.Button(label=label, style=discord.ButtonStyle.primary)
-        cancel_button = discord.ui.Button(label="Cancel", style=discord.ButtonStyle.secondary)
+        accept_button = discord.ui.Button(custom_id=f"simplechess {game.channel.id} accept", label=label, style=discord.ButtonStyle.primary)
+        cancel_button = discord.ui.Button(custom_id=f"simplechess {game.channel.id} cancel", label="Cancel", style=discord.ButtonStyle.secondary)
         accept_button.callback = self.accept
         cancel_button.callback = self.cancel
         self.add_item(accept_button)